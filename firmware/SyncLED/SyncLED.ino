@@ -2,22 +2,115 @@
 #define NUM_LEDS 96
 #define DATA_PIN 5
 #define LED_BRIGHTNESS 255
+#define DEFAULT_BAUD 115200
+#define RX_BUFFER 2048  // room for the host's frames in flight while FastLED.show() runs
 CRGB leds[NUM_LEDS];
 uint8_t payload[NUM_LEDS * 3];
-enum State {H1, H2, FRAME, PAYLOAD, CHKS};
+uint8_t shown[NUM_LEDS * 3];  // last applied frame, the base for 0x58 deltas
+enum State {H1, H2, FRAME, PAYLOAD, CHKS, CHK2, DBASE, DCOUNT, DRANGE, DDATA, BAUD, PLEN, PDATA, LATCH};
 State st = H1;
+uint8_t frame_type = 0;  // second header byte of the packet being parsed
+bool is_delta = false;   // 0x58 or 0x5C
+bool crc_mode = false;   // 0x5B/0x5C: CRC-16 trailer instead of the byte sum
+uint16_t crc = 0;
+uint8_t crc_lo = 0;
 uint8_t frame_id = 0;
 int payload_index = 0;
 uint8_t rx_frame_id = 0;
+bool have_base = false;
+uint8_t base_id = 0;
+// 0x5E latch: while holding, accepted frames wait in `shown` for a show
+const uint8_t LATCH_SHOW = 0, LATCH_HOLD = 1, LATCH_RELEASE = 2;
+bool hold = false;
+bool staged = false;  // accepted but not shown yet
+// delta parse state
+bool delta_ok = false;
+uint8_t dsum = 0;
+uint8_t ranges_left = 0;
+uint8_t range_hdr[3];
+int range_hdr_idx = 0;
+int range_bytes_left = 0;
+// link speed: 0x59 switches rate, 0x5A probes verify it
+const uint32_t BAUD_RATES[] = {115200, 230400, 460800, 921600, 1000000, 1500000, 2000000};
+const unsigned long LINK_TRIAL_MS = 1000;  // revert unless a probe arrives at the new rate
+const unsigned long LINK_IDLE_MS = 5000;   // revert after this long without a valid packet
+uint32_t link_baud = DEFAULT_BAUD;
+bool link_trial = false;
+unsigned long link_changed = 0;
+unsigned long last_valid = 0;
+uint8_t probe_len = 0;
 unsigned long last_byte_time = 0;
 const unsigned long BYTE_TIMEOUT_MS = 200;
 
 void setup() {
-  Serial.begin(115200);
+  Serial.setRxBufferSize(RX_BUFFER);  // before begin(); the default 256 bytes overflow during a show
+  Serial.begin(DEFAULT_BAUD);
   FastLED.addLeds<WS2812B, DATA_PIN, GRB>(leds, NUM_LEDS);
   FastLED.setBrightness(LED_BRIGHTNESS);
   FastLED.show();
-}   
+}
+
+// CRC-16/CCITT-FALSE, one byte at a time
+uint16_t crc16(uint16_t c, uint8_t b) {
+  c ^= (uint16_t)b << 8;
+  for (int i = 0; i < 8; ++i) c = (c & 0x8000) ? (c << 1) ^ 0x1021 : c << 1;
+  return c;
+}
+
+void setBaud(uint32_t rate) {
+  Serial.flush();
+  Serial.updateBaudRate(rate);
+  link_baud = rate;
+  link_changed = millis();
+  last_valid = link_changed;
+}
+
+bool baudSupported(uint32_t rate) {
+  for (unsigned i = 0; i < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]); ++i)
+    if (BAUD_RATES[i] == rate) return true;
+  return false;
+}
+
+// replies that carry an id go out framed as AA kind id chk (chk = kind + id),
+// so a host that lost a byte finds the next reply instead of misreading ids
+void reply(uint8_t kind, uint8_t id) {
+  uint8_t r[4] = {0xAA, kind, id, (uint8_t)(kind + id)};
+  Serial.write(r, 4);
+}
+
+void showFrame() {
+  for (int i = 0; i < NUM_LEDS; ++i) {
+    int j = i * 3;
+    leds[i] = CRGB(shown[j], shown[j + 1], shown[j + 2]);
+  }
+  staged = false;
+  FastLED.show();
+}
+
+void applyPayload() {
+  memcpy(shown, payload, sizeof(shown));
+  base_id = rx_frame_id;
+  have_base = true;
+  staged = true;
+  if (!hold) showFrame();
+}
+
+bool applyLatch(uint8_t op, uint8_t id) {
+  // a show needs the frame it names to be the last accepted one
+  if (op > LATCH_RELEASE || (op == LATCH_SHOW && !(have_base && base_id == id))) return false;
+  if (op == LATCH_HOLD) {
+    hold = true;
+  } else {
+    if (op == LATCH_RELEASE) hold = false;
+    if (staged || op == LATCH_SHOW) showFrame();
+  }
+  return true;
+}
+
+void nextRange() {
+  if (--ranges_left == 0) st = CHKS;
+  else { range_hdr_idx = 0; st = DRANGE; }
+}
 
 void loop() {
   while (Serial.available()) {
@@ -29,28 +122,120 @@ void loop() {
       if (ub == 0xAA) st = H2;
       else st = H1;
     } else if (st == H2) {
-      if (ub == 0x55) st = FRAME;
+      frame_type = ub;
+      is_delta = (ub == 0x58 || ub == 0x5C);
+      crc_mode = (ub == 0x5B || ub == 0x5C);
+      if (ub == 0x55 || ub == 0x57 || ub == 0x58 || crc_mode) st = FRAME;
+      else if (ub == 0x59) { dsum = ub; payload_index = 0; st = BAUD; }
+      else if (ub == 0x5A) { dsum = ub; st = PLEN; }
+      else if (ub == 0x5E) { dsum = ub; payload_index = 0; st = LATCH; }
       else st = H1;
     } else if (st == FRAME) {
       rx_frame_id = ub;
       payload_index = 0;
-      st = PAYLOAD;
+      if (crc_mode) crc = crc16(0xFFFF, ub);
+      if (is_delta) { dsum = ub; st = DBASE; }
+      else st = PAYLOAD;
     } else if (st == PAYLOAD) {
+      if (crc_mode) crc = crc16(crc, ub);
       payload[payload_index++] = ub;
       if (payload_index >= NUM_LEDS * 3) st = CHKS;
-    } else if (st == CHKS) {
+    } else if (st == DBASE) {
+      // a delta only applies on top of the frame it was encoded against
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      delta_ok = have_base && ub == base_id;
+      memcpy(payload, shown, sizeof(payload));
+      st = DCOUNT;
+    } else if (st == DCOUNT) {
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      ranges_left = ub;
+      range_hdr_idx = 0;
+      st = ranges_left ? DRANGE : CHKS;
+    } else if (st == DRANGE) {
+      // range header: start (u16 little-endian), LED count
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      range_hdr[range_hdr_idx++] = ub;
+      if (range_hdr_idx == 3) {
+        payload_index = (range_hdr[0] | (range_hdr[1] << 8)) * 3;
+        range_bytes_left = range_hdr[2] * 3;
+        if (range_bytes_left) st = DDATA;
+        else nextRange();
+      }
+    } else if (st == DDATA) {
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      if (payload_index < NUM_LEDS * 3) payload[payload_index] = ub;
+      else delta_ok = false;
+      payload_index++;
+      if (--range_bytes_left == 0) nextRange();
+    } else if (st == BAUD) {
+      // requested rate, u32 little-endian
+      dsum += ub;
+      payload[payload_index++] = ub;
+      if (payload_index == 4) st = CHKS;
+    } else if (st == LATCH) {
+      // op, frame id
+      dsum += ub;
+      payload[payload_index++] = ub;
+      if (payload_index == 2) st = CHKS;
+    } else if (st == PLEN) {
+      probe_len = ub;
+      payload_index = 0;
+      st = probe_len ? PDATA : CHKS;
+    } else if (st == PDATA) {
+      dsum += ub;
+      if (++payload_index >= probe_len) st = CHKS;
+    } else if (st == CHKS && crc_mode) {
+      // CRC-16 trailer, low byte first
+      crc_lo = ub;
+      st = CHK2;
+    } else if (st == CHKS || st == CHK2) {
       uint8_t chk = ub;
-      uint16_t s = rx_frame_id;
-      for (int i = 0; i < NUM_LEDS * 3; ++i) s += payload[i];
-      if (((uint8_t)s) == chk) {
-        for (int i = 0; i < NUM_LEDS; ++i) {
-          int j = i * 3;
-          leds[i] = CRGB(payload[j], payload[j + 1], payload[j + 2]);
+      if (frame_type == 0x59) {
+        uint32_t rate = payload[0] | ((uint32_t)payload[1] << 8) | ((uint32_t)payload[2] << 16) | ((uint32_t)payload[3] << 24);
+        if (dsum == chk && baudSupported(rate)) {
+          Serial.write('B');
+          setBaud(rate);
+          link_trial = rate != DEFAULT_BAUD;
+        } else {
+          Serial.write('b');
+        }
+      } else if (frame_type == 0x5E) {
+        if (dsum == chk && applyLatch(payload[0], payload[1])) {
+          last_valid = millis();
+          reply('L', payload[1]);
+        } else {
+          reply('l', payload[1]);
+        }
+      } else if (frame_type == 0x5A) {
+        if (dsum == chk) {
+          link_trial = false;
+          last_valid = millis();
+          Serial.write('P');
+        } else {
+          Serial.write('p');
         }
-        FastLED.show();
-        Serial.write('A');
       } else {
-        Serial.write('N');
+        bool ok;
+        if (crc_mode) {
+          ok = crc == (uint16_t)(crc_lo | (chk << 8));
+          if (is_delta) ok = ok && delta_ok;
+        } else if (is_delta) {
+          ok = delta_ok && dsum == chk;
+        } else {
+          uint16_t s = rx_frame_id;
+          for (int i = 0; i < NUM_LEDS * 3; ++i) s += payload[i];
+          ok = ((uint8_t)s) == chk;
+        }
+        if (ok) {
+          applyPayload();
+          last_valid = millis();
+        }
+        if (frame_type == 0x55) Serial.write(ok ? 'A' : 'N');
+        else reply(ok ? 'A' : 'N', rx_frame_id);
       }
       st = H1;
     }
@@ -58,4 +243,17 @@ void loop() {
   if (st != H1 && (millis() - last_byte_time) > BYTE_TIMEOUT_MS) {
     st = H1;
   }
+  // a host that went away must not leave the strip frozen
+  if (hold && millis() - last_valid > LINK_IDLE_MS) {
+    hold = false;
+    if (staged) showFrame();
+  }
+  // an unconfirmed or silent fast link drops back to the default rate
+  if (link_baud != DEFAULT_BAUD) {
+    unsigned long now = millis();
+    if ((link_trial && now - link_changed > LINK_TRIAL_MS) || now - last_valid > LINK_IDLE_MS) {
+      setBaud(DEFAULT_BAUD);
+      link_trial = false;
+    }
+  }
 }
@@ -0,0 +1,207 @@
+"""
+Audio spectrum to per-LED levels.
+BandMapper precomputes, once per sample rate and block size, the Hann window
+and a (bins, bands) matrix of triangular filters on a log or mel frequency
+axis, so each audio block costs one windowed rfft and one matrix multiply.
+Bands narrower than an FFT bin (the low end of a long strip) fall back to the
+nearest bin instead of coming out silent.
+AudioAnalyzer keeps all of that off the real-time thread: the stream callback
+only copies samples into a preallocated single-producer ring (no locks, just
+monotonic counters), a worker runs overlapping STFT frames every `hop`
+samples, and readers take the newest levels from a double buffer. A worker
+that falls more than the ring's length behind has lost samples and counts an
+overrun; latest() retries its copy if a publish started meanwhile.
+"""
+
+import threading, time
+from collections import deque
+import numpy as np
+
+SAMPLERATE = 44100
+BLOCKSIZE = 1024
+FFT_SIZE = 2048
+FRAME = 1024  # STFT frame analysed by the worker
+HOP = 256
+
+def hz_to_mel(f):
+    return 2595.0 * np.log10(1.0 + np.asarray(f, dtype=np.float64) / 700.0)
+
+def mel_to_hz(m):
+    return 700.0 * (10.0 ** (np.asarray(m, dtype=np.float64) / 2595.0) - 1.0)
+
+def band_edges(bands, fmin, fmax, scale='log'):
+    # bands + 2 frequencies: band k spans edges[k]..edges[k+2], peaking at edges[k+1]
+    if scale == 'mel':
+        return mel_to_hz(np.linspace(hz_to_mel(fmin), hz_to_mel(fmax), bands + 2))
+    if scale == 'log':
+        return np.geomspace(fmin, fmax, bands + 2)
+    if scale == 'linear':
+        return np.linspace(fmin, fmax, bands + 2)
+    raise ValueError("scale must be 'log', 'mel' or 'linear'")
+
+def band_matrix(bands, samplerate=SAMPLERATE, fft_size=FFT_SIZE, fmin=40.0, fmax=16000.0, scale='log'):
+    # (fft_size//2+1, bands) float32, every column sums to 1 so a band is the
+    # weighted mean magnitude of its bins
+    freqs = np.fft.rfftfreq(fft_size, 1.0 / samplerate)
+    edges = band_edges(bands, fmin, min(fmax, samplerate / 2.0), scale)
+    lo, mid, hi = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    up = (freqs - lo) / np.maximum(mid - lo, 1e-9)
+    down = (hi - freqs) / np.maximum(hi - mid, 1e-9)
+    w = np.clip(np.minimum(up, down), 0.0, None)
+    empty = w.sum(axis=1) == 0
+    w[empty, np.abs(freqs[None, :] - mid[empty]).argmin(axis=1)] = 1.0
+    w /= w.sum(axis=1, keepdims=True)
+    return np.ascontiguousarray(w.T, dtype=np.float32)
+
+class BandMapper:
+    def __init__(self, bands, samplerate=SAMPLERATE, blocksize=BLOCKSIZE, fft_size=FFT_SIZE,
+                 fmin=40.0, fmax=16000.0, scale='log'):
+        self.bands = bands
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.fft_size = max(fft_size, blocksize)
+        self.window = np.hanning(blocksize).astype(np.float32)
+        self.matrix = band_matrix(bands, samplerate, self.fft_size, fmin, fmax, scale)
+        self._buf = np.zeros(blocksize, dtype=np.float32)
+        self._mags = np.zeros(self.fft_size // 2 + 1, dtype=np.float32)
+        self._levels = np.zeros(bands, dtype=np.float32)
+
+    def levels(self, block):
+        # (frames,) or (frames, channels) samples -> (bands,) levels, loudest band = 1
+        mono = block.mean(axis=1) if block.ndim > 1 and block.shape[1] > 1 else block.reshape(-1)
+        if len(mono) != self.blocksize:
+            # odd-sized block (stream restart, last block): pad or trim
+            self._buf[:] = 0.0
+            n = min(len(mono), self.blocksize)
+            self._buf[:n] = mono[:n]
+            mono = self._buf
+        np.multiply(mono, self.window, out=self._buf)
+        np.abs(np.fft.rfft(self._buf, n=self.fft_size), out=self._mags, casting='unsafe')
+        e = np.matmul(self._mags, self.matrix, out=self._levels)
+        peak = e.max()
+        out = e / peak if peak >= 1e-9 else np.zeros_like(e)
+        return out
+
+class SampleRing:
+    # one writer (the audio callback) and one reader (the worker); `written`
+    # only ever grows and is published after the samples, so the reader never
+    # sees a half-written block without taking a lock
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+    def push(self, samples):
+        n = len(samples)
+        if n > self.capacity:
+            samples, n = samples[-self.capacity:], self.capacity
+        i = self.written % self.capacity
+        k = min(n, self.capacity - i)
+        self.data[i:i + k] = samples[:k]
+        if k < n:
+            self.data[:n - k] = samples[k:]
+        self.written += n
+
+    def read(self, end, out):
+        # the len(out) samples ending at absolute position `end`
+        n = len(out)
+        i = (end - n) % self.capacity
+        k = min(n, self.capacity - i)
+        out[:k] = self.data[i:i + k]
+        if k < n:
+            out[k:] = self.data[:n - k]
+        return out
+
+class AudioAnalyzer:
+    def __init__(self, bands, samplerate=SAMPLERATE, frame=FRAME, hop=HOP, fft_size=FFT_SIZE, scale='log'):
+        self.samplerate = samplerate
+        self.hop = hop
+        self.mapper = BandMapper(bands, samplerate, frame, fft_size, scale=scale)
+        # a quarter second of slack before the worker counts an overrun
+        self.ring = SampleRing(max(4 * frame, samplerate // 4))
+        self._frame = np.zeros(frame, dtype=np.float32)
+        self._bufs = [np.zeros(bands, dtype=np.float32), np.zeros(bands, dtype=np.float32)]
+        self._front = 0
+        self._seq = 0  # publishes started
+        self._pushes = deque(maxlen=256)
+        self.xruns = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.frames = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.running = False
+        self.worker = None
+
+    def callback(self, indata, frames, time_info, status):
+        # sounddevice InputStream callback: copy and count, nothing else
+        if status:
+            self.xruns += 1
+        self.ring.push(indata[:, 0] if indata.ndim > 1 else indata)
+        self._pushes.append((self.ring.written, time.perf_counter()))
+
+    def start(self):
+        self.running = True
+        self.worker = threading.Thread(target=self._run, name="audio", daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        self.running = False
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join(1.0)
+        self.worker = None
+        for b in self._bufs:
+            b[:] = 0.0
+
+    def _run(self):
+        frame = len(self._frame)
+        nxt = frame
+        while self.running:
+            written = self.ring.written
+            if written < nxt:
+                time.sleep(self.hop / self.samplerate / 2)
+                continue
+            # only the newest spectrum is ever shown, so when a block brings several
+            # hops at once (or the worker fell behind) jump to the newest one
+            if written - nxt > self.ring.capacity - frame:
+                # the callback wrapped past samples the worker never analysed
+                self.overruns += 1
+            behind = (written - nxt) // self.hop
+            if behind:
+                self.skipped += behind
+                nxt += behind * self.hop
+            self.ring.read(nxt, self._frame)
+            if self.ring.written - (nxt - frame) > self.ring.capacity:
+                # overwritten while it was copied: drop the torn frame
+                self.overruns += 1
+                continue
+            self.publish(self.mapper.levels(self._frame), nxt)
+            nxt += self.hop
+
+    def publish(self, levels, end):
+        self._seq += 1
+        back = 1 - self._front
+        self._bufs[back][:] = levels
+        self._front = back
+        self.frames += 1
+        # analysis latency: from the callback that delivered sample `end` to now
+        for n, t in list(self._pushes):
+            if n >= end:
+                lat = time.perf_counter() - t
+                self.latency = lat if not self.latency else self.latency * 0.95 + lat * 0.05
+                self.latency_max = max(self.latency_max, lat)
+                break
+
+    def latest(self):
+        # two publishes during the copy would overwrite the buffer being
+        # copied, so copy again whenever one started
+        while True:
+            seq = self._seq
+            out = self._bufs[self._front].copy()
+            if self._seq == seq:
+                return out
+
+    def stats(self):
+        return {"frames": self.frames, "xruns": self.xruns, "overruns": self.overruns, "skipped": self.skipped,
+                "latency_ms": self.latency * 1000.0, "latency_max_ms": self.latency_max * 1000.0,
+                "hop_ms": self.hop * 1000.0 / self.samplerate}
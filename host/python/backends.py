@@ -0,0 +1,316 @@
+"""
+Capture backends: where screen pixels come from.
+Every backend behaves like an mss instance, which is all capture.py uses:
+`monitors` (0 = all, 1 = primary), grab(region) -> shot with BGRA `raw`,
+`width` and `height`, and close(). Any backend therefore works with both band
+and full capture.
+- mss: the mss package (Windows, macOS, X11)
+- xshm: X11 MIT-SHM through ctypes. One shared-memory XImage per region size
+  is attached once and reused, and grab() returns a view of it, so there is
+  no per-grab buffer or copy. Only valid until the next grab of that size.
+  Xlib is put in thread mode before the first display opens and X errors
+  are kept per display, so screens on different threads stay apart.
+- synthetic: a scrolling gradient, no display needed; input is the number
+  of side-by-side monitors (default 1)
+- video: a video file or image sequence (cv2.VideoCapture), looped
+open_backend(name) builds one. select_backend() times a few band or full
+grabs on every live backend that opens and keeps the fastest, which is what
+'auto' does at startup. register() adds a backend.
+Like mss, a backend belongs to the thread that opened it.
+"""
+
+import ctypes, ctypes.util, sys, threading, time
+import numpy as np
+
+class SyntheticShot:
+    def __init__(self, img):
+        self.height, self.width = img.shape[:2]
+        self.raw = bytearray(img.tobytes())
+        self.img = np.frombuffer(self.raw, dtype=np.uint8).reshape(img.shape)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.img
+
+class SyntheticScreen:
+    # stands in for mss: smooth BGRA gradients at any monitor size, `count`
+    # w x h monitors side by side; shots are built once per region so
+    # grabbing allocates nothing
+    def __init__(self, w, h, count=1):
+        self.shots = {}
+        W = w * count
+        yy, xx = np.mgrid[0:h, 0:W]
+        self.img = np.dstack([xx * 255 // max(1, W - 1), yy * 255 // max(1, h - 1),
+                              (xx + yy) * 255 // max(1, W + h - 2), np.full_like(xx, 255)]).astype(np.uint8)
+        self.monitors = [{"left": 0, "top": 0, "width": W, "height": h}]
+        self.monitors += [{"left": i * w, "top": 0, "width": w, "height": h} for i in range(count)]
+
+    def grab(self, m):
+        key = (m["left"], m["top"], m["width"], m["height"])
+        if key not in self.shots:
+            self.shots[key] = SyntheticShot(self.img[m["top"]:m["top"] + m["height"], m["left"]:m["left"] + m["width"]])
+        return self.shots[key]
+
+    def close(self):
+        pass
+
+class MovingScreen(SyntheticScreen):
+    # mss stand-in whose gradient scrolls sideways, so sampling, smoothing and
+    # deltas see motion; like mss, every grab copies its region out
+    def __init__(self, w, h, speed=400.0, count=1):
+        super().__init__(w, h, count)
+        self.wide = np.concatenate((self.img, self.img), axis=1)
+        self.w = w * count
+        self.speed = speed
+        self.t0 = time.perf_counter()
+
+    def grab(self, m):
+        dx = int((time.perf_counter() - self.t0) * self.speed) % self.w
+        x = m["left"] + dx
+        return SyntheticShot(self.wide[m["top"]:m["top"] + m["height"], x:x + m["width"]])
+
+class RecordedScreen:
+    # mss stand-in playing back a video or image sequence (anything
+    # cv2.VideoCapture opens), decoded up front and looped at its frame rate
+    def __init__(self, path, max_frames=60, size=None):
+        import cv2
+        vc = cv2.VideoCapture(path)
+        self.fps = vc.get(cv2.CAP_PROP_FPS) or 30.0
+        frames = []
+        while len(frames) < max_frames:
+            ok, f = vc.read()
+            if not ok:
+                break
+            if size:
+                f = cv2.resize(f, tuple(size), interpolation=cv2.INTER_AREA)
+            frames.append(cv2.cvtColor(f, cv2.COLOR_BGR2BGRA))
+        vc.release()
+        if not frames:
+            raise ValueError(f"no frames in {path}")
+        self.frames = np.stack(frames)
+        h, w = self.frames.shape[1:3]
+        m = {"left": 0, "top": 0, "width": w, "height": h}
+        self.monitors = [m, dict(m)]
+        self.t0 = time.perf_counter()
+
+    def grab(self, m):
+        i = int((time.perf_counter() - self.t0) * self.fps) % len(self.frames)
+        return SyntheticShot(self.frames[i, m["top"]:m["top"] + m["height"], m["left"]:m["left"] + m["width"]])
+
+    def close(self):
+        pass
+
+class XImage(ctypes.Structure):
+    _fields_ = [("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int), ("format", ctypes.c_int),
+                ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int), ("bitmap_unit", ctypes.c_int),
+                ("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int), ("depth", ctypes.c_int),
+                ("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int), ("red_mask", ctypes.c_ulong),
+                ("green_mask", ctypes.c_ulong), ("blue_mask", ctypes.c_ulong), ("obdata", ctypes.c_void_p),
+                ("f", ctypes.c_void_p * 6)]
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int), ("shmaddr", ctypes.c_void_p), ("readOnly", ctypes.c_int)]
+
+ZPIXMAP = 2
+ALL_PLANES = 0xFFFFFFFF
+IPC_PRIVATE, IPC_CREAT, IPC_RMID = 0, 0o1000, 0
+# the handler is process-wide, so errors are counted per Display* and each screen only sees its own
+_X_ERRORS = {}
+# the default Xlib handler exits the process on any X error
+_X_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)(
+    lambda d, e: _X_ERRORS.__setitem__(d, _X_ERRORS.get(d, 0) + 1) or 0)
+_X_LOCK = threading.Lock()
+_X_THREADS = []
+
+def _libs():
+    names = [ctypes.util.find_library(n) for n in ("X11", "Xext")]
+    if sys.platform in ("win32", "darwin") or not all(names):
+        raise OSError("xshm needs libX11 and libXext")
+    x11, xext, libc = ctypes.CDLL(names[0]), ctypes.CDLL(names[1]), ctypes.CDLL(None, use_errno=True)
+    vp, ul = ctypes.c_void_p, ctypes.c_ulong
+    for lib, fn, res, args in (
+            (x11, "XOpenDisplay", vp, [ctypes.c_char_p]), (x11, "XCloseDisplay", ctypes.c_int, [vp]),
+            (x11, "XDefaultScreen", ctypes.c_int, [vp]), (x11, "XRootWindow", ul, [vp, ctypes.c_int]),
+            (x11, "XDefaultVisual", vp, [vp, ctypes.c_int]), (x11, "XDefaultDepth", ctypes.c_int, [vp, ctypes.c_int]),
+            (x11, "XDisplayWidth", ctypes.c_int, [vp, ctypes.c_int]), (x11, "XDisplayHeight", ctypes.c_int, [vp, ctypes.c_int]),
+            (x11, "XSync", ctypes.c_int, [vp, ctypes.c_int]), (x11, "XFree", ctypes.c_int, [vp]),
+            (x11, "XSetErrorHandler", vp, [vp]), (x11, "XInitThreads", ctypes.c_int, []),
+            (xext, "XShmQueryExtension", ctypes.c_int, [vp]),
+            (xext, "XShmCreateImage", ctypes.POINTER(XImage), [vp, vp, ctypes.c_uint, ctypes.c_int, vp, vp, ctypes.c_uint, ctypes.c_uint]),
+            (xext, "XShmAttach", ctypes.c_int, [vp, vp]), (xext, "XShmDetach", ctypes.c_int, [vp, vp]),
+            (xext, "XShmGetImage", ctypes.c_int, [vp, ul, ctypes.POINTER(XImage), ctypes.c_int, ctypes.c_int, ul]),
+            (libc, "shmget", ctypes.c_int, [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]),
+            (libc, "shmat", vp, [ctypes.c_int, vp, ctypes.c_int]), (libc, "shmdt", ctypes.c_int, [vp]),
+            (libc, "shmctl", ctypes.c_int, [ctypes.c_int, ctypes.c_int, vp])):
+        f = getattr(lib, fn)
+        f.restype, f.argtypes = res, args
+    # screens live on capture worker threads: Xlib has to be made thread-safe before its first display opens
+    with _X_LOCK:
+        if not _X_THREADS:
+            _X_THREADS.append(x11.XInitThreads())
+    return x11, xext, libc
+
+class XShmShot:
+    def __init__(self, raw, width, height):
+        self.raw = raw
+        self.width = width
+        self.height = height
+
+class XShmScreen:
+    def __init__(self, display=None):
+        self.x11, self.xext, self.libc = _libs()
+        self.images = {}
+        self.d = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.d:
+            raise OSError("cannot open the X display")
+        if not self.xext.XShmQueryExtension(self.d):
+            self.close()
+            raise OSError("X server has no MIT-SHM")
+        scr = self.x11.XDefaultScreen(self.d)
+        self.root = self.x11.XRootWindow(self.d, scr)
+        self.visual = self.x11.XDefaultVisual(self.d, scr)
+        self.depth = self.x11.XDefaultDepth(self.d, scr)
+        self.monitors = self._monitors(self.x11.XDisplayWidth(self.d, scr), self.x11.XDisplayHeight(self.d, scr))
+        # after mss, whose Xlib backend installs its own handler
+        self.x11.XSetErrorHandler(ctypes.cast(_X_HANDLER, ctypes.c_void_p))
+
+    def _monitors(self, w, h):
+        # monitor geometry comes from mss (XRandR) when it is there
+        try:
+            from mss import mss
+            with mss() as s:
+                return [dict(m) for m in s.monitors]
+        except Exception:
+            m = {"left": 0, "top": 0, "width": w, "height": h}
+            return [m, dict(m)]
+
+    def _check(self, what):
+        self.x11.XSync(self.d, 0)
+        if _X_ERRORS.pop(self.d, 0):
+            raise OSError(f"X error in {what}")
+
+    def _image(self, w, h):
+        info = XShmSegmentInfo()
+        img = self.xext.XShmCreateImage(self.d, self.visual, self.depth, ZPIXMAP, None, ctypes.byref(info), w, h)
+        if not img:
+            raise OSError("XShmCreateImage failed")
+        im = img.contents
+        if im.bits_per_pixel != 32 or im.bytes_per_line != w * 4:
+            self.x11.XFree(img)
+            raise OSError(f"unsupported {im.bits_per_pixel} bpp screen")
+        size = im.bytes_per_line * h
+        info.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            self.x11.XFree(img)
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        info.shmaddr = im.data = self.libc.shmat(info.shmid, None, 0)
+        info.readOnly = 0
+        if info.shmaddr in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(info.shmid, IPC_RMID, None)
+            self.x11.XFree(img)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        ok = self.xext.XShmAttach(self.d, ctypes.byref(info))
+        try:
+            self._check("XShmAttach")
+        except OSError:
+            ok = False
+        finally:
+            # marked for removal once the server holds it, freed when both sides detach
+            self.libc.shmctl(info.shmid, IPC_RMID, None)
+        if not ok:
+            self.libc.shmdt(info.shmaddr)
+            self.x11.XFree(img)
+            raise OSError("XShmAttach failed")
+        self.images[(w, h)] = entry = (img, info, XShmShot((ctypes.c_ubyte * size).from_address(info.shmaddr), w, h))
+        return entry
+
+    def grab(self, m):
+        w, h = m["width"], m["height"]
+        entry = self.images.get((w, h)) or self._image(w, h)
+        if not self.xext.XShmGetImage(self.d, self.root, entry[0], m["left"], m["top"], ALL_PLANES):
+            self._check("XShmGetImage")
+            raise OSError("XShmGetImage failed")
+        return entry[2]
+
+    def close(self):
+        if not self.d:
+            return
+        for img, info, _ in self.images.values():
+            self.xext.XShmDetach(self.d, ctypes.byref(info))
+        if self.images:
+            self.x11.XSync(self.d, 0)
+        for img, info, _ in self.images.values():
+            self.libc.shmdt(info.shmaddr)
+            self.x11.XFree(img)
+        self.images = {}
+        self.x11.XCloseDisplay(self.d)
+        _X_ERRORS.pop(self.d, None)
+        self.d = None
+
+def open_mss(input=None, size=None):
+    from mss import mss
+    return mss()
+
+def open_synthetic(input=None, size=None):
+    return MovingScreen(*(size or (1920, 1080)), count=int(input or 1))
+
+def open_video(input=None, size=None):
+    if not input:
+        raise ValueError("the video backend needs an input file")
+    return RecordedScreen(input, size=size)
+
+BACKENDS = {}
+LIVE = []
+
+def register(name, factory, live=False):
+    # factory(input, size) -> screen; 'auto' picks among the live ones
+    BACKENDS[name] = factory
+    if live and name not in LIVE:
+        LIVE.append(name)
+
+register("xshm", lambda input=None, size=None: XShmScreen(), live=True)
+register("mss", open_mss, live=True)
+register("synthetic", open_synthetic)
+register("video", open_video)
+
+def open_backend(name, input=None, size=None):
+    if name not in BACKENDS:
+        raise ValueError(f"unknown capture backend {name!r}, one of {', '.join(BACKENDS)}")
+    return BACKENDS[name](input, size)
+
+def time_backend(screen, mode, depth, res, frames=8, monitor=1):
+    # median ms per grab through the capture the host will actually run
+    from capture import open_capture
+    cap = open_capture(mode, screen, screen.monitors[monitor], depth, res)
+    cap.grab()
+    t = []
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        cap.grab()
+        t.append(time.perf_counter() - t0)
+    return float(np.median(t)) * 1000.0
+
+def select_backend(mode, depth, res, names=None, frames=8, monitor=1):
+    # -> (name, screen, {name: ms per grab or the error that ruled it out})
+    results = {}
+    best = None
+    for name in names or LIVE:
+        try:
+            screen = open_backend(name)
+        except Exception as e:
+            results[name] = str(e) or type(e).__name__
+            continue
+        try:
+            results[name] = ms = time_backend(screen, mode, depth, res, frames, monitor)
+        except Exception as e:
+            results[name] = str(e) or type(e).__name__
+            screen.close()
+            continue
+        if best is None or ms < best[2]:
+            if best:
+                best[1].close()
+            best = (name, screen, ms)
+        else:
+            screen.close()
+    if best is None:
+        raise OSError("no capture backend works here: " + "; ".join(f"{k}: {v}" for k, v in results.items()))
+    return best[0], best[1], results
@@ -0,0 +1,1259 @@
+"""
+Micro-benchmarks for the Python host hot paths.
+  python host/python/bench.py sampler --leds 96 300 1000
+  python host/python/bench.py capture --source live
+  python host/python/bench.py delta --input session.slr
+  python host/python/bench.py color --leds 96 1000
+  python host/python/bench.py smooth --source live --seconds 60
+  python host/python/bench.py idle --idle-fps 1 2 5
+  python host/python/bench.py audio --blocksize 256 512 1024
+  python host/python/bench.py stream --blocksize 64 128 256 --hop 256
+  python host/python/bench.py codec --leds 96 300 1000
+  python host/python/bench.py link --rates 115200 921600 2000000 --loss 0 0.001
+  python host/python/bench.py e2e --res 64 128 --leds 96 300 --modes delta full --json run.json
+  python host/python/bench.py record --frames 300
+  xvfb-run -s "-screen 0 1920x1080x24" python host/python/bench.py backends
+  python host/python/bench.py preview --fps 60 --preview-fps 10
+  python host/python/bench.py delta --source live --seconds 60
+  python host/python/bench.py telemetry --samples 200
+  python host/python/bench.py multimon --monitors 1 2 3 --frames 200
+  python host/python/bench.py group --leds 96 60 36 --rates 115200 2000000 2000000
+Benchmarks time things; correctness lives in tests/ (python -m pytest tests).
+The reference implementations here (loop_sample, legacy_grab, ...) are both
+the timing baselines and what the tests compare against.
+"""
+
+import argparse, colorsys, json, os, platform, subprocess, sys, time
+import numpy as np
+
+from layout import Layout
+from sampler import PerimeterSampler, SparseSampler, DEPTH
+from capture import FullFrameCapture, BandCapture, IdleThrottle, open_capture, bgra_view
+from color import to_float, to_uint8, audio_boost, enhance, EnhanceLUT, TemporalFilter, ChangeGate
+from audio import BandMapper, AudioAnalyzer
+from protocol import (WindowedSender, as_frame, encode_leds, encode_delta, encode_status, decode_frame, encode_telemetry,
+                      decode_telemetry, FrameEncoder, StreamDecoder, FT_LEDS_ID, FT_TELEMETRY, NET_UNIT)
+from record import FrameRecorder, Recording, ReplayCapture
+from telemetry import TelemetrySampler, SystemSource, FIELDS, PSUTIL_AVAILABLE, local_clock, mb_per_s
+from backends import SyntheticScreen, MovingScreen, RecordedScreen, BACKENDS, LIVE, open_backend, time_backend, select_backend, register
+from multimon import MultiMonitorCapture
+from devices import DeviceLink, DeviceGroup
+
+def split_counts(n):
+    # same proportions as the stock 31/17/31/17 layout
+    top = int(round(n * 31 / 96))
+    right = (n - 2 * top) // 2
+    return top, right, top, n - 2 * top - right
+
+def loop_sample(img, top, right, bottom, left, num_leds):
+    # reference: the per-LED loop the hosts used before sampler.py
+    h,w,_=img.shape
+    c=[]
+    sw=w/top
+    for i in range(top):
+        x0=int(i*sw); x1=int((i+1)*sw); y1=max(1,int(h*DEPTH))
+        b=img[0:y1,x0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; c.append(tuple(int(x) for x in a))
+    sh=h/right
+    for i in range(right):
+        y0=int(i*sh); y1=int((i+1)*sh); x0=max(0,w-int(w*DEPTH))
+        b=img[y0:y1,x0:w]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; c.append(tuple(int(x) for x in a))
+    sw=w/bottom
+    btm=[]
+    for i in range(bottom):
+        x0=int(i*sw); x1=int((i+1)*sw); y0=max(0,h-int(h*DEPTH))
+        b=img[y0:h,x0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; btm.append(tuple(int(x) for x in a))
+    btm.reverse(); c+=btm
+    sh=h/left
+    lft=[]
+    for i in range(left):
+        y0=int(i*sh); y1=int((i+1)*sh); x1=min(int(w*DEPTH),w)
+        b=img[y0:y1,0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; lft.append(tuple(int(x) for x in a))
+    lft.reverse(); c+=lft
+    if len(c)<num_leds: c+=[(0,0,0)]*(num_leds-len(c))
+    return c[:num_leds]
+
+def timeit(fn, *a, repeat=50):
+    fn(*a)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(*a)
+    return (time.perf_counter() - t0) / repeat * 1000.0
+
+def bench_sampler(args):
+    rng = np.random.default_rng(0)
+    w, h = args.res
+    print(f"resolution {w}x{h}, {args.repeat} frames per case")
+    print(f"{'leds':>6} {'loop ms':>9} {'prefix ms':>10} {'sparse ms':>10} {'speedup':>8}")
+    for n in args.leds:
+        counts = split_counts(n)
+        img = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        ps = PerimeterSampler(*counts)
+        ss = SparseSampler(Layout(edges=dict(zip(('top', 'right', 'bottom', 'left'), counts))))
+        t_loop = timeit(loop_sample, img, *counts, n, repeat=args.repeat)
+        t_ps = timeit(ps.sample, img, repeat=args.repeat)
+        t_ss = timeit(ss.sample, img, repeat=args.repeat)
+        print(f"{n:>6} {t_loop:>9.3f} {t_ps:>10.3f} {t_ss:>10.3f} {t_loop / min(t_ps, t_ss):>7.1f}x")
+    return 0
+
+def legacy_grab(sct, monitor, res=(128, 128)):
+    # reference: copy, full-frame BGR->RGB, then resize
+    import cv2
+    img = np.array(sct.grab(monitor))[:, :, :3]
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    return cv2.resize(img, res, interpolation=cv2.INTER_AREA)
+
+def alloc_per_frame(fn, repeat=10):
+    # peak numpy/python heap growth of one steady-state call
+    import tracemalloc
+    fn()
+    tracemalloc.start()
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return peak
+
+def bench_capture(args):
+    if args.source == 'live':
+        from mss import mss
+        sct = mss()
+    else:
+        sct = SyntheticScreen(*args.screen)
+    monitor = sct.monitors[1]
+    layout = Layout.load(args.layout)
+    sampler = SparseSampler(layout)
+    print(f"monitor {monitor['width']}x{monitor['height']}, depth {layout.depth}, {args.repeat} frames per mode")
+    ref = SparseSampler(layout).sample(legacy_grab(sct, monitor))
+    t = timeit(lambda: sampler.sample(legacy_grab(sct, monitor)), repeat=args.repeat)
+    print(f"{'mode':>6} {'MB/frame':>9} {'ms/frame':>9} {'alloc KB':>9}")
+    print(f"{'legacy':>6} {len(sct.grab(monitor).raw) / 1e6:>9.2f} {t:>9.2f} {'-':>9}")
+    for cap in (FullFrameCapture(sct, monitor), BandCapture(sct, monitor, layout.depth)):
+        colors = sampler.sample(cap.grab(), bgr=True)
+        diff = int(np.abs(colors.astype(int) - ref).max())
+        step = lambda: sampler.sample(cap.grab(), bgr=True)
+        t = timeit(step, repeat=args.repeat)
+        # live mss allocates a fresh raw buffer per grab, which is counted here
+        kb = alloc_per_frame(step) / 1024
+        name = 'band' if isinstance(cap, BandCapture) else 'full'
+        print(f"{name:>6} {cap.bytes_grabbed / 1e6:>9.2f} {t:>9.2f} {kb:>9.1f}   max LED diff vs legacy: {diff}")
+    sct.close()
+    return 0
+
+def synthetic_led_frames(n, num_leds, seed=0):
+    # desktop-like stretches (a few LEDs change), slow pans (all drift) and hard cuts
+    rng = np.random.default_rng(seed)
+    c = rng.integers(0, 256, (num_leds, 3)).astype(np.float64)
+    for i in range(n):
+        phase = (i // 90) % 3
+        if phase == 0:
+            k = rng.integers(0, num_leds, rng.integers(0, 4))
+            c[k] = rng.integers(0, 256, (len(k), 3))
+        elif phase == 1:
+            c = np.clip(c + rng.normal(0, 1.5, c.shape), 0, 255)
+        elif i % 30 == 0:
+            c = rng.integers(0, 256, (num_leds, 3)).astype(np.float64)
+        yield c.astype(np.uint8)
+
+def live_led_frames(seconds, fps, layout):
+    from mss import mss
+    sct = mss()
+    cap = open_capture('band', sct, sct.monitors[1], layout.depth)
+    sampler = SparseSampler(layout)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        yield sampler.sample(cap.grab(), bgr=True)
+        time.sleep(max(0.0, 1.0 / fps - (time.perf_counter() - t0)))
+    sct.close()
+
+def replay_led_frames(path, layout):
+    # every recorded frame once, as fast as it samples
+    sampler = SparseSampler(layout)
+    rec = Recording(path)
+    frame = None
+    for i in range(len(rec)):
+        frame = rec.frame(i, frame)
+        yield sampler.sample(frame, bgr=True)
+    rec.close()
+
+def bench_delta(args):
+    layout = Layout.load(args.layout)
+    n = layout.num_leds
+    if args.source == 'live':
+        frames = live_led_frames(args.seconds, args.fps, layout)
+        source = "live capture"
+    elif args.source == 'replay':
+        if not args.input:
+            print("--source replay needs --input, a cli.py --record file (or --source synthetic for generated frames)")
+            return 1
+        frames = replay_led_frames(args.input, layout)
+        source = f"replay of {args.input}"
+    else:
+        frames = synthetic_led_frames(args.frames, n)
+        # the savings depend entirely on the content, and this mix is made up
+        source = "SYNTHETIC frames (generated static, panning and cut scenes, not screen content)"
+    prev = shown = None
+    frames_n = deltas = full_bytes = sent_bytes = 0
+    for i, c in enumerate(frames):
+        c = as_frame(c, n)
+        fid = i & 0xFF
+        pkt = encode_leds(fid, c, n, FT_LEDS_ID)
+        full_bytes += len(pkt)
+        if prev is not None:
+            d = encode_delta(fid, (i - 1) & 0xFF, c, prev)
+            if d is not None and len(d) < len(pkt):
+                pkt = d
+                deltas += 1
+        # every packet must decode back to the frame on a device holding the previous one
+        _, shown = decode_frame(pkt, shown, (i - 1) & 0xFF)
+        if not np.array_equal(shown, c):
+            print(f"frame {i}: delta decode mismatch")
+            return 1
+        sent_bytes += len(pkt)
+        prev = c
+        frames_n += 1
+    if not frames_n:
+        return 1
+    print(f"{source}: {frames_n} frames, {n} LEDs, {deltas} sent as delta")
+    print(f"full-frame bytes {full_bytes}, chosen bytes {sent_bytes}, saved {100.0 * (1 - sent_bytes / full_bytes):.1f}%")
+    print(f"at 115200 baud: {full_bytes / frames_n * 10 / 115.2:.1f} ms/frame full, {sent_bytes / frames_n * 10 / 115.2:.1f} ms/frame chosen")
+    return 0
+
+def bench_smooth(args):
+    layout = Layout.load(args.layout)
+    n = layout.num_leds
+    if args.source == 'live':
+        frames = live_led_frames(args.seconds, args.fps, layout)
+    else:
+        rng = np.random.default_rng(1)
+        # capture jitter on top of the synthetic scene
+        frames = (np.clip(c + rng.normal(0, args.noise, c.shape), 0, 255) for c in synthetic_led_frames(args.frames, n))
+    smooth = TemporalFilter()
+    gate = ChangeGate(args.threshold, args.keepalive)
+    raw_gate = ChangeGate(args.threshold, args.keepalive)
+    count = sent_bytes = 0
+    t_filter = 0.0
+    for i, c in enumerate(frames):
+        # synthetic frames are stamped at the nominal rate, live ones in real time
+        now = i / args.fps if args.source == 'synthetic' else None
+        c = as_frame(np.asarray(c).astype(np.uint8), n)
+        t0 = time.perf_counter()
+        out = to_uint8(smooth(c))
+        send = gate.send(out, now)
+        t_filter += time.perf_counter() - t0
+        raw_gate.send(c, now)
+        if send:
+            sent_bytes += len(encode_leds(i, out, n, FT_LEDS_ID))
+        count += 1
+    if not count:
+        return 1
+    sent = count - gate.suppressed
+    secs = count / args.fps
+    print(f"{count} frames, {n} LEDs, threshold {args.threshold}, keepalive {args.keepalive} s")
+    print(f"suppressed: {gate.suppressed_fraction() * 100:.1f}% filtered, {raw_gate.suppressed_fraction() * 100:.1f}% unfiltered")
+    print(f"device wakeups {sent / secs:.1f}/s instead of {args.fps:.1f}/s, {sent_bytes / secs:.0f} B/s instead of {count * (n * 3 + 4) / secs:.0f} B/s")
+    print(f"filter + gate {t_filter / count * 1000:.3f} ms/frame")
+    return 0
+
+def motion_events(seconds, seed=0):
+    # (start, end) of motion bursts separated by long still stretches
+    rng = np.random.default_rng(seed)
+    t, out = 5.0, []
+    while t < seconds:
+        d = rng.uniform(0.2, 3.0)
+        out.append((t, min(seconds, t + d)))
+        t += d + rng.uniform(3.0, 20.0)
+    return out
+
+def bench_idle(args):
+    # virtual-time run: the screen is still except during motion bursts; every
+    # grab costs what a real band grab of a synthetic screen costs
+    sct = SyntheticScreen(*args.screen)
+    layout = Layout.load(args.layout)
+    cap = BandCapture(sct, sct.monitors[1], layout.depth)
+    grab_ms = timeit(cap.grab, repeat=20)
+    still = cap.grab().copy()
+    h, w = still.shape[:2]
+    yy, xx = np.mgrid[0:h, 0:w]
+    events = motion_events(args.seconds)
+    frame = still.copy()
+    print(f"{args.seconds:.0f} s, {len(events)} motion bursts, full rate {args.fps:.0f} fps, band grab {grab_ms:.2f} ms")
+    print(f"{'idle fps':>8} {'grabs':>7} {'saved':>7} {'ms/s saved':>11} {'wake mean ms':>13} {'wake max ms':>12}")
+    for idle_fps in args.idle_fps:
+        th = IdleThrottle(args.fps, idle_fps, args.idle_after)
+        t, grabs, lat, ev = 0.0, 0, [], 0
+        pending = None
+        while t < args.seconds:
+            while ev < len(events) and events[ev][1] < t:
+                ev += 1
+            moving = ev < len(events) and events[ev][0] <= t
+            if moving:
+                # a moving pattern, like video in the border bands
+                frame[:, :, :3] = (still[:, :, :3] + ((xx + yy + int(t * 240)) % 64)[:, :, None]).astype(np.uint8)
+                if pending != ev:
+                    pending = ev
+                    start = events[ev][0]
+            else:
+                frame[:] = still
+            was_idle = th.idle
+            dt = th.update(frame, t)
+            if moving and was_idle and not th.idle:
+                lat.append(t - start)
+            grabs += 1
+            t += dt
+        st = th.stats(grab_ms)
+        lat = lat or [0.0]
+        print(f"{idle_fps:>8g} {grabs:>7} {st['saved'] * 100:>6.1f}% {st['saved_ms_per_s']:>11.2f} {np.mean(lat) * 1000:>13.0f} {max(lat) * 1000:>12.0f}")
+    return 0
+
+def split_levels(indata, num_leds, fft_size=2048):
+    # reference: the sounddevice callback body before audio.py
+    data = indata.copy()
+    mono = data.mean(axis=1) if data.ndim > 1 else data
+    window = np.hanning(len(mono))
+    mags = np.abs(np.fft.rfft(mono * window, n=fft_size))
+    groups = np.array_split(mags, num_leds)
+    energies = np.array([g.mean() if g.size else 0.0 for g in groups])
+    maxv = energies.max() if energies.size else 1.0
+    return energies / maxv if maxv >= 1e-9 else energies * 0.0
+
+def bench_audio(args):
+    rng = np.random.default_rng(0)
+    sr = args.samplerate
+    print(f"{sr} Hz, {args.blocks} blocks per case, {args.scale} bands, times are per callback")
+    print(f"{'block':>6} {'leds':>5} {'deadline ms':>12} {'old p50':>8} {'old p99':>8} {'new p50':>8} {'new p99':>8} {'p99 % of deadline':>18}")
+    for bs in args.blocksize:
+        for n in args.leds:
+            t = np.arange(bs * args.blocks) / sr
+            # a chirp plus noise, so every band sees some energy
+            sig = (0.5 * np.sin(2 * np.pi * (50 + 4000 * t / t[-1]) * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+            blocks = sig.reshape(args.blocks, bs, 1)
+            mapper = BandMapper(n, sr, bs, scale=args.scale)
+            res = {}
+            for name, fn in (('old', lambda b: split_levels(b, n)), ('new', mapper.levels)):
+                fn(blocks[0])
+                d = []
+                for b in blocks:
+                    t0 = time.perf_counter()
+                    fn(b)
+                    d.append(time.perf_counter() - t0)
+                res[name] = np.percentile(d, [50, 99]) * 1000.0
+            deadline = bs / sr * 1000.0
+            print(f"{bs:>6} {n:>5} {deadline:>12.2f} {res['old'][0]:>8.3f} {res['old'][1]:>8.3f} {res['new'][0]:>8.3f} {res['new'][1]:>8.3f} {res['new'][1] / deadline * 100:>17.2f}%")
+    m = BandMapper(args.leds[0], sr, args.blocksize[-1], scale=args.scale)
+    lo = np.fft.rfftfreq(m.fft_size, 1.0 / sr)[m.matrix.argmax(axis=0)]
+    print(f"{args.leds[0]} {args.scale} bands peak at {lo[0]:.0f} Hz .. {lo[-1]:.0f} Hz; linear split gives each LED {sr / 2 / args.leds[0]:.0f} Hz")
+    return 0
+
+def bench_stream(args):
+    # a feeder thread stands in for PortAudio, calling back every block period
+    import threading
+    sr = args.samplerate
+    print(f"{sr} Hz, {args.leds} LEDs, STFT frame {args.frame}, hop {args.hop}, {args.seconds:.0f} s per case")
+    print(f"{'block':>6} {'callback p99 us':>16} {'analysed/s':>11} {'latency ms':>11} {'max ms':>8} {'late blocks':>12} {'overruns':>9}")
+    for bs in args.blocksize:
+        an = AudioAnalyzer(args.leds, sr, args.frame, args.hop)
+        an.start()
+        rng = np.random.default_rng(0)
+        blocks = (0.3 * rng.standard_normal((64, bs, 1))).astype(np.float32)
+        cb, late = [], [0]
+        def feed():
+            period = bs / sr
+            t_next = time.perf_counter()
+            end = t_next + args.seconds
+            i = 0
+            while t_next < end:
+                t_next += period
+                time.sleep(max(0.0, t_next - time.perf_counter()))
+                if time.perf_counter() - t_next > period:
+                    late[0] += 1
+                t0 = time.perf_counter()
+                an.callback(blocks[i % 64], bs, None, None)
+                cb.append(time.perf_counter() - t0)
+                i += 1
+        th = threading.Thread(target=feed)
+        th.start()
+        # a render loop reading the newest spectrum alongside
+        while th.is_alive():
+            an.latest()
+            time.sleep(1 / 60)
+        an.stop()
+        st = an.stats()
+        print(f"{bs:>6} {np.percentile(cb, 99) * 1e6:>16.1f} {st['frames'] / args.seconds:>11.0f} {st['latency_ms']:>11.2f} {st['latency_max_ms']:>8.2f} {late[0]:>12} {st['overruns']:>9}")
+    return 0
+
+def loop_audio_boost(colors, levels, sens):
+    # reference: test.py's per-LED tuple loop before color.py
+    out = []
+    for i, (r, g, b) in enumerate(colors):
+        lvl = float(levels[i]) if i < len(levels) else 0.0
+        scale = 1.0 + sens * lvl
+        out.append((min(255, int(r * scale)), min(255, int(g * scale)), min(255, int(b * scale))))
+    return out
+
+def loop_enhance(colors):
+    # reference: test.py's enhance_colors() before color.py
+    out = []
+    for r, g, b in colors:
+        rf, gf, bf = r / 255.0, g / 255.0, b / 255.0
+        lum = 0.2126 * rf + 0.7152 * gf + 0.0722 * bf
+        if lum > (200.0 / 255.0):
+            excess = (lum - (200.0 / 255.0)) / (1.0 - (200.0 / 255.0))
+            factor = max(0.25, 1.0 - excess * 0.75)
+            rf *= factor
+            gf *= factor
+            bf *= factor
+        h, s, v = colorsys.rgb_to_hsv(rf, gf, bf)
+        s = min(1.0, s * 1.35)
+        v = 0.5 + 1.12 * (v - 0.5)
+        v = max(0.0, min(1.0, v * 0.98))
+        rr, gg, bb = colorsys.hsv_to_rgb(h, s, v)
+        out.append(tuple(int(pow(max(0.0, min(1.0, x)), 1.06) * 255) for x in (rr, gg, bb)))
+    return out
+
+def bench_color(args):
+    rng = np.random.default_rng(0)
+    sens = 1.5
+    lut = EnhanceLUT(args.lut)
+    t0 = time.perf_counter()
+    lut.load()
+    print(f"{args.repeat} frames per case, {args.lut}^3 LUT ready in {(time.perf_counter() - t0) * 1000:.0f} ms ({lut.builds} built)")
+    print(f"{'leds':>6} {'loop ms':>9} {'array ms':>9} {'lut ms':>9} {'speedup':>8} {'max diff':>9} {'lut diff':>9}")
+    for n in args.leds:
+        c = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+        # include greys, black, white and saturated primaries
+        c[:8] = [(0, 0, 0), (255, 255, 255), (128, 128, 128), (255, 0, 0), (0, 255, 0), (0, 0, 255), (250, 240, 230), (1, 2, 3)]
+        levels = rng.random(n - 3)
+        loop = lambda: loop_enhance(loop_audio_boost(c, levels, sens))
+        vec = lambda: to_uint8(enhance(audio_boost(to_float(c), levels, sens)))
+        # every 8-bit colour the enhance stage can see
+        allc = np.stack(np.meshgrid(*(np.arange(0, 256, 3, dtype=np.uint8),) * 3, indexing='ij'), -1).reshape(-1, 3)
+        diff = max(int(np.abs(np.array(loop(), dtype=int) - vec()).max()),
+                   int(np.abs(np.array(loop_enhance(allc), dtype=int) - to_uint8(enhance(to_float(allc)))).max()))
+        if diff > 1:
+            print(f"{n}: array post-process differs from the reference loop by {diff}")
+            return 1
+        # a 256 table is exact; smaller ones interpolate and report their error
+        fast = lambda: to_uint8(lut(audio_boost(to_float(c), levels, sens)))
+        lut_diff = int(np.abs(to_uint8(lut(to_float(allc))).astype(int) - to_uint8(enhance(to_float(allc)))).max())
+        if args.lut == 256 and lut_diff:
+            print(f"{n}: 256^3 LUT differs from enhance() by {lut_diff}")
+            return 1
+        t_loop = timeit(loop, repeat=args.repeat)
+        t_vec = timeit(vec, repeat=args.repeat)
+        t_lut = timeit(fast, repeat=args.repeat)
+        print(f"{n:>6} {t_loop:>9.3f} {t_vec:>9.3f} {t_lut:>9.3f} {t_loop / min(t_vec, t_lut):>7.1f}x {diff:>9} {lut_diff:>9}")
+    return 0
+
+def loop_encode(frame_id, colors):
+    # reference: gui.py's send_color_to_serial() packet before protocol.py
+    payload = bytearray()
+    for r, g, b in colors:
+        payload.extend([r & 0xFF, g & 0xFF, b & 0xFF])
+    hdr = bytearray([0xAA, 0x55, frame_id & 0xFF])
+    s = frame_id
+    for x in payload:
+        s = (s + x) & 0xFFFFFFFF
+    return bytes(hdr + payload + bytearray([s & 0xFF]))
+
+def bench_codec(args):
+    frames = list(synthetic_led_frames(args.frames, max(args.leds)))
+    print(f"{args.frames} frames per case; decode feeds {args.chunk}-byte reads")
+    print(f"{'leds':>6} {'loop us':>9} {'bytes us':>9} {'reuse us':>9} {'crc us':>9} {'delta us':>9} {'decode us':>10} {'MB/s':>7}")
+    for n in args.leds:
+        cs = [as_frame(c, n) for c in frames]
+        lists = [[tuple(int(v) for v in px) for px in c] for c in cs[:50]]
+        enc, crc = FrameEncoder(n), FrameEncoder(n, crc=True)
+        def per_frame(fn, k):
+            t0 = time.perf_counter()
+            for i in range(k):
+                fn(i)
+            return (time.perf_counter() - t0) / k * 1e6
+        t_loop = per_frame(lambda i: loop_encode(i, lists[i % len(lists)]), len(lists))
+        t_bytes = per_frame(lambda i: encode_leds(i, cs[i], n), len(cs))
+        t_reuse = per_frame(lambda i: enc.leds(i, cs[i]), len(cs))
+        t_crc = per_frame(lambda i: crc.leds(i, cs[i], FT_LEDS_ID), len(cs))
+        t_delta = per_frame(lambda i: enc.delta(i, i - 1, cs[i], cs[i - 1]), len(cs))
+        # a device-side stream: full frames and deltas mixed as the sender would pick them
+        stream = bytearray()
+        for i, c in enumerate(cs):
+            pkt = enc.leds(i, c, FT_LEDS_ID)
+            d = enc.delta(i, i - 1, c, cs[i - 1]) if i else None
+            stream += d if d is not None and len(d) < len(pkt) else pkt
+        dec = StreamDecoder(n)
+        t0 = time.perf_counter()
+        got = []
+        for a in range(0, len(stream), args.chunk):
+            got += dec.feed(stream[a:a + args.chunk], now=0.0)
+        t_dec = time.perf_counter() - t0
+        print(f"{n:>6} {t_loop:>9.1f} {t_bytes:>9.1f} {t_reuse:>9.1f} {t_crc:>9.1f} {t_delta:>9.1f} "
+              f"{t_dec / len(cs) * 1e6:>10.1f} {len(stream) / t_dec / 1e6:>7.1f}")
+    return 0
+
+def random_telemetry(rng):
+    # encode_telemetry() arguments; GPUs missing now and then, rates past the u16 range
+    pct = [None if rng.random() < 0.2 else float(rng.uniform(0, 100)) for _ in range(4)]
+    return [int(rng.integers(0, 2 ** 32))] + pct + [float(rng.uniform(0, 1e9)) for _ in range(2)]
+
+def bench_link(args):
+    # the real sender and link negotiation against the pty device emulator
+    import serial
+    from emulator import Device
+    from link import negotiate, BASE_BAUD
+    n = args.leds
+    frames = [as_frame(c, n) for c in synthetic_led_frames(300, n)]
+    print(f"{n} LEDs, window {args.window}, {args.seconds:.0f} s per case, sending as fast as the window allows")
+    print(f"{'baud':>8} {'loss':>6} {'sent/s':>7} {'shown/s':>8} {'nak':>5} {'expired':>8} {'rtt ms':>7} "
+          f"{'lat p50':>8} {'lat p99':>8} {'overrun B':>10} {'delta %':>8}")
+    for rate in args.rates:
+        for loss in args.loss:
+            # loss starts after negotiation, whose probe burst would refuse a lossy rate
+            dev = Device(n, corrupt=args.corrupt, seed=0)
+            sends, shows = [], []
+            dev.on_frame = lambda fid, c: shows.append((fid, time.perf_counter()))
+            ser = serial.Serial(dev.port, BASE_BAUD, timeout=0.05)
+            try:
+                if rate != BASE_BAUD and negotiate(ser, [rate]) != rate:
+                    print(f"{rate:>8} {loss:>6} link negotiation did not reach {rate}")
+                    return 1
+                dev.loss = loss
+                sender = WindowedSender(ser, n, args.window, delta=not args.no_delta, crc=args.crc)
+                t0 = time.perf_counter()
+                i = 0
+                while time.perf_counter() - t0 < args.seconds:
+                    t = time.perf_counter()
+                    sends.append((sender.send(frames[i % len(frames)]), t))
+                    i += 1
+                time.sleep(0.3)
+                sender.close()
+                st, ds = sender.stats(), dev.stats()
+            finally:
+                ser.close()
+                dev.close()
+            # send-to-show latency: each shown id against the latest send of that id before it
+            last, lat, j = {}, [], 0
+            for fid, t in shows:
+                while j < len(sends) and sends[j][1] <= t:
+                    last[sends[j][0]] = sends[j][1]
+                    j += 1
+                if fid in last:
+                    lat.append(t - last[fid])
+            el = args.seconds
+            p50, p99 = (np.percentile(lat, [50, 99]) * 1000.0) if lat else (0.0, 0.0)
+            print(f"{rate:>8} {loss:>6} {st['sent'] / el:>7.1f} {ds['frames'] / el:>8.1f} {st['nacked']:>5} {st['expired']:>8} "
+                  f"{st['rtt_ms']:>7.1f} {p50:>8.1f} {p99:>8.1f} {ds['overruns']:>10} {100.0 * st['deltas'] / max(1, st['sent']):>8.1f}")
+    return 0
+
+def spawn_emulator(num_leds):
+    # the emulator in its own process, so CPU per frame counts only the host
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emulator.py')
+    proc = subprocess.Popen([sys.executable, path, '--leds', str(num_leds)], stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line:
+        proc.kill()
+        raise RuntimeError("emulator did not start")
+    return proc, line.rsplit(' ', 1)[-1].strip()
+
+def percentiles(samples):
+    if not samples:
+        return None
+    a = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"p50": p50, "p95": p95, "p99": p99, "mean": float(a.mean()), "max": float(a.max()), "n": len(a)}
+
+E2E_MODES = {
+    'full': {"delta": False},
+    'delta': {"delta": True},
+    'crc': {"delta": True, "crc": True},
+    'legacy': {"id_acks": False},
+}
+E2E_STAGES = ('capture', 'sample', 'enhance', 'encode', 'wait', 'write', 'frame')
+
+def run_e2e_case(args, screen, lut, res, n, mode):
+    import cv2, serial
+    from link import negotiate, BASE_BAUD
+    layout = Layout(edges=dict(zip(('top', 'right', 'bottom', 'left'), split_counts(n))))
+    if args.source == 'replay':
+        # every recorded frame in turn, looped, so each case sees the same input
+        cap = ReplayCapture(args.input, 0.0, loop=True)
+    else:
+        cap = open_capture(args.capture, screen, screen.monitors[1], layout.depth, (res, res))
+    sampler = SparseSampler(layout)
+    smooth = TemporalFilter()
+    gate = ChangeGate(args.threshold, args.keepalive)
+    proc, port = spawn_emulator(n) if args.port is None else (None, args.port)
+    ser = serial.Serial(port, BASE_BAUD, timeout=0.05)
+    times = {k: [] for k in E2E_STAGES}
+    try:
+        rate = BASE_BAUD
+        if args.baud != BASE_BAUD and mode != 'legacy':
+            rate = negotiate(ser, [args.baud]) or BASE_BAUD
+        sender = WindowedSender(ser, n, args.window, **E2E_MODES[mode])
+        blurred = None
+        frames = 0
+        t_start = next_t = time.perf_counter()
+        cpu0 = time.process_time()
+        while time.perf_counter() - t_start < args.seconds:
+            if args.fps:
+                now = time.perf_counter()
+                if now < next_t:
+                    time.sleep(next_t - now)
+                next_t = max(next_t + 1.0 / args.fps, time.perf_counter())
+            t0 = time.perf_counter()
+            img = cap.grab()
+            t1 = time.perf_counter()
+            blurred = cv2.GaussianBlur(img, (3, 3), 0, dst=blurred)
+            colors = sampler.sample(blurred, bgr=True)
+            t2 = time.perf_counter()
+            c = to_uint8(smooth(lut(to_float(colors))))
+            t3 = time.perf_counter()
+            if gate.send(c):
+                sender.send(c)
+                for k, v in sender.timing.items():
+                    times[k].append(v)
+            t4 = time.perf_counter()
+            times['capture'].append(t1 - t0)
+            times['sample'].append(t2 - t1)
+            times['enhance'].append(t3 - t2)
+            times['frame'].append(t4 - t0)
+            frames += 1
+        elapsed = time.perf_counter() - t_start
+        cpu = time.process_time() - cpu0
+        time.sleep(0.3)
+        sender.close()
+        link = sender.stats()
+    finally:
+        ser.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    return {"source": args.source, "capture": args.capture, "res": res, "leds": n, "mode": mode, "baud": rate,
+            "frames": frames, "seconds": elapsed, "fps": frames / elapsed, "sent_fps": link["sent"] / elapsed,
+            "cpu_ms_per_frame": cpu / max(1, frames) * 1000.0, "held": gate.suppressed_fraction(),
+            "stages": {k: percentiles(v) for k, v in times.items()}, "link": link}
+
+def e2e_key(case):
+    return (case["source"], case["capture"], case["res"], case["leds"], case["mode"], case["baud"])
+
+def bench_e2e(args):
+    # capture -> blur/sample -> enhance -> encode -> transmit, one frame at a
+    # time like cli.py, against the device emulator (or --port)
+    if args.source in ('recorded', 'replay') and not args.input:
+        print(f"--source {args.source} needs --input")
+        return 1
+    if args.source == 'live':
+        from mss import mss
+        screen = mss()
+    elif args.source == 'recorded':
+        screen = RecordedScreen(args.input, args.max_frames, args.screen if args.screen_set else None)
+    elif args.source == 'replay':
+        # a --record file is already at its capture resolution
+        rec = Recording(args.input)
+        screen, args.res = None, [rec.res[0]]
+        m = dict(rec.monitor)
+        rec.close()
+    else:
+        screen = MovingScreen(*args.screen)
+    lut = EnhanceLUT(256)
+    lut.load()
+    if screen is not None:
+        m = screen.monitors[1]
+    print(f"{args.source} {m['width']}x{m['height']} {args.capture} capture, {args.seconds:.0f} s per case, "
+          f"{'as fast as possible' if not args.fps else f'{args.fps:.0f} fps'}, p50/p99 ms")
+    print(f"{'res':>4} {'leds':>5} {'mode':>6} {'fps':>6} {'cpu ms':>7} " + " ".join(f"{k:>13}" for k in E2E_STAGES))
+    cases = []
+    for res in args.res:
+        for n in args.leds:
+            for mode in args.modes:
+                r = run_e2e_case(args, screen, lut, res, n, mode)
+                cases.append(r)
+                cols = " ".join(f"{s['p50']:>6.2f}/{s['p99']:<6.2f}" if s else f"{'-':>13}" for s in (r["stages"][k] for k in E2E_STAGES))
+                print(f"{res:>4} {n:>5} {mode:>6} {r['fps']:>6.1f} {r['cpu_ms_per_frame']:>7.2f} {cols}")
+    if screen is not None:
+        screen.close()
+    import cv2
+    out = {"version": 1, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+           "platform": platform.platform(), "python": platform.python_version(), "numpy": np.__version__,
+           "opencv": cv2.__version__, "cpus": os.cpu_count(),
+           "args": {k: v for k, v in vars(args).items() if k != 'fn'}, "cases": cases}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(out, f, indent=1, default=float)
+        print(f"wrote {args.json}")
+    if args.compare:
+        with open(args.compare) as f:
+            old = {e2e_key(c): c for c in json.load(f)["cases"]}
+        print(f"against {args.compare}: fps and p99 frame ms, old -> new")
+        for c in cases:
+            o = old.get(e2e_key(c))
+            if o:
+                print(f"{c['res']:>4} {c['leds']:>5} {c['mode']:>6} {o['fps']:>7.1f} -> {c['fps']:<7.1f}"
+                      f" {o['stages']['frame']['p99']:>7.2f} -> {c['stages']['frame']['p99']:.2f}")
+    return 0
+
+def bench_record(args):
+    # record synthetic captures, replay them and compare frame by frame
+    import tempfile
+    screen = MovingScreen(*args.screen)
+    layout = Layout.load(args.layout)
+    m = screen.monitors[1]
+    print(f"synthetic {m['width']}x{m['height']}, {args.frames} frames per mode")
+    print(f"{'mode':>6} {'KB/frame':>9} {'raw KB':>7} {'append us':>10} {'replay us':>10} {'grab us':>8}")
+    with tempfile.TemporaryDirectory() as d:
+        for mode in ('band', 'full'):
+            cap = open_capture(mode, screen, m, layout.depth)
+            path = os.path.join(d, f"{mode}.slr")
+            rec = FrameRecorder(path, cap.res, cap.mask, m, chunk=64)
+            kept, t_grab, t_append = [], 0.0, 0.0
+            for i in range(args.frames):
+                t0 = time.perf_counter()
+                f = cap.grab()
+                t1 = time.perf_counter()
+                rec.append(f, i / 30.0)
+                t_append += time.perf_counter() - t1
+                t_grab += t1 - t0
+                kept.append(f[:, :, :3].copy())
+                if i == args.frames // 2:
+                    # a reader while the writer is still going sees every finished frame
+                    live = Recording(path)
+                    if len(live) != i + 1:
+                        print(f"{mode}: open recording shows {len(live)} frames, expected {i + 1}")
+                        return 1
+                    live.close()
+            rec.close()
+            replay = ReplayCapture(path, speed=0.0)
+            t0 = time.perf_counter()
+            for i, ref in enumerate(kept):
+                if not np.array_equal(replay.grab()[:, :, :3], ref):
+                    print(f"{mode}: replayed frame {i} differs from the capture")
+                    return 1
+            t_replay = time.perf_counter() - t0
+            try:
+                replay.grab()
+                print(f"{mode}: replay did not stop at the end")
+                return 1
+            except EOFError:
+                pass
+            if not np.allclose(replay.recording.times, np.arange(args.frames) / 30.0):
+                print(f"{mode}: timestamps differ")
+                return 1
+            replay.close()
+            w, h = cap.res
+            print(f"{mode:>6} {rec.bytes_per_frame() / 1024:>9.1f} {w * h * 4 / 1024:>7.1f} {t_append / args.frames * 1e6:>10.1f} "
+                  f"{t_replay / args.frames * 1e6:>10.1f} {t_grab / args.frames * 1e6:>8.1f}")
+    return 0
+
+def legacy_status(sample, stamp):
+    # reference: the CSV status text test.py sent before 0x5D
+    n = lambda v: 0 if v is None else int(round(v))
+    return (f"{stamp},{n(sample['cpu'])},{n(sample['ram'])},{n(sample['gpu0'])},{n(sample['gpu1'])},"
+            f"{mb_per_s(sample['down']):.2f},{mb_per_s(sample['up']):.2f}")
+
+def bench_telemetry(args):
+    rng = np.random.default_rng(args.seed)
+    # 1. encoder, reference decoder and stream decoder agree; values clamp and quantise as documented
+    dec = StreamDecoder(96, status=True)
+    stream, want = bytearray(), []
+    for _ in range(args.packets):
+        a = random_telemetry(rng)
+        pkt = encode_telemetry(*a)
+        got = decode_telemetry(pkt)
+        exp = {"clock": a[0]}
+        for k, v in zip(("cpu", "ram", "gpu0", "gpu1"), a[1:5]):
+            exp[k] = None if v is None else int(round(v))
+        for k, v in zip(("down", "up"), a[5:]):
+            exp[k] = min(0xFFFF, int(round(v / NET_UNIT))) * NET_UNIT
+        if got != exp:
+            print(f"decode_telemetry {got} != {exp}")
+            return 1
+        bad = bytearray(pkt)
+        bad[int(rng.integers(2, len(pkt) - 1))] ^= 1 << int(rng.integers(0, 8))
+        try:
+            decode_telemetry(bad)
+            print("decode_telemetry accepted a damaged packet")
+            return 1
+        except ValueError:
+            pass
+        stream += pkt + bad
+        want += [(got, True), (None, False)]
+    ev = dec.feed(stream, now=0.0)
+    if len(ev) != len(want) or any(ft != FT_TELEMETRY or ok != w_ok or (w_ok and v != w) or StreamDecoder.reply((ft, ok, fid, v)) != (b"s" if w_ok else b"n")
+                                   for (ft, ok, fid, v), (w, w_ok) in zip(ev, want)):
+        print("stream decoder disagrees with decode_telemetry")
+        return 1
+    print(f"{args.packets} telemetry packets and as many damaged ones decoded as expected")
+    # 2. bytes on the wire and encode cost for the same samples
+    samples = []
+    for _ in range(200):
+        a = random_telemetry(rng)
+        samples.append(dict(zip(FIELDS, a[1:]), time=time.time()))
+    stamp = lambda t: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+    csv = [encode_status(legacy_status(t, stamp(t["time"]))) for t in samples]
+    t_csv = timeit(lambda: [encode_status(legacy_status(t, stamp(t["time"]))) for t in samples], repeat=20) / len(samples)
+    t_bin = timeit(lambda: [encode_telemetry(local_clock(t["time"]), *(t[k] for k in FIELDS)) for t in samples], repeat=20) / len(samples)
+    print(f"{'packet':>8} {'bytes':>6} {'encode us':>10}")
+    print(f"{'0x56 csv':>8} {np.mean([len(p) for p in csv]):>6.1f} {t_csv * 1000:>10.1f}")
+    print(f"{'0x5D':>8} {len(encode_telemetry(0, 0, 0, 0, 0, 0, 0)):>6} {t_bin * 1000:>10.1f}")
+    # 3. main-thread cost per status tick: reading the system there vs reading the sampler's ring
+    src, row = SystemSource(), np.empty(len(FIELDS), dtype=np.float32)
+    src(row)
+    t_read = timeit(lambda: src(row), repeat=args.samples)
+    # 4. the ring under a reader that never waits: rows come out whole, oldest first
+    count = [0]
+    def counter(out):
+        count[0] += 1
+        out[:] = count[0]
+    sampler = TelemetrySampler(args.period, args.history, counter)
+    hist = np.empty(args.history, dtype=np.float32)
+    sampler.start()
+    reads = bad = 0
+    t_ring = 0.0
+    while sampler.samples < args.samples:
+        t0 = time.perf_counter()
+        t = sampler.latest()
+        h = sampler.history("cpu", hist)
+        t_ring += time.perf_counter() - t0
+        reads += 1
+        if t is None:
+            continue
+        vals = [t[k] for k in FIELDS]
+        bad += len(set(vals)) != 1 or (len(h) > 1 and not np.all(np.diff(h) == 1)) or h[-1] < vals[0]
+    sampler.stop()
+    if bad:
+        print(f"{bad}/{reads} torn or out-of-order reads of the telemetry ring")
+        return 1
+    st = sampler.stats()
+    where = "psutil" if PSUTIL_AVAILABLE else "no psutil: NVML only, if any"
+    print(f"main thread per tick ({where}): read the system {t_read * 1000:.1f} us -> read the ring {t_ring / reads * 1e6:.1f} us")
+    print(f"ring: {reads} reads over {st['samples']} samples, all whole and in order")
+    return 0
+
+def bench_backends(args):
+    # every registered backend: does it open here, grab cost per capture mode,
+    # and the same pixels as mss; then the pick 'auto' makes
+    layout = Layout.load(args.layout)
+    print(f"{'backend':>10} {'band ms':>8} {'full ms':>8} {'alloc KB':>9}  note")
+    ref = None
+    for name in BACKENDS:
+        try:
+            screen = open_backend(name, args.input, args.screen)
+        except Exception as e:
+            print(f"{name:>10} {'-':>8} {'-':>8} {'-':>9}  unavailable: {e}")
+            continue
+        m = screen.monitors[1]
+        t = {mode: time_backend(screen, mode, layout.depth, (128, 128), args.repeat) for mode in ('band', 'full')}
+        cap = open_capture('full', screen, m, layout.depth)
+        kb = alloc_per_frame(cap.grab) / 1024
+        note = f"{m['width']}x{m['height']}"
+        if name in LIVE:
+            # live backends must agree on a still screen; retry in case it moved
+            shot = lambda s=screen, m=m: bgra_view(s.grab(m))[:, :, :3].copy()
+            if ref is None:
+                ref = (name, shot, screen)
+            else:
+                diff = min(int(np.abs(shot().astype(int) - ref[1]().astype(int)).max()) for _ in range(3))
+                if diff:
+                    print(f"{name}: pixels differ from {ref[0]} by up to {diff}")
+                    return 1
+                note += f", same pixels as {ref[0]}"
+        print(f"{name:>10} {t['band']:>8.2f} {t['full']:>8.2f} {kb:>9.1f}  {note}")
+        if ref is None or ref[2] is not screen:
+            screen.close()
+    if ref is not None:
+        ref[2].close()
+    try:
+        name, screen, _ = select_backend('band', layout.depth, (128, 128))
+        screen.close()
+        print(f"auto picks {name} for band capture")
+    except OSError:
+        print("auto: no live backend here (no display)")
+    return 0
+
+def sequential_monitors(screen, segments, mode, blur=True):
+    # reference: one thread grabbing and sampling every monitor in turn
+    import cv2
+    caps = [(open_capture(mode, screen, screen.monitors[m], lay.depth), SparseSampler(lay)) for m, lay in segments]
+    def frame():
+        out = []
+        for cap, sampler in caps:
+            img = cap.grab()
+            if blur:
+                img = cv2.GaussianBlur(img, (3, 3), 0)
+            out.append(sampler.sample(img, bgr=True))
+        return np.concatenate(out)
+    return frame
+
+class WaitingScreen:
+    # a screen whose grabs also wait `latency` seconds without holding the
+    # GIL, like a capture API waiting on the X server or the compositor
+    def __init__(self, screen, latency):
+        self.screen = screen
+        self.monitors = screen.monitors
+        self.latency = latency
+
+    def grab(self, m):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.screen.grab(m)
+
+    def close(self):
+        self.screen.close()
+
+def bench_multimon(args):
+    layout = Layout.load(args.layout)
+    w, h = args.screen
+    # a still screen, so the merged frame must match the sequential reference exactly
+    register("still", lambda input=None, size=None: SyntheticScreen(*(size or (w, h)), count=int(input or 1)))
+    print(f"synthetic {w}x{h} monitors side by side, {args.capture} capture, {args.frames} frames per case, {os.cpu_count()} CPUs")
+    print(f"{'monitors':>8} {'wait ms':>8} {'seq fps':>8} {'par fps':>8} {'late':>5}  per monitor grab/busy ms")
+    for k in args.monitors:
+        segments = [(i + 1, layout) for i in range(k)]
+        ref = sequential_monitors(SyntheticScreen(w, h, count=k), segments, args.capture)()
+        multi = MultiMonitorCapture(segments, "still", args.capture, input=str(k), size=(w, h))
+        multi.start()
+        got = multi.frame(5.0).copy()
+        multi.close()
+        if not np.array_equal(got, ref):
+            print(f"{k} monitors: merged frame differs from sampling each monitor in turn")
+            return 1
+        for wait in args.grab_wait:
+            # moving content: every grab copies its regions, as mss does
+            slow = lambda input=None, size=None: WaitingScreen(MovingScreen(w, h, count=k), wait / 1000.0)
+            register("waiting", slow)
+            seq = sequential_monitors(slow(), segments, args.capture)
+            t0 = time.perf_counter()
+            for _ in range(args.frames):
+                seq()
+            seq_fps = args.frames / (time.perf_counter() - t0)
+            multi = MultiMonitorCapture(segments, "waiting", args.capture)
+            multi.start()
+            # as fast as the slowest monitor allows: wait for every segment each frame
+            for _ in range(args.frames):
+                multi.frame(1.0)
+            st = multi.stats()
+            multi.close()
+            mons = "  ".join(f"{m['grab_ms']:.1f}/{m['busy_ms']:.1f}" for m in st["monitors"])
+            print(f"{k:>8} {wait:>8.1f} {seq_fps:>8.1f} {st['fps']:>8.1f} {sum(m['late'] for m in st['monitors']):>5}  {mons}")
+    return 0
+
+def run_group(args, sync, latch, frames):
+    # one group run over emulated devices; returns (group stats, per device [(tick, t, colors)], ticks sent, unsynced)
+    import serial
+    from emulator import Device
+    from link import negotiate, BASE_BAUD
+    devs, links, shows, a = [], [], [], 0
+    try:
+        for i, (n, rate) in enumerate(zip(args.leds, args.rates)):
+            dev = Device(n, latch=latch[i])
+            devs.append(dev)
+            got = []
+            shows.append(got)
+            # the tick is carried in the first LED of every slice
+            dev.on_frame = lambda fid, c, got=got: got.append((int(c[0, 0]) | int(c[0, 1]) << 8, time.perf_counter(), c.copy()))
+            ser = serial.Serial(dev.port, BASE_BAUD, timeout=0.05)
+            if rate != BASE_BAUD and negotiate(ser, [rate]) != rate:
+                raise RuntimeError(f"device {i}: link negotiation did not reach {rate}")
+            links.append(DeviceLink(ser, a, a + n, args.window))
+            a += n
+        group = DeviceGroup(links, sync, args.deadline / 1000.0)
+        unsynced = group.start()
+        sent = {}
+        interval = 1.0 / args.fps if args.fps else 0.0
+        t0 = next_t = time.perf_counter()
+        tick = 0
+        while time.perf_counter() - t0 < args.seconds:
+            tick += 1
+            c = frames[tick % len(frames)].copy()
+            for l in links:
+                c[l.leds[0], :2] = tick & 0xFF, tick >> 8
+            sent[tick] = c
+            group.send(c)
+            next_t += interval
+            time.sleep(max(0.0, next_t - time.perf_counter()))
+        time.sleep(0.3)
+        st = group.stats()
+        stop = time.perf_counter()
+        group.close()
+        # the release on close shows whatever each device holds, synced or not
+        shows = [[s for s in got if s[1] < stop] for got in shows]
+    finally:
+        for l in links:
+            l.ser.close()
+        for dev in devs:
+            dev.close()
+    return st, shows, sent, unsynced
+
+def bench_group(args):
+    if len(args.rates) != len(args.leds):
+        print("--rates needs one rate per --leds entry")
+        return 1
+    n = sum(args.leds)
+    frames = [as_frame(c, n) for c in synthetic_led_frames(300, n)]
+    cases = [("sync", True, [True] * len(args.leds)), ("no sync", False, [True] * len(args.leds))]
+    if len(args.leds) > 1:
+        # the last device runs firmware without 0x5E: the group falls back to no sync
+        cases.append(("old fw", True, [True] * (len(args.leds) - 1) + [False]))
+    print(f"devices {' '.join(f'{k}@{r}' for k, r in zip(args.leds, args.rates))}, {args.fps:.0f} fps for {args.seconds:.0f} s, "
+          f"deadline {args.deadline:.0f} ms")
+    print(f"{'case':>8} {'fps':>6} {'whole %':>8} {'skew p50':>9} {'skew p99':>9} {'held':>5} {'shown':>6} {'partial':>8}  per device fps/kB/s/acked/rtt ms")
+    for name, sync, latch in cases:
+        st, shows, _, _ = run_group(args, sync, latch, frames)
+        # skew: first to last device showing the same frame; whole: frames every device showed
+        times = {}
+        for got in shows:
+            for tick, t, _ in got:
+                times.setdefault(tick, []).append(t)
+        skews = [max(t) - min(t) for t in times.values() if len(t) == len(shows)]
+        whole = 100.0 * len(skews) / max(1, len(times))
+        p50, p99 = (np.percentile(skews, [50, 99]) * 1000.0) if skews else (0.0, 0.0)
+        devs = "  ".join(f"{d['fps']:.0f}/{d['kB_s']:.1f}/{d['acked']}/{d['rtt_ms']:.1f}" for d in st["devices"])
+        print(f"{name:>8} {st['fps']:>6.1f} {whole:>8.1f} {p50:>9.2f} {p99:>9.2f} {sum(d['synced'] for d in st['devices']):>5} {st['shown']:>6} {st['partial']:>8}  {devs}")
+    return 0
+
+class LegacyPreview:
+    # reference: test.py's preview before preview.py, everything redrawn for
+    # every processed frame, queued onto Tk with after(0)
+    def __init__(self, root, canvas, layout, inner, edge=28, pad=2):
+        self.canvas = canvas
+        self.inner = inner
+        x0, y0, x1, y1 = inner
+        self.rects = []
+        for box in layout.led_boxes(x0, y0, x1, y1, edge):
+            self.rects.append(None if box is None else canvas.create_rectangle(box[0] + pad, box[1] + pad, box[2] - pad, box[3] - pad,
+                                                                                fill="#000000", outline=""))
+        self.draws = 0
+        self.tk_s = 0.0
+
+    def submit(self, img, colors):
+        self.canvas.after(0, self.draw, img, colors)
+
+    def draw(self, img, colors):
+        import cv2
+        from PIL import Image, ImageTk
+        t0 = time.perf_counter()
+        x0, y0, x1, y1 = self.inner
+        d = cv2.resize(img, (max(1, int(x1 - x0)), max(1, int(y1 - y0))), interpolation=cv2.INTER_AREA)
+        self.photo = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(d, cv2.COLOR_BGRA2RGB)))
+        self.canvas.delete('bg')
+        self.canvas.create_image(x0, y0, anchor='nw', image=self.photo, tag='bg')
+        for i, col in enumerate(colors[:len(self.rects)]):
+            if self.rects[i] is not None:
+                self.canvas.itemconfig(self.rects[i], fill="#%02x%02x%02x" % tuple(col))
+        self.draws += 1
+        self.tk_s += time.perf_counter() - t0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+def bench_preview(args):
+    # Tk main-loop time spent on the preview, per-frame redraw vs the throttled
+    # Preview, with the window shown and withdrawn (hidden to tray)
+    import threading
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"needs a display, e.g. xvfb-run python bench.py preview ({e})")
+        return 1
+    from preview import Preview
+    layout = Layout.load(args.layout)
+    screen = MovingScreen(1920, 1080)
+    cap = FullFrameCapture(screen, screen.monitors[1])
+    sampler = SparseSampler(layout)
+    w, h, edge = 640, 460, 28
+    inner = (edge, 100 + edge, w - edge, h - edge)
+    print(f"{args.fps:.0f} fps into the preview for {args.seconds:.0f} s, preview at {args.preview_fps:.0f} fps")
+    print(f"{'window':>7} {'preview':>9} {'draws':>6} {'tk ms/s':>8} {'lag p50':>8} {'lag p99':>8}")
+    for hidden in (False, True):
+        for name in ('legacy', 'throttled'):
+            canvas = tk.Canvas(root, width=w, height=h, bg="black")
+            canvas.pack()
+            if hidden:
+                root.withdraw()
+            else:
+                root.deiconify()
+            root.update()
+            view = LegacyPreview(root, canvas, layout, inner, edge) if name == 'legacy' else Preview(root, canvas, layout, inner, edge, fps=args.preview_fps)
+            view.start()
+            lags, last = [], [None]
+            def probe(due):
+                # how late a 5 ms timer fires: what every other Tk callback sees
+                now = time.perf_counter()
+                lags.append(now - due)
+                root.after(5, probe, now + 0.005)
+            root.after(5, probe, time.perf_counter() + 0.005)
+            def produce():
+                end = time.perf_counter() + args.seconds
+                nxt = time.perf_counter()
+                while time.perf_counter() < end:
+                    img = cap.grab().copy()
+                    last[0] = sampler.sample(img, bgr=True)
+                    view.submit(img, last[0])
+                    nxt += 1.0 / args.fps
+                    time.sleep(max(0.0, nxt - time.perf_counter()))
+            t = threading.Thread(target=produce, daemon=True)
+            t.start()
+            root.after(int(args.seconds * 1000) + 300, root.quit)
+            root.mainloop()
+            t.join()
+            view.stop()
+            if not hidden:
+                # both must end up showing the last frame's LED colours
+                for i, rid in enumerate(view.rects):
+                    if rid is not None and canvas.itemcget(rid, 'fill') != "#%02x%02x%02x" % tuple(last[0][i]):
+                        print(f"{name}: LED {i} does not show the last frame")
+                        return 1
+            p50, p99 = np.percentile(lags, [50, 99]) * 1000.0
+            print(f"{'hidden' if hidden else 'shown':>7} {name:>9} {view.draws:>6} {view.tk_s * 1000.0 / args.seconds:>8.1f} {p50:>8.2f} {p99:>8.2f}")
+            canvas.destroy()
+    root.destroy()
+    return 0
+
+def main():
+    p=argparse.ArgumentParser()
+    sub=p.add_subparsers(dest='cmd', required=True)
+    b=sub.add_parser('sampler', help='per-frame cost of perimeter sampling')
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 300, 1000])
+    b.add_argument('--res', type=int, nargs=2, default=[128, 128], metavar=('W','H'))
+    b.add_argument('--repeat', type=int, default=50)
+    b.set_defaults(fn=bench_sampler)
+    b=sub.add_parser('capture', help='full-frame vs border-band capture')
+    b.add_argument('--source', choices=['live','synthetic'], default='synthetic')
+    b.add_argument('--screen', type=int, nargs=2, default=[3840, 2160], metavar=('W','H'), help='synthetic screen size')
+    b.add_argument('--layout', default=None)
+    b.add_argument('--repeat', type=int, default=20)
+    b.set_defaults(fn=bench_capture)
+    b=sub.add_parser('delta', help='bytes on the wire, full frames vs delta frames')
+    b.add_argument('--source', choices=['live','synthetic','replay'], default='replay')
+    b.add_argument('--input', default=None, help='cli.py --record file for --source replay')
+    b.add_argument('--frames', type=int, default=900, help='synthetic frame count')
+    b.add_argument('--seconds', type=float, default=30.0, help='live capture length')
+    b.add_argument('--fps', type=float, default=15.0)
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_delta)
+    b=sub.add_parser('color', help='audio boost + enhance, per-LED loop vs arrays')
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 1000])
+    b.add_argument('--repeat', type=int, default=200)
+    b.add_argument('--lut', type=int, default=256, help='LUT grid size (256 = exact table)')
+    b.set_defaults(fn=bench_color)
+    b=sub.add_parser('smooth', help='temporal filter and change-threshold send suppression')
+    b.add_argument('--source', choices=['live','synthetic'], default='synthetic')
+    b.add_argument('--frames', type=int, default=900, help='synthetic frame count')
+    b.add_argument('--noise', type=float, default=1.0, help='synthetic capture jitter, std dev in levels')
+    b.add_argument('--seconds', type=float, default=30.0, help='live capture length')
+    b.add_argument('--fps', type=float, default=15.0)
+    b.add_argument('--threshold', type=float, default=2.0)
+    b.add_argument('--keepalive', type=float, default=1.0)
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_smooth)
+    b=sub.add_parser('idle', help='capture throttling on a mostly still screen')
+    b.add_argument('--seconds', type=float, default=600.0)
+    b.add_argument('--fps', type=float, default=15.0)
+    b.add_argument('--idle-fps', type=float, nargs='+', default=[1.0, 2.0, 5.0])
+    b.add_argument('--idle-after', type=int, default=30, help='still frames before dropping to the idle rate')
+    b.add_argument('--screen', type=int, nargs=2, default=[3840, 2160], metavar=('W','H'))
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_idle)
+    b=sub.add_parser('audio', help='audio callback cost against the block deadline')
+    b.add_argument('--blocksize', type=int, nargs='+', default=[256, 512, 1024])
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 1000])
+    b.add_argument('--samplerate', type=int, default=44100)
+    b.add_argument('--scale', choices=['log','mel','linear'], default='log')
+    b.add_argument('--blocks', type=int, default=500)
+    b.set_defaults(fn=bench_audio)
+    b=sub.add_parser('stream', help='ring-buffered audio analysis: callback cost and analysis latency')
+    b.add_argument('--blocksize', type=int, nargs='+', default=[64, 128, 256, 1024])
+    b.add_argument('--frame', type=int, default=1024)
+    b.add_argument('--hop', type=int, default=256)
+    b.add_argument('--leds', type=int, default=96)
+    b.add_argument('--samplerate', type=int, default=44100)
+    b.add_argument('--seconds', type=float, default=3.0)
+    b.set_defaults(fn=bench_stream)
+    b=sub.add_parser('codec', help='packet encode and stream decode cost')
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 300, 1000])
+    b.add_argument('--frames', type=int, default=300)
+    b.add_argument('--chunk', type=int, default=64, help='bytes per decoder read')
+    b.set_defaults(fn=bench_codec)
+    b=sub.add_parser('link', help='sender throughput and latency against the device emulator')
+    b.add_argument('--rates', type=int, nargs='+', default=[115200, 921600, 2000000])
+    b.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.001], help='byte loss probabilities')
+    b.add_argument('--corrupt', type=float, default=0.0, help='byte corruption probability')
+    b.add_argument('--leds', type=int, default=96)
+    b.add_argument('--window', type=int, default=4)
+    b.add_argument('--seconds', type=float, default=3.0)
+    b.add_argument('--no-delta', action='store_true')
+    b.add_argument('--crc', action='store_true')
+    b.set_defaults(fn=bench_link)
+    b=sub.add_parser('e2e', help='whole host pipeline, per-stage percentiles, JSON report')
+    b.add_argument('--source', choices=['synthetic','recorded','live','replay'], default='synthetic')
+    b.add_argument('--input', default=None, help='video or image sequence for --source recorded, cli.py --record file for replay')
+    b.add_argument('--max-frames', type=int, default=60, help='recorded frames decoded into memory')
+    b.add_argument('--screen', type=int, nargs=2, default=None, metavar=('W','H'), help='synthetic screen size, or resize recorded frames')
+    b.add_argument('--capture', choices=['band','full'], default='band')
+    b.add_argument('--res', type=int, nargs='+', default=[128], help='capture resolutions (square)')
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 300])
+    b.add_argument('--modes', choices=list(E2E_MODES), nargs='+', default=['delta', 'full'])
+    b.add_argument('--baud', type=int, default=2000000, help='link rate negotiated with the device')
+    b.add_argument('--port', default=None, help='real device instead of the emulator')
+    b.add_argument('--window', type=int, default=4)
+    b.add_argument('--fps', type=float, default=0.0, help='pace frames (0: as fast as possible)')
+    b.add_argument('--threshold', type=float, default=2.0)
+    b.add_argument('--keepalive', type=float, default=1.0)
+    b.add_argument('--seconds', type=float, default=5.0)
+    b.add_argument('--json', default=None, help='write the results here')
+    b.add_argument('--compare', default=None, help='earlier --json results to compare against')
+    b.set_defaults(fn=bench_e2e)
+    b=sub.add_parser('record', help='frame recording size, append cost and bit-exact replay')
+    b.add_argument('--frames', type=int, default=300)
+    b.add_argument('--screen', type=int, nargs=2, default=[1920, 1080], metavar=('W','H'))
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_record)
+    b=sub.add_parser('backends', help='capture backends: availability, grab cost, pixel agreement, auto pick')
+    b.add_argument('--repeat', type=int, default=20)
+    b.add_argument('--input', default=None, help='video file for the video backend')
+    b.add_argument('--screen', type=int, nargs=2, default=None, metavar=('W','H'), help='synthetic screen size')
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_backends)
+    b=sub.add_parser('preview', help='Tk main-loop time of the GUI preview, per-frame vs throttled')
+    b.add_argument('--fps', type=float, default=60.0, help='frames handed to the preview per second')
+    b.add_argument('--preview-fps', type=float, default=10.0)
+    b.add_argument('--seconds', type=float, default=5.0)
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_preview)
+    b=sub.add_parser('telemetry', help='0x5D status packets: decode checks, bytes vs CSV, main-thread cost of the sampler')
+    b.add_argument('--packets', type=int, default=2000)
+    b.add_argument('--samples', type=int, default=200, help='sampler rows taken while a reader polls the ring')
+    b.add_argument('--period', type=float, default=0.005, help='sampler period for the run')
+    b.add_argument('--history', type=int, default=60)
+    b.add_argument('--seed', type=int, default=1)
+    b.set_defaults(fn=bench_telemetry)
+    b=sub.add_parser('multimon', help='parallel per-monitor capture vs one thread: merged fps, per-monitor grab time')
+    b.add_argument('--monitors', type=int, nargs='+', default=[1, 2, 3])
+    b.add_argument('--frames', type=int, default=200)
+    b.add_argument('--capture', choices=['band','full'], default='band')
+    b.add_argument('--screen', type=int, nargs=2, default=[1920, 1080], metavar=('W','H'), help='size of each monitor')
+    b.add_argument('--grab-wait', type=float, nargs='+', default=[0.0, 8.0], help='ms each grab waits off the GIL (X server or compositor round trip)')
+    b.add_argument('--layout', default=None)
+    b.set_defaults(fn=bench_multimon)
+    b=sub.add_parser('group', help='several emulated controllers as one strip: presentation skew with and without the 0x5E latch')
+    b.add_argument('--leds', type=int, nargs='+', default=[96, 60, 36], help='LEDs per device')
+    b.add_argument('--rates', type=int, nargs='+', default=[115200, 2000000, 2000000], help='link rate per device')
+    b.add_argument('--fps', type=float, default=20.0)
+    b.add_argument('--seconds', type=float, default=3.0)
+    b.add_argument('--deadline', type=float, default=100.0, help='ms a synced frame waits for the slowest ACK')
+    b.add_argument('--window', type=int, default=4)
+    b.set_defaults(fn=bench_group)
+    args=p.parse_args()
+    if args.cmd == 'e2e':
+        args.screen_set = args.screen is not None
+        args.screen = args.screen or [1920, 1080]
+    sys.exit(args.fn(args))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Screen capture sources feeding the sampler.
+- FullFrameCapture: grab the whole monitor, downscale to RES
+- BandCapture: grab only the four edge strips sized from the layout depth and
+  paste them into an RES frame; the interior is never copied (one spare row
+  or column per band keeps a 3x3 blur from pulling in the black interior)
+The mss buffer is wrapped as a BGRA view and resized straight into a reused
+(h,w,4) BGRA frame, so nothing full-resolution is copied or colour-converted;
+sample with bgr=True. The returned frame is only valid until the next grab().
+`mask` is None for full frames and the (h,w) pixels a band capture fills
+otherwise, so a recording can leave out the black interior.
+IdleThrottle watches a 16x16 thumbnail of each grabbed frame and stretches
+the capture interval to the idle rate once the screen has been still for a
+while; the first changed thumbnail brings it straight back to full rate.
+"""
+
+import time
+import numpy as np
+import cv2
+
+RES = (128, 128)
+
+def bgra_view(shot):
+    # zero-copy (h,w,4) view of an mss screenshot
+    return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+class FullFrameCapture:
+    def __init__(self, sct, monitor, res=RES):
+        self.sct = sct
+        self.monitor = monitor
+        self.res = res
+        self.bytes_grabbed = 0
+        self.mask = None
+        self.frame = np.zeros((res[1], res[0], 4), dtype=np.uint8)
+
+    def grab(self):
+        s = self.sct.grab(self.monitor)
+        self.bytes_grabbed = len(s.raw)
+        cv2.resize(bgra_view(s), self.res, dst=self.frame, interpolation=cv2.INTER_AREA)
+        return self.frame
+
+class BandCapture:
+    def __init__(self, sct, monitor, depth, res=RES, margin=1):
+        self.sct = sct
+        self.monitor = monitor
+        self.res = res
+        self.bytes_grabbed = 0
+        w, h = res
+        W, H = monitor["width"], monitor["height"]
+        # band sizes in RES space, matching the sampler's band edges
+        bt, bb = min(max(1, int(h * depth)) + margin, h), min(int(h * depth) + margin, h)
+        bl, br = min(int(w * depth) + margin, w), min(int(w * depth) + margin, w)
+        nt, nb = round(bt * H / h), round(bb * H / h)
+        nl, nr = round(bl * W / w), round(br * W / w)
+        L, T = monitor["left"], monitor["top"]
+        # top/bottom strips run the full width; side strips only fill the gap between them
+        regions = [
+            ((L, T, W, nt), np.s_[0:bt, :]),
+            ((L, T + H - nb, W, nb), np.s_[h - bb:h, :]),
+            ((L, T + nt, nl, H - nt - nb), np.s_[bt:h - bb, 0:bl]),
+            ((L + W - nr, T + nt, nr, H - nt - nb), np.s_[bt:h - bb, w - br:w]),
+        ]
+        self.regions = []
+        for (x, y, rw, rh), dst in regions:
+            if rw <= 0 or rh <= 0:
+                continue
+            self.regions.append(({"left": x, "top": y, "width": rw, "height": rh}, dst))
+        self.frame = np.zeros((h, w, 4), dtype=np.uint8)
+        self.mask = np.zeros((h, w), dtype=bool)
+        for _, dst in self.regions:
+            self.mask[dst] = True
+        # side bands are strided views of the frame, so resize into contiguous scratch first
+        self._scratch = [np.empty(self.frame[dst].shape, dtype=np.uint8) for _, dst in self.regions]
+
+    def grab(self):
+        n = 0
+        for (region, dst), buf in zip(self.regions, self._scratch):
+            s = self.sct.grab(region)
+            n += len(s.raw)
+            cv2.resize(bgra_view(s), (buf.shape[1], buf.shape[0]), dst=buf, interpolation=cv2.INTER_AREA)
+            np.copyto(self.frame[dst], buf)
+        self.bytes_grabbed = n
+        return self.frame
+
+def open_capture(mode, sct, monitor, depth, res=RES):
+    if mode == "band":
+        return BandCapture(sct, monitor, depth, res)
+    return FullFrameCapture(sct, monitor, res)
+
+class IdleThrottle:
+    # update(frame) after every grab returns the interval until the next one
+    def __init__(self, fps, idle_fps=2.0, idle_after=30, threshold=2.0, thumb=(16, 16)):
+        self.interval = 1.0 / fps
+        self.idle_interval = 1.0 / idle_fps if idle_fps > 0 else self.interval
+        self.idle_after = idle_after
+        self.threshold = threshold
+        self.thumb_size = thumb
+        self._thumb = None
+        self._prev = None
+        self._diff = None
+        self.still = 0
+        self.idle = False
+        self.enabled = True
+        self.grabs = self.idle_grabs = self.wakes = 0
+        self.skipped = 0.0
+        self.wake_gaps = []
+        self._last_t = None
+
+    def changed(self, frame):
+        # largest colour change between this thumbnail and the previous one
+        self._thumb = cv2.resize(frame[:, :, :3], self.thumb_size, dst=self._thumb, interpolation=cv2.INTER_AREA)
+        if self._prev is None:
+            self._prev = self._thumb.copy()
+            return True
+        self._diff = cv2.absdiff(self._thumb, self._prev, dst=self._diff)
+        np.copyto(self._prev, self._thumb)
+        return int(self._diff.max()) >= self.threshold
+
+    def update(self, frame, now=None):
+        now = time.perf_counter() if now is None else now
+        gap = now - self._last_t if self._last_t is not None else 0.0
+        self._last_t = now
+        self.grabs += 1
+        if self.changed(frame) or not self.enabled:
+            if self.idle:
+                self.wakes += 1
+                # motion started somewhere in the last idle gap
+                self.wake_gaps.append(gap)
+                del self.wake_gaps[:-100]
+            self.still = 0
+            self.idle = False
+            return self.interval
+        self.still += 1
+        if self.still >= self.idle_after:
+            if self.idle:
+                self.idle_grabs += 1
+                self.skipped += self.idle_interval / self.interval - 1.0
+            self.idle = True
+            return self.idle_interval
+        return self.interval
+
+    def stats(self, grab_ms=0.0):
+        # grab_ms: mean cost of one grab, to turn skipped grabs into time saved
+        gaps = self.wake_gaps or [0.0]
+        wall = (self.grabs + self.skipped) * self.interval
+        return {"idle": self.idle, "grabs": self.grabs, "skipped": int(self.skipped),
+                "saved": self.skipped / (self.grabs + self.skipped) if self.grabs else 0.0,
+                "saved_ms_per_s": self.skipped * grab_ms / wall if wall else 0.0,
+                "wakes": self.wakes, "wake_gap_ms": 1000.0 * sum(gaps) / len(gaps), "wake_gap_max_ms": 1000.0 * max(gaps)}
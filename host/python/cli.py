@@ -1,113 +1,280 @@
 import argparse, sys, time
 from datetime import datetime
-from mss import mss
-import numpy as np
 import cv2
 import serial
 from serial.tools import list_ports
-
-NUM_LEDS=60
-TOP_LEDS=19
-RIGHT_LEDS=11
-BOTTOM_LEDS=19
-LEFT_LEDS=11
-RES=(128,128)
+from layout import load_segments, load_devices
+from sampler import SparseSampler
+from capture import open_capture, IdleThrottle, RES
+from protocol import WindowedSender
+from color import to_uint8, TemporalFilter, ChangeGate
+from link import negotiate, LinkMonitor, RATES, BASE_BAUD
+from governor import FrameRateGovernor
+from timing import StageTimer
+from record import FrameRecorder, ReplayCapture
+from backends import BACKENDS, open_backend, select_backend
+from multimon import MultiMonitorCapture
+from devices import DeviceLink, DeviceGroup
 
 def find_port():
     ports=list_ports.comports()
     return ports[0].device if ports else None
 
-def sample_perimeter(img):
-    h,w,_=img.shape
-    c=[]
-    sw=w/TOP_LEDS
-    for i in range(TOP_LEDS):
-        x0=int(i*sw); x1=int((i+1)*sw); y1=max(1,int(h*0.12))
-        b=img[0:y1,x0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; c.append(tuple(int(x) for x in a))
-    sh=h/RIGHT_LEDS
-    for i in range(RIGHT_LEDS):
-        y0=int(i*sh); y1=int((i+1)*sh); x0=max(0,w-int(w*0.12))
-        b=img[y0:y1,x0:w]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; c.append(tuple(int(x) for x in a))
-    sw=w/BOTTOM_LEDS
-    btm=[]
-    for i in range(BOTTOM_LEDS):
-        x0=int(i*sw); x1=int((i+1)*sw); y0=max(0,h-int(h*0.12))
-        b=img[y0:h,x0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; btm.append(tuple(int(x) for x in a))
-    btm.reverse(); c+=btm
-    sh=h/LEFT_LEDS
-    lft=[]
-    for i in range(LEFT_LEDS):
-        y0=int(i*sh); y1=int((i+1)*sh); x1=min(int(w*0.12),w)
-        b=img[y0:y1,0:x1]; a=b.reshape(-1,3).mean(0) if b.size else [0,0,0]; lft.append(tuple(int(x) for x in a))
-    lft.reverse(); c+=lft
-    if len(c)<NUM_LEDS: c+=[(0,0,0)]*(NUM_LEDS-len(c))
-    return c[:NUM_LEDS]
-
 def formatted_now():
     return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
 def main():
     p=argparse.ArgumentParser()
-    p.add_argument('--port', '-p', default=None)
-    p.add_argument('--baud', '-b', type=int, default=115200)
-    p.add_argument('--fps', type=float, default=15.0)
+    p.add_argument('--port', '-p', nargs='+', default=None, help='several ports drive one controller each, split by the layout\'s devices list')
+    p.add_argument('--no-sync', action='store_true', help='with several ports, show frames as they arrive instead of latching them together')
+    p.add_argument('--sync-deadline', type=float, default=100.0, help='ms a latched frame waits for the slowest controller\'s ACK')
+    p.add_argument('--baud', '-b', type=int, default=BASE_BAUD, help='rate the port opens at; the firmware always boots at 115200')
+    p.add_argument('--link-rates', type=int, nargs='*', default=list(RATES), help='faster rates to negotiate, fastest first tried (none: stay at --baud)')
+    p.add_argument('--fps', type=float, default=15.0, help='starting frame rate (the only rate with --fixed-fps)')
+    p.add_argument('--min-fps', type=float, default=5.0)
+    p.add_argument('--max-fps', type=float, default=60.0)
+    p.add_argument('--fixed-fps', action='store_true', help='disable the link-aware frame-rate governor')
     p.add_argument('--noblur', action='store_true')
     p.add_argument('--verbose', '-v', action='store_true')
+    p.add_argument('--layout', '-l', default=None, help='LED layout JSON (default: layout.json); one with segments captures each monitor on its own thread')
+    p.add_argument('--capture', choices=['band','full'], default='band', help='grab only the edge bands or the whole monitor')
+    p.add_argument('--capture-backend', choices=['auto']+list(BACKENDS), default='auto', help='where pixels come from; auto times the live ones and keeps the fastest')
+    p.add_argument('--capture-input', default=None, help='video file for --capture-backend video, monitor count for synthetic')
+    p.add_argument('--capture-size', type=int, nargs=2, default=None, metavar=('W','H'), help='synthetic screen size, or resize video frames')
+    p.add_argument('--window', type=int, default=4, help='LED frames allowed in flight awaiting ACK')
+    p.add_argument('--legacy-ack', action='store_true', help='firmware without frame-id ACKs (0x55 frames)')
+    p.add_argument('--no-delta', action='store_true', help='always send full frames, never 0x58 deltas')
+    p.add_argument('--crc', action='store_true', help='CRC-16 frames (0x5B/0x5C) instead of the byte sum; for long strips')
+    p.add_argument('--no-smooth', action='store_true', help='disable the adaptive temporal filter')
+    p.add_argument('--threshold', type=float, default=2.0, help='skip frames whose largest LED change is below this (0: send all)')
+    p.add_argument('--keepalive', type=float, default=1.0, help='resend an unchanged frame after this many seconds')
+    p.add_argument('--idle-fps', type=float, default=2.0, help='capture rate while the screen is still (0: never idle)')
+    p.add_argument('--idle-after', type=int, default=30, help='unchanged frames before dropping to --idle-fps')
+    p.add_argument('--record', default=None, help='also write every captured frame to this file for --replay')
+    p.add_argument('--replay', default=None, help='capture from a --record file instead of the screen (no mss/display needed)')
+    p.add_argument('--replay-speed', type=float, default=1.0, help='replay pace relative to the recording (0: as fast as possible)')
+    p.add_argument('--replay-loop', action='store_true', help='start the recording over instead of stopping at its end')
+    p.add_argument('--timing', type=float, default=0.0, help='print per-stage p50/p99 times every this many seconds (0: off, no overhead)')
     args=p.parse_args()
-    port=args.port or find_port()
-    if not port:
+    ports=args.port or [find_port()]
+    if not ports[0]:
         print(f"{formatted_now()} No COM port found. Use --port to specify.")
         sys.exit(1)
+    sers=[]
     try:
-        ser=serial.Serial(port, args.baud, timeout=1)
+        for port in ports:
+            sers.append(serial.Serial(port, args.baud, timeout=1))
     except Exception as e:
         print(f"{formatted_now()} Failed to open serial: {e}")
         sys.exit(1)
-    interval=1.0/args.fps
+    ser=sers[0]
+    throttle=IdleThrottle(args.fps,args.idle_fps,args.idle_after)
+    try:
+        segments=load_segments(args.layout)
+    except Exception as e:
+        print(f"{formatted_now()} Bad layout: {e}")
+        sys.exit(1)
+    layout=segments[0][1]
+    num_leds=sum(l.num_leds for _,l in segments)
+    if len(segments)>1 and (args.record or args.replay):
+        print(f"{formatted_now()} --record/--replay need a single-monitor layout")
+        sys.exit(1)
+    counts=[num_leds]
+    if len(sers)>1:
+        try:
+            counts=load_devices(args.layout,segments)
+        except Exception as e:
+            print(f"{formatted_now()} Bad layout: {e}")
+            sys.exit(1)
+        if len(counts)!=len(sers) or sum(counts)!=num_leds:
+            print(f"{formatted_now()} {len(sers)} ports need a layout devices list of {len(sers)} LED counts adding up to {num_leds}, got {counts}")
+            sys.exit(1)
+    sampler=SparseSampler(layout)
+    links=[None]*len(sers)
+    if args.crc and args.legacy_ack:
+        print(f"{formatted_now()} --crc needs frame-id ACKs, drop --legacy-ack")
+        sys.exit(1)
+    if args.link_rates and not args.legacy_ack:
+        for i,s in enumerate(sers):
+            try:
+                rate=negotiate(s,args.link_rates)
+                links[i]=LinkMonitor(s,args.link_rates)
+                if args.verbose:
+                    print(f"{formatted_now()} {s.port}: link at {rate} baud" if rate else f"{formatted_now()} {s.port}: firmware does not negotiate, staying at {s.baudrate} baud")
+            except Exception as e:
+                print(f"{formatted_now()} {s.port}: link negotiation failed: {e}")
+    link=links[0]
+    group=None
+    if len(sers)>1:
+        # one writer thread per controller, each with its own sender and link monitor
+        devs,a=[],0
+        for s,n,lm in zip(sers,counts,links):
+            devs.append(DeviceLink(s,a,a+n,args.window,id_acks=not args.legacy_ack,delta=not args.no_delta,crc=args.crc,link=lm))
+            a+=n
+        group=DeviceGroup(devs,not args.no_sync,args.sync_deadline/1000.0)
+        unsynced=group.start()
+        if not args.no_sync and unsynced:
+            print(f"{formatted_now()} No latch on "+", ".join(d.port for d in unsynced)+", so no controller holds frames; all show them as they arrive")
+        link=None
+        sender=None
+    else:
+        new_sender=lambda: WindowedSender(ser,num_leds,args.window,id_acks=not args.legacy_ack,delta=not args.no_delta,crc=args.crc)
+        sender=new_sender()
+    smooth=None if args.no_smooth else TemporalFilter()
+    gate=ChangeGate(args.threshold,args.keepalive)
+    governor=None if args.fixed_fps or group else FrameRateGovernor(ser,args.fps,args.min_fps,args.max_fps,args.window,num_leds*3+4)
+    # with several controllers each link gets a governor and the slowest sets the pace
+    governors=[] if args.fixed_fps or not group else [FrameRateGovernor(d.ser,args.fps,args.min_fps,args.max_fps,args.window,d.num_leds*3+4) for d in group.links]
+    timer=StageTimer(args.timing>0,max(args.timing,1.0))
+    next_report=time.perf_counter()+args.timing
     sct=None
+    recorder=None
+    cap=None
+    multi=None
     try:
-        sct=mss()
-        monitor=sct.monitors[1]
+        if len(segments)>1:
+            name=args.capture_backend
+            if name=='auto':
+                name,probe,times=select_backend(args.capture,layout.depth,RES,monitor=segments[0][0])
+                probe.close()
+                if args.verbose:
+                    print(f"{formatted_now()} Capture backend {name} ("+", ".join(f"{k} {v:.1f} ms" if isinstance(v,float) else f"{k}: {v}" for k,v in times.items())+")")
+            # every worker opens its own backend instance on its own thread
+            multi=MultiMonitorCapture(segments,name,args.capture,RES,not args.noblur,args.capture_input,args.capture_size,timer)
+            multi.start()
+            if args.verbose:
+                print(f"{formatted_now()} Capturing monitors "+", ".join(f"{m} ({l.num_leds} LEDs)" for m,l in segments))
+        elif args.replay:
+            cap=ReplayCapture(args.replay,args.replay_speed,args.replay_loop)
+            monitor=cap.recording.monitor
+        else:
+            if args.capture_backend=='auto':
+                name,sct,times=select_backend(args.capture,layout.depth,RES)
+                if args.verbose:
+                    print(f"{formatted_now()} Capture backend {name} ("+", ".join(f"{k} {v:.1f} ms" if isinstance(v,float) else f"{k}: {v}" for k,v in times.items())+")")
+            else:
+                sct=open_backend(args.capture_backend,args.capture_input,args.capture_size)
+            if not 0<segments[0][0]<len(sct.monitors):
+                raise ValueError(f"monitor {segments[0][0]} not found, {len(sct.monitors)-1} attached")
+            monitor=sct.monitors[segments[0][0]]
+            cap=open_capture(args.capture,sct,monitor,layout.depth)
+        if args.record:
+            recorder=FrameRecorder(args.record,cap.res,cap.mask,monitor)
+        blurred=None
+        grab_ms=None
         next_frame = time.perf_counter()
         while True:
             now = time.perf_counter()
-            if now < next_frame:
+            if now < next_frame and not args.replay:
+                # a replay keeps the recording's own pace
                 time.sleep(next_frame - now)
                 now = time.perf_counter()
             t_frame_start = now
-            s=sct.grab(monitor)
-            img=np.array(s)[:,:,:3]
-            img=cv2.cvtColor(img,cv2.COLOR_BGR2RGB)
-            small=cv2.resize(img,RES,interpolation=cv2.INTER_AREA)
-            if not args.noblur:
-                small=cv2.GaussianBlur(small,(3,3),0)
-            colors=sample_perimeter(small)
-            data=bytearray()
-            for r,g,b in colors:
-                data.extend([r&0xFF,g&0xFF,b&0xFF])
-            try:
-                ser.write(data)
-            except Exception as e:
-                if args.verbose:
-                    print(f"{formatted_now()} Serial write error: {e}")
+            timer.begin()
+            if multi:
+                # the monitors grab and sample in parallel on this tick; wait at most a frame for the slowest
+                colors=multi.frame(throttle.interval)
+                timer.lap('capture')
+                grab_ms=(time.perf_counter()-t_frame_start)*1000.0 if grab_ms is None else grab_ms*0.9+(time.perf_counter()-t_frame_start)*100.0
+                # no single frame to watch, so idle detection looks at the merged LED colours
+                interval=throttle.update(colors[None])
+                timer.lap('idle')
+            else:
+                small=cap.grab()
+                timer.lap('capture')
+                if recorder:
+                    recorder.append(small,t_frame_start)
+                grab_ms=(time.perf_counter()-t_frame_start)*1000.0 if grab_ms is None else grab_ms*0.9+(time.perf_counter()-t_frame_start)*100.0
+                interval=throttle.update(small)
+                timer.lap('idle')
+                if not args.noblur:
+                    blurred=cv2.GaussianBlur(small,(3,3),0,dst=blurred)
+                    small=blurred
+                    timer.lap('blur')
+                colors=sampler.sample(small,bgr=True)
+                timer.lap('sample')
+            if smooth:
+                colors=to_uint8(smooth(colors))
+                timer.lap('smooth')
+            work_ms=(time.perf_counter()-t_frame_start)*1000.0
+            if gate.send(colors):
+                timer.lap('gate')
+                if group:
+                    # every controller writes its slice on its own thread, then all show together
+                    group.send(colors)
+                elif sender.send(colors) is None and args.verbose:
+                    print(f"{formatted_now()} Serial write error")
+                timer.lap('send')
+                if timer.enabled and sender:
+                    # where send() went: waiting for an ACK slot, encoding, writing
+                    for k,v in sender.timing.items():
+                        timer.add('ack wait' if k=='wait' else k,v)
+            else:
+                timer.lap('gate')
+            if governor:
+                throttle.interval=1.0/governor.update(sender.stats(),work_ms)
+            if governors:
+                throttle.interval=1.0/min(g.update(d.sender.stats(),work_ms) for g,d in zip(governors,group.links))
+            if link and link.check(sender.stats()):
+                # too many NAKs/timeouts: stop the sender's reader so the probes get their replies, step down
+                if sender.close():
+                    rate=link.step_down()
+                    if args.verbose:
+                        print(f"{formatted_now()} Link errors, now at {rate} baud")
+                elif args.verbose:
+                    print(f"{formatted_now()} Link errors, but the reader did not stop; staying at {ser.baudrate} baud")
+                sender=new_sender()
+                gate.reset()
+            timer.lap('control')
+            if timer.enabled and time.perf_counter()>=next_report:
+                next_report=time.perf_counter()+args.timing
+                print(f"{formatted_now()} p50/p99 ms  {timer.format()}")
+                if multi:
+                    print(f"{formatted_now()} grab/busy  {multi.summary()}")
             if args.verbose:
                 elapsed_ms = (time.perf_counter() - t_frame_start) * 1000.0
-                print(f"{formatted_now()} frame time {elapsed_ms:.1f} ms")
+                if group:
+                    print(f"{formatted_now()} frame time {elapsed_ms:.1f} ms  {group.summary()}  held {gate.suppressed_fraction()*100:.0f}%{'  idle' if throttle.idle else ''}")
+                else:
+                    st = sender.stats()
+                    print(f"{formatted_now()} frame time {elapsed_ms:.1f} ms  acked {st['acked']}/{st['sent']} nak {st['nacked']} lost {st['expired']} rtt {st['rtt_ms']:.1f} ms  wire {st['bytes_sent']}/{st['bytes_full']} B  held {gate.suppressed_fraction()*100:.0f}%{'  idle' if throttle.idle else ''}")
+                if governor and governor.metrics:
+                    g=governor.metrics
+                    print(f"{formatted_now()}   governor {g['fps']:.1f} fps ({g['reason']})  wire {g['wire_ms']:.1f} ms/frame  queued {g['out_waiting']} B  errors {g['error_rate']*100:.1f}%")
             next_frame += interval
             if next_frame < time.perf_counter():
                 next_frame = time.perf_counter() + interval
     except KeyboardInterrupt:
         if args.verbose:
             print(f"{formatted_now()} Stopping on keyboard interrupt")
+            st=throttle.stats(grab_ms or 0.0)
+            print(f"{formatted_now()} Idle capture skipped {st['skipped']} grabs ({st['saved']*100:.0f}%, {st['saved_ms_per_s']:.1f} ms/s), {st['wakes']} wakes, wake gap {st['wake_gap_ms']:.0f} ms avg {st['wake_gap_max_ms']:.0f} ms max")
+    except EOFError:
+        st=cap.stats()
+        print(f"{formatted_now()} Replay finished: {st['frames']} frames in {st['seconds']:.1f} s ({st['fps']:.1f} fps), at most {st['behind_ms']:.0f} ms behind")
     except Exception as e:
         print(f"{formatted_now()} Error: {e}")
     finally:
         try:
             if sct: sct.close()
         except: pass
-        try:
-            ser.close()
-        except: pass
+        if multi:
+            multi.close()
+            print(f"{formatted_now()} Monitors: {multi.summary()}")
+        if recorder:
+            recorder.close()
+            print(f"{formatted_now()} Recorded {recorder.count} frames to {args.record} ({recorder.bytes_per_frame()/1024:.1f} KB/frame)")
+        if args.replay and cap:
+            cap.close()
+        if group:
+            group.close()
+            print(f"{formatted_now()} Controllers: {group.summary()}")
+        if sender:
+            sender.close()
+        for s in sers:
+            try:
+                s.close()
+            except: pass
 
 if __name__=='__main__':
     main()
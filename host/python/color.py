@@ -0,0 +1,263 @@
+"""
+LED colour post-processing on (N,3) arrays.
+- to_float / to_uint8: enter and leave the float32 0..255 working domain
+- audio_boost: per-LED gain from the audio levels
+- enhance: highlight compression, saturation/contrast in HSV, gamma
+- brightness: global scale, rounded
+- TemporalFilter: per-LED EMA whose alpha grows with the size of the change
+- ChangeGate: decides whether a frame differs enough from the last sent one
+Each stage takes and returns the working array, so a frame's post-process is
+  to_uint8(enhance(audio_boost(to_float(colors), levels, sens)))
+Hue is untouched by enhance, so the HSV round trip reduces to rescaling each
+channel's position between the pixel's min and max; colorsys gives the same
+result to within float rounding.
+EnhanceLUT bakes enhance() into a table for its current parameters, so the
+per-frame cost is a gather whatever the colour math costs; tables are cached
+on disk under a hash of the parameters and rebuilt lazily when they change.
+Only the LUT_KEEP most recently used tables stay on disk (a 256 table is 48 MB).
+"""
+
+import hashlib, json, os, threading, time
+import numpy as np
+from layout import CACHE_DIR, prune_cache
+
+LUMA = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+ENHANCE = {"sat_boost": 1.35, "contrast": 1.12, "highlight": 200.0, "highlight_strength": 0.75, "gamma": 1.06}
+LUT_VERSION = 1
+LUT_KEEP = 4
+
+def to_float(colors):
+    return np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+
+def to_uint8(c):
+    # truncates like int(); c is already clipped to 0..255 by every stage
+    return np.clip(c, 0, 255).astype(np.uint8)
+
+def audio_boost(c, levels, sens):
+    # LED i scaled by 1 + sens * levels[i], missing levels count as silence
+    n = len(c)
+    lv = np.zeros(n, dtype=np.float32)
+    k = min(n, len(levels))
+    lv[:k] = levels[:k]
+    scale = 1.0 + np.float32(sens) * lv
+    return np.minimum(np.floor(c * scale[:, None]), 255.0)
+
+def enhance(c, sat_boost=ENHANCE["sat_boost"], contrast=ENHANCE["contrast"], highlight=ENHANCE["highlight"],
+            highlight_strength=ENHANCE["highlight_strength"], gamma=ENHANCE["gamma"]):
+    x = c * np.float32(1.0 / 255.0)
+    # pull down anything brighter than `highlight`, by at most 75%
+    t = highlight / 255.0
+    lum = x @ LUMA
+    f = np.maximum(0.25, 1.0 - (lum - t) * np.float32(highlight_strength / (1.0 - t)))
+    x *= np.where(lum > t, f, np.float32(1.0))[:, None]
+    mx = x.max(axis=1)
+    mn = x.min(axis=1)
+    span = mx - mn
+    s = np.minimum(1.0, np.divide(span, mx, out=np.zeros_like(mx), where=mx > 0) * np.float32(sat_boost))
+    v = np.clip((0.5 + np.float32(contrast) * (mx - 0.5)) * np.float32(0.98), 0.0, 1.0)
+    # channel = v * (1 - s * (1 - pos)), pos = where the channel sits between min and max
+    pos = np.divide(x - mn[:, None], span[:, None], out=np.zeros_like(x), where=span[:, None] > 0)
+    out = v[:, None] * (1.0 - s[:, None] * (1.0 - pos))
+    np.clip(out, 0.0, 1.0, out=out)
+    np.power(out, np.float32(gamma), out=out)
+    out *= np.float32(255.0)
+    return out
+
+def brightness(c, level):
+    # level 0..1, rounded half-to-even like round()
+    return np.clip(np.rint(c * np.float32(level)), 0, 255)
+
+def perceptual_delta(a, b):
+    # per-LED "redmean" colour distance, scaled so a 1-level grey step is 1.0
+    d = a - b
+    rmean = (a[:, 0] + b[:, 0]) * np.float32(0.5 / 256.0)
+    d *= d
+    return np.sqrt((2.0 + rmean) * d[:, 0] + 4.0 * d[:, 1] + (3.0 - rmean) * d[:, 2]) * np.float32(1.0 / 3.0)
+
+class TemporalFilter:
+    # alpha runs from `alpha` for changes near zero up to 1 at `snap` or more,
+    # so sensor-like noise is damped while scene cuts land in one frame
+    def __init__(self, alpha=0.3, snap=40.0):
+        self.alpha = float(alpha)
+        self.snap = float(snap)
+        self.state = None
+
+    def reset(self):
+        self.state = None
+
+    def __call__(self, c):
+        if self.state is None or self.state.shape != c.shape:
+            self.state = np.array(c, dtype=np.float32)
+            return self.state.copy()
+        y = self.state
+        x = np.asarray(c, dtype=np.float32)
+        a = self.alpha + (1.0 - self.alpha) * np.minimum(perceptual_delta(x, y) * np.float32(1.0 / self.snap), 1.0)
+        y += a[:, None] * (x - y)
+        # land exactly on the target once within half a level, so truncation
+        # never leaves an LED one step short forever
+        np.copyto(y, x, where=np.abs(x - y) < 0.5)
+        return y.copy()
+
+class ChangeGate:
+    # send() when the largest per-LED change since the last sent frame reaches
+    # `threshold` (perceptual_delta units), or `keepalive` seconds have passed
+    def __init__(self, threshold=2.0, keepalive=1.0):
+        self.threshold = float(threshold)
+        self.keepalive = float(keepalive)
+        self.last = None
+        self.last_t = 0.0
+        self.frames = 0
+        self.suppressed = 0
+
+    def reset(self):
+        self.last = None
+
+    def send(self, colors, now=None):
+        now = time.perf_counter() if now is None else now
+        c = np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+        self.frames += 1
+        if (self.last is not None and self.last.shape == c.shape and now - self.last_t < self.keepalive
+                and self.threshold > 0 and perceptual_delta(c, self.last).max() < self.threshold):
+            self.suppressed += 1
+            return False
+        self.last = c
+        self.last_t = now
+        return True
+
+    def suppressed_fraction(self):
+        return self.suppressed / self.frames if self.frames else 0.0
+
+class EnhanceLUT:
+    # size 256: exact (256^3,3) uint8 table, 48 MB, memory-mapped from the cache
+    # smaller sizes: float grid of size^3 points, interpolated trilinearly
+    # Until the table for the current parameters is ready (a 256 build takes a
+    # few seconds) frames go through enhance() directly while a background
+    # thread loads or builds it, so a slider move never stalls the pipeline.
+    # Tables built that way stay in memory until save(), so dragging a slider
+    # does not write a 48 MB file for every value it passes.
+    def __init__(self, size=256, **params):
+        if not 2 <= size <= 256:
+            raise ValueError("LUT size must be between 2 and 256")
+        self.size = int(size)
+        self.params = dict(ENHANCE)
+        self.table = None
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._loading = None
+        self._unsaved = None
+        n = self.size
+        self._corners = np.array([dr * n * n + dg * n + db for dr in (0, 1) for dg in (0, 1) for db in (0, 1)])
+        self.update(**params)
+
+    def update(self, **params):
+        # cheap when nothing changed; otherwise the table reloads on next use
+        unknown = set(params) - set(ENHANCE)
+        if unknown:
+            raise TypeError(f"unknown enhance parameter(s): {', '.join(sorted(unknown))}")
+        p = dict(self.params, **{k: float(v) for k, v in params.items()})
+        if p != self.params:
+            with self._lock:
+                self.params = p
+                self.table = None
+
+    def key(self, params=None):
+        d = dict(params or self.params, size=self.size, version=LUT_VERSION)
+        return hashlib.sha1(json.dumps(d, sort_keys=True).encode()).hexdigest()[:16]
+
+    def build(self, params=None):
+        params = params or self.params
+        self.builds += 1
+        if self.size == 256:
+            # one red plane at a time keeps the float temporaries small
+            out = np.empty((256, 65536, 3), dtype=np.uint8)
+            gb = np.stack(np.meshgrid(np.arange(256), np.arange(256), indexing='ij'), -1).reshape(-1, 2)
+            plane = np.empty((65536, 3), dtype=np.float32)
+            plane[:, 1:] = gb
+            for r in range(256):
+                plane[:, 0] = r
+                out[r] = to_uint8(enhance(plane, **params))
+            return out.reshape(-1, 3)
+        axis = np.linspace(0.0, 255.0, self.size, dtype=np.float32)
+        grid = np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), -1).reshape(-1, 3)
+        return enhance(grid, **params).astype(np.float32)
+
+    def load(self, params=None, save=True):
+        # table for params (default: current), from the disk cache or built
+        params = dict(params or self.params)
+        path = os.path.join(CACHE_DIR, f"lut-{self.key(params)}.npy")
+        try:
+            t = np.load(path, mmap_mode='r' if self.size == 256 else None)
+            # mtime marks the last use, for prune_cache()
+            os.utime(path)
+        except Exception:
+            t = self.build(params)
+            if save:
+                self._write(path, t)
+            else:
+                with self._lock:
+                    self._unsaved = (params, path, t)
+        with self._lock:
+            if params == self.params:
+                self.table = t
+        return t
+
+    def _write(self, path, t):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = path + f".{os.getpid()}.tmp.npy"
+            np.save(tmp, t)
+            os.replace(tmp, path)
+            prune_cache("lut-", ".npy", path, LUT_KEEP)
+        except Exception:
+            pass
+
+    def save(self):
+        # write the last background-built table to the cache if it is still the current one
+        with self._lock:
+            u, self._unsaved = self._unsaved, None
+            if u is None or u[0] != self.params:
+                return False
+        self._write(u[1], u[2])
+        return True
+
+    def _load_async(self):
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return
+            params = dict(self.params)
+            self._loading = threading.Thread(target=self._load_loop, args=(params,), daemon=True)
+            self._loading.start()
+
+    def _load_loop(self, params):
+        # keep going until the table matches the latest parameters
+        while True:
+            try:
+                self.load(params, save=False)
+            except Exception:
+                return
+            with self._lock:
+                if params == self.params:
+                    return
+                params = dict(self.params)
+
+    def ready(self):
+        return self.table is not None
+
+    def __call__(self, c):
+        t = self.table
+        if t is None:
+            self._load_async()
+            return enhance(c, **self.params)
+        if self.size == 256:
+            i = c.astype(np.intp)
+            return t[(i[:, 0] << 16) | (i[:, 1] << 8) | i[:, 2]]
+        n = self.size
+        p = c * np.float32((n - 1) / 255.0)
+        i0 = np.minimum(p.astype(np.intp), n - 2)
+        f = p - i0
+        g = 1.0 - f
+        # weights of the 8 surrounding grid points, in _corners order
+        w = (np.stack((g[:, 0], f[:, 0]), 1)[:, :, None, None] * np.stack((g[:, 1], f[:, 1]), 1)[:, None, :, None]
+             * np.stack((g[:, 2], f[:, 2]), 1)[:, None, None, :]).reshape(-1, 8)
+        base = (i0[:, 0] * n + i0[:, 1]) * n + i0[:, 2]
+        return np.einsum('nk,nkc->nc', w, t[base[:, None] + self._corners])
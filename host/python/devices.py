@@ -0,0 +1,255 @@
+"""
+Several LED controllers driven as one strip, one serial port each.
+- DeviceLink: one port with its own WindowedSender and writer thread; it
+  drives LEDs [a, b) of the merged frame and steps its own baud rate down
+  through an optional LinkMonitor
+- DeviceGroup.send(colors) hands every link its slice through a LatestSlot,
+  so the links write in parallel and a slow one only drops its own frames
+- sync=True: every device is told to hold accepted frames (0x5E hold). A
+  coordinator thread waits until each held link has its slice ACKed, then
+  writes a 0x5E show to all of them back to back, so all strips change
+  together. If any held link is late at the deadline, no device gets a show
+  and they all keep the previous frame (the frame counts as partial); send()
+  never waits for this. If any device does not confirm the hold (firmware
+  without 0x5E), all-or-none cannot hold for the group: the others are
+  released and every device shows frames as they arrive.
+- A held link is stop-and-wait: the device stages one frame, so the link
+  sends its next frame only after its last one was ACKed and shown or
+  dropped. The window only pipelines frames on links that are not held.
+Per link: frames and bytes per second, ACK/NAK/expiry counts, the ACK round
+trip, latch replies and the show time.
+"""
+
+import threading, time
+import numpy as np
+from protocol import WindowedSender, LATCH_SHOW, LATCH_HOLD, LATCH_RELEASE
+from pipeline import LatestSlot
+
+COUNTS = ("sent", "acked", "nacked", "expired", "bytes_sent", "latched", "latch_failed")
+
+class DeviceLink(threading.Thread):
+    def __init__(self, ser, a, b, window=4, id_acks=True, delta=True, crc=False, link=None):
+        super().__init__(name=f"device {getattr(ser, 'port', a)}", daemon=True)
+        self.ser = ser
+        self.port = getattr(ser, 'port', None)
+        self.leds = (a, b)
+        self.num_leds = b - a
+        self.new_sender = lambda: WindowedSender(ser, b - a, window, id_acks=id_acks, delta=delta, crc=crc)
+        self.sender = self.new_sender()
+        self.link = link
+        self.slot = LatestSlot()
+        self.report = None  # report(tick, fid or None), set by the group
+        self.taken = 0  # tick of the frame being sent
+        self.synced = False
+        self.running = True
+        self.error = None
+        self.frames = self.skipped = self.steps = 0
+        self.prior = dict.fromkeys(COUNTS, 0)
+        self.t0 = None
+
+    def hold(self, timeout=0.5):
+        # True when the device confirms it holds frames for a show
+        seq = self.sender.latch(LATCH_HOLD, 0)
+        self.synced = seq is not None and self.sender.wait_latch(seq, timeout) is True
+        return self.synced
+
+    def show(self, fid):
+        return self.sender.latch(LATCH_SHOW, fid) is not None
+
+    def run(self):
+        while self.running:
+            item = self.slot.get(0.1)
+            if item is None:
+                continue
+            tick, colors, deadline = item
+            self.taken = tick
+            if self.t0 is None:
+                self.t0 = time.perf_counter()
+            try:
+                fid = self.sender.send(colors)
+                # a held frame is only worth a show once the device has it
+                if fid is not None and self.synced and not self.sender.wait_frame(fid, deadline):
+                    fid = None
+                if self.link and self.link.check(self.sender.stats()):
+                    self._step_down()
+                    fid = None
+            except Exception as e:
+                self.error = e
+                fid = None
+            self.frames += 1
+            if self.report is not None:
+                # a held link waits here until the group has shown or dropped the frame
+                self.report(tick, fid)
+
+    def _step_down(self):
+        # the sender's reader would swallow the probe replies, so it goes first
+        st = self.sender.stats()
+        for k in COUNTS:
+            self.prior[k] += st[k]
+        if self.sender.close():
+            self.link.step_down()
+            self.steps += 1
+        self.sender = self.new_sender()
+        if self.synced:
+            self.hold()
+
+    def stats(self):
+        st = self.sender.stats()
+        el = time.perf_counter() - self.t0 if self.t0 is not None else 0.0
+        out = {k: st[k] + self.prior[k] for k in COUNTS}
+        out.update({"port": self.port, "leds": self.num_leds, "rate": getattr(self.ser, "baudrate", None),
+                    "frames": self.frames, "fps": out["sent"] / el if el else 0.0,
+                    "kB_s": out["bytes_sent"] / el / 1000.0 if el else 0.0, "rtt_ms": st["rtt_ms"],
+                    "latch_ms": st["latch_ms"], "dropped": self.slot.drops, "skipped": self.skipped,
+                    "synced": self.synced, "steps": self.steps, "error": str(self.error) if self.error else None})
+        return out
+
+    def stop(self):
+        self.running = False
+        self.slot.close()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(1.0)
+        if self.synced:
+            # back to showing frames as they arrive, for whoever opens the port next
+            self.sender.latch(LATCH_RELEASE, 0)
+
+    def close(self):
+        self.stop()
+        self.sender.close()
+
+class DeviceGroup:
+    def __init__(self, links, sync=True, deadline=0.25):
+        # links: DeviceLinks covering the frame in order; deadline: seconds a
+        # synced frame waits for the slowest ACK
+        self.links = links
+        self.sync = sync
+        self.deadline = deadline
+        self.num_leds = max(l.leds[1] for l in links)
+        self.tick = self.decided = 0
+        self.end = 0.0
+        self.done = [(0, None)] * len(links)
+        self._cond = threading.Condition()
+        self.running = False
+        self.coordinator = None
+        self.frames = self.shown = self.partial = 0
+        self.spread = self.spread_max = 0.0
+        self.t0 = None
+
+    def start(self, timeout=0.5):
+        # returns the links that did not confirm the hold; with any of them
+        # the group falls back to no sync at all
+        requested = self.sync
+        self.running = True
+        for i, l in enumerate(self.links):
+            l.report = lambda tick, fid, i=i: self._report(i, tick, fid)
+            if self.sync:
+                l.hold(timeout)
+        missing = [l for l in self.links if not l.synced]
+        if self.sync and missing:
+            # a device showing frames as they arrive would tear against the held ones
+            for l in self.links:
+                if l.synced:
+                    l.synced = False
+                    l.sender.latch(LATCH_RELEASE, 0)
+            self.sync = False
+        if any(l.synced for l in self.links):
+            self.coordinator = threading.Thread(target=self._coordinate, name="device group", daemon=True)
+            self.coordinator.start()
+        for l in self.links:
+            l.start()
+        return missing if requested else []
+
+    def _report(self, i, tick, fid):
+        with self._cond:
+            self.done[i] = (tick, fid)
+            self._cond.notify_all()
+            # its next frame would replace the one the device holds for the show
+            while self.links[i].synced and self.running and self.decided < tick:
+                self._cond.wait(0.1)
+
+    def send(self, colors, deadline=None):
+        # returns the frame's tick at once; the show happens on the coordinator
+        now = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = now
+        c = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+        with self._cond:
+            self.tick += 1
+            tick = self.tick
+            self.end = now + (self.deadline if deadline is None else deadline)
+            end = self.end
+            self._cond.notify_all()
+        for l in self.links:
+            a, b = l.leds
+            # a copy: the caller may reuse colors before the writer gets to it
+            l.slot.put((tick, c[a:b].copy(), end))
+        self.frames += 1
+        return tick
+
+    def _coordinate(self):
+        synced = [i for i, l in enumerate(self.links) if l.synced]
+        while True:
+            with self._cond:
+                while self.running and self.tick <= self.decided:
+                    self._cond.wait(0.1)
+                if not self.running:
+                    return
+                # always the newest frame: older ones were replaced in the slots
+                tick, end = self.tick, self.end
+                while True:
+                    # a link that took a newer frame, or will, never reports this one
+                    late = [i for i in synced if self.done[i][0] != tick]
+                    gone = self.tick > tick and any(self.links[i].taken != tick for i in late)
+                    left = end - time.perf_counter()
+                    if not late or gone or left <= 0 or not self.running:
+                        break
+                    self._cond.wait(left)
+                fids = [self.done[i][1] for i in synced]
+            # all or none: a show to only some devices would tear the image
+            whole = not late and None not in fids
+            if whole:
+                t = time.perf_counter()
+                for i, fid in zip(synced, fids):
+                    self.links[i].show(fid)
+                # how far apart the first and last show left the host
+                spread = time.perf_counter() - t
+                self.spread = spread if not self.spread else self.spread * 0.9 + spread * 0.1
+                self.spread_max = max(self.spread_max, spread)
+            with self._cond:
+                if whole:
+                    self.shown += 1
+                else:
+                    self.partial += 1
+                    for i in synced:
+                        self.links[i].skipped += 1
+                self.decided = tick
+                self._cond.notify_all()
+
+    def stats(self):
+        el = time.perf_counter() - self.t0 if self.t0 is not None else 0.0
+        return {"frames": self.frames, "fps": self.frames / el if el else 0.0, "shown": self.shown,
+                "partial": self.partial, "spread_ms": self.spread * 1000.0, "spread_max_ms": self.spread_max * 1000.0,
+                "devices": [l.stats() for l in self.links]}
+
+    def summary(self):
+        st = self.stats()
+        devs = ", ".join(f"{d['port']} {d['rate']} baud {d['fps']:.0f} fps {d['kB_s']:.1f} kB/s "
+                         f"acked {d['acked']}/{d['sent']} rtt {d['rtt_ms']:.1f} ms"
+                         + (f" latched {d['latched']} skipped {d['skipped']}" if d["synced"] else " unsynced")
+                         + (f" ({d['error']})" if d["error"] else "") for d in st["devices"])
+        held = f", {st['shown']} shown together, {st['partial']} partial" if self.coordinator else ""
+        return f"{devs}; {st['fps']:.1f} fps{held}"
+
+    def close(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        if self.coordinator is not None:
+            self.coordinator.join(1.0)
+        # every writer stops before any reader is joined, so their read timeouts overlap
+        for l in self.links:
+            l.stop()
+        for l in self.links:
+            l.sender.running = False
+        for l in self.links:
+            l.sender.close()
@@ -0,0 +1,275 @@
+"""
+SyncLED device emulator on a pseudo-terminal (Linux/macOS).
+- parses with protocol.StreamDecoder, so header sync, frame ids, checksums,
+  deltas, the 200 ms byte timeout and the A/N, s/n, B/b, P/p, L/l replies follow
+  SyncLED.ino (firmware='syncled') or test/test.ino (firmware='test')
+- bytes reach the parser no faster than the host's baud rate allows; bytes
+  sent at a baud rate the device is not listening at arrive as garbage
+- every applied frame blocks the parser for FastLED.show() (30 us per LED plus
+  the 50 us latch); bytes arriving meanwhile beyond the RX buffer are lost
+- optional random byte loss and corruption
+- 0x59/0x5A link negotiation with the firmware's trial and idle fallbacks
+- 0x5E latch: held frames are accepted and ACKed at once but shown only by a
+  show or release; holding ends on its own after the idle fallback time
+The hosts open `Device.port` like any serial port:
+  python emulator.py --leds 96 --loss 0.001
+  python cli.py --port /dev/pts/N
+"""
+
+import argparse, os, select, termios, threading, time, tty
+import numpy as np
+from protocol import StreamDecoder, RX_BUFFER as RX_RING, FT_STATUS, FT_TELEMETRY, FT_BAUD, FT_PROBE, FT_LATCH, LATCH_HOLD, LATCH_RELEASE
+
+BAUD_RATES = (115200, 230400, 460800, 921600, 1000000, 1500000, 2000000)
+DEFAULT_BAUD = 115200
+LINK_TRIAL_S = 1.0
+LINK_IDLE_S = 5.0
+LED_US = 30.0  # WS2812B: 24 bits at 800 kHz
+LATCH_US = 50.0
+RX_BUFFER = RX_RING + 128  # the sketches' Serial.setRxBufferSize() ring plus the UART's 128-byte FIFO
+SPEEDS = {getattr(termios, f"B{r}"): r for r in BAUD_RATES + (9600, 19200, 38400, 57600) if hasattr(termios, f"B{r}")}
+
+class Device:
+    def __init__(self, num_leds=96, firmware='syncled', rates=BAUD_RATES, link=True, throttle=True,
+                 led_us=LED_US, rx_buffer=RX_BUFFER, loss=0.0, corrupt=0.0, seed=None, latch=True):
+        if firmware not in ('syncled', 'test'):
+            raise ValueError("firmware must be 'syncled' or 'test'")
+        self.num_leds = num_leds
+        self.firmware = firmware
+        self.decoder = StreamDecoder(num_leds, status=firmware == 'test', rates=rates)
+        if not link:
+            # firmware from before rate negotiation
+            self.decoder.types -= {FT_BAUD, FT_PROBE}
+        if not latch:
+            # firmware from before the 0x5E latch
+            self.decoder.types.discard(FT_LATCH)
+        self.throttle = throttle
+        self.show_s = (num_leds * led_us + LATCH_US) / 1e6
+        self.rx_buffer = rx_buffer
+        self.loss = loss
+        self.corrupt = corrupt
+        self.rng = np.random.default_rng(seed)
+        self.rate = DEFAULT_BAUD
+        self.trial = False
+        self.changed = self.last_valid = time.perf_counter()
+        self.frames = self.nacked = self.status = self.probes = self.switches = 0
+        self.hold = self.staged = False
+        self.latches = self.latch_failed = self.presented = 0
+        self.overruns = self.lost = self.corrupted = self.garbled = self.bytes = 0
+        self.shown = None
+        self.on_frame = None  # called with (frame_id, colors) after each show
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.slave = slave
+        self.port = os.ttyname(slave)
+        self.rx = bytearray()
+        self.rx_t = np.empty(0)
+        self.wire_t = 0.0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="emulator", daemon=True)
+        self.thread.start()
+
+    def host_rate(self):
+        # the baud rate the host set on its end of the pty
+        try:
+            return SPEEDS.get(termios.tcgetattr(self.master)[5], self.rate)
+        except Exception:
+            return self.rate
+
+    def _receive(self, since):
+        # queue what the host wrote, each byte timed as if clocked over the wire
+        try:
+            data = os.read(self.master, 65536)
+        except OSError:
+            return
+        rate = self.host_rate()
+        if rate != self.rate:
+            # a receiver at the wrong rate sees framing noise, not the bytes
+            self.garbled += len(data)
+            data = self.rng.integers(0, 256, len(data), dtype=np.uint8).tobytes()
+        start = max(since, self.wire_t) if self.throttle else since
+        byte_s = 10.0 / rate if self.throttle else 0.0
+        t = start + byte_s * np.arange(1, len(data) + 1)
+        self.wire_t = t[-1] if len(t) else self.wire_t
+        self.rx += data
+        self.rx_t = np.concatenate((self.rx_t, t))
+
+    def _damage(self, data):
+        if self.loss:
+            keep = self.rng.random(len(data)) >= self.loss
+            self.lost += len(data) - int(keep.sum())
+            data = bytes(np.frombuffer(data, dtype=np.uint8)[keep])
+        if self.corrupt and data:
+            a = np.frombuffer(data, dtype=np.uint8).copy()
+            hit = self.rng.random(len(a)) < self.corrupt
+            a[hit] ^= self.rng.integers(1, 256, int(hit.sum()), dtype=np.uint8)
+            self.corrupted += int(hit.sum())
+            data = a.tobytes()
+        return data
+
+    def _run(self):
+        seen = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            # sleep until a FIFO's worth (or all that is queued) has arrived
+            wait = 0.02 if not len(self.rx) else max(0.0, min(0.02, self.rx_t[min(63, len(self.rx) - 1)] - now))
+            r, _, _ = select.select([self.master], [], [], wait)
+            now = time.perf_counter()
+            if r:
+                self._receive(seen if len(self.rx) else now)
+            seen = now
+            self._link_timeouts(now)
+            # everything that has finished arriving, at most a FIFO's worth at a time
+            k = min(int(np.searchsorted(self.rx_t, now, 'right')), 64)
+            if not k:
+                continue
+            data, t = bytes(self.rx[:k]), self.rx_t[k - 1]
+            del self.rx[:k]
+            self.rx_t = self.rx_t[k:]
+            self.bytes += len(data)
+            for pkt in self.decoder.feed(self._damage(data), now=t):
+                self._handle(pkt)
+
+    def _handle(self, pkt):
+        ft, ok, fid, value = pkt
+        if ft == FT_BAUD:
+            self._write(self.decoder.reply(pkt))
+            if ok:
+                # Serial.flush() then updateBaudRate(); the reply left at the old rate
+                self.rate = value
+                self.switches += 1
+                self.changed = self.last_valid = time.perf_counter()
+                self.trial = value != DEFAULT_BAUD
+            return
+        if ok:
+            self.last_valid = time.perf_counter()
+        if ft == FT_PROBE:
+            self.probes += ok
+            self.trial = self.trial and not ok
+        elif ft in (FT_STATUS, FT_TELEMETRY):
+            self.status += ok
+        elif ft == FT_LATCH:
+            self.latches += ok
+            self.latch_failed += not ok
+            if ok and value == LATCH_HOLD:
+                self.hold = True
+            elif ok:
+                self.hold = self.hold and value != LATCH_RELEASE
+                # a show always shows, a release only a frame still held
+                if self.staged or value != LATCH_RELEASE:
+                    self._present()
+        elif ok:
+            self.frames += 1
+            self.shown = value
+            self.staged = True
+            if not self.hold:
+                self._present()
+        else:
+            self.nacked += 1
+        self._write(self.decoder.reply(pkt))
+
+    def _present(self):
+        self.staged = False
+        self.presented += 1
+        self._show()
+        if self.on_frame is not None:
+            self.on_frame(self.decoder.base_id, self.shown)
+
+    def _show(self):
+        # the firmware answers only after FastLED.show() returns; bytes that
+        # arrive meanwhile pile up in the RX ring and the overflow is dropped
+        start = time.perf_counter()
+        time.sleep(self.show_s)
+        self._poll(start)
+        end = time.perf_counter()
+        k = int(np.searchsorted(self.rx_t, end, 'right'))
+        if k > self.rx_buffer:
+            drop = k - self.rx_buffer
+            del self.rx[self.rx_buffer:k]
+            self.rx_t = np.delete(self.rx_t, np.s_[self.rx_buffer:k])
+            self.overruns += drop
+
+    def _poll(self, since):
+        r, _, _ = select.select([self.master], [], [], 0)
+        if r:
+            self._receive(since)
+
+    def _write(self, data):
+        try:
+            os.write(self.master, data)
+        except OSError:
+            pass
+
+    def _link_timeouts(self, now):
+        if self.hold and now - self.last_valid > LINK_IDLE_S:
+            # a host that went away must not leave the strip frozen
+            self.hold = False
+            if self.staged:
+                self._present()
+        if self.rate == DEFAULT_BAUD:
+            return
+        if (self.trial and now - self.changed > LINK_TRIAL_S) or now - self.last_valid > LINK_IDLE_S:
+            self.rate = DEFAULT_BAUD
+            self.trial = False
+
+    def stats(self):
+        d = self.decoder
+        return {"frames": self.frames, "nacked": self.nacked, "status": self.status, "probes": self.probes,
+                "rate": self.rate, "switches": self.switches, "bytes": self.bytes, "timeouts": d.timeouts,
+                "skipped": d.skipped, "overruns": self.overruns, "lost": self.lost, "corrupted": self.corrupted,
+                "garbled": self.garbled, "show_ms": self.show_s * 1000.0, "presented": self.presented,
+                "latches": self.latches, "latch_failed": self.latch_failed, "hold": self.hold}
+
+    def close(self):
+        self.running = False
+        if self.thread is not threading.current_thread():
+            self.thread.join(1.0)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+def main():
+    p=argparse.ArgumentParser(description='SyncLED firmware emulator on a pty')
+    p.add_argument('--leds', type=int, default=96, help='NUM_LEDS the firmware was built with')
+    p.add_argument('--firmware', choices=['syncled','test'], default='syncled', help='test also accepts 0x56/0x5D status packets')
+    p.add_argument('--no-link', action='store_true', help='firmware without 0x59/0x5A rate negotiation')
+    p.add_argument('--no-latch', action='store_true', help='firmware without the 0x5E latch')
+    p.add_argument('--no-throttle', action='store_true', help='deliver bytes instantly instead of at the baud rate')
+    p.add_argument('--led-us', type=float, default=LED_US, help='FastLED.show() time per LED')
+    p.add_argument('--rx-buffer', type=int, default=RX_BUFFER, help='bytes the RX ring holds during show()')
+    p.add_argument('--loss', type=float, default=0.0, help='probability a byte is dropped')
+    p.add_argument('--corrupt', type=float, default=0.0, help='probability a byte is damaged')
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--link', default=None, help='also create this symlink to the pty')
+    args=p.parse_args()
+    dev=Device(args.leds,args.firmware,link=not args.no_link,throttle=not args.no_throttle,led_us=args.led_us,
+               rx_buffer=args.rx_buffer,loss=args.loss,corrupt=args.corrupt,seed=args.seed,latch=not args.no_latch)
+    port=dev.port
+    if args.link:
+        try:
+            os.remove(args.link)
+        except OSError:
+            pass
+        os.symlink(dev.port,args.link)
+        port=args.link
+    print(f"emulating {args.firmware} with {args.leds} LEDs on {port}", flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            s=dev.stats()
+            print(f"{s['rate']} baud, {s['frames']} frames, {s['nacked']} NAK, {s['status']} status, "
+                  f"{s['timeouts']} timeouts, {s['overruns']} overrun, {s['lost']} lost, {s['corrupted']} corrupted", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dev.close()
+        if args.link:
+            try:
+                os.remove(args.link)
+            except OSError:
+                pass
+
+if __name__=='__main__':
+    main()
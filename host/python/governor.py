@@ -0,0 +1,91 @@
+"""
+Link-aware frame-rate governor.
+Once per period it looks at what the last period's frames cost and picks the
+highest frame rate every limit allows, between min_fps and max_fps:
+- wire: bytes per sent frame at the port's baud rate (frames held back by the
+  change gate cost nothing), with `headroom` left free
+- rtt: at most `window` frames per ACK round trip, fewer when that many
+  full frames would not fit the device's RX buffer
+- host: the slowest host stage's time per frame
+NAKs/timeouts above max_errors, or more than a frame's worth of bytes still
+queued in the OS (out_waiting), cut the rate by a quarter; otherwise it climbs
+by 10% per period towards the limit.
+"""
+
+import time
+from protocol import RX_BUFFER
+
+class FrameRateGovernor:
+    def __init__(self, ser, fps=15.0, min_fps=5.0, max_fps=60.0, window=4, frame_bytes=292,
+                 headroom=0.8, max_errors=0.05, period=1.0):
+        self.ser = ser
+        self.fps = float(fps)
+        self.min_fps = float(min_fps)
+        self.max_fps = float(max_fps)
+        # WindowedSender never has more than RX_BUFFER bytes in flight
+        self.window = min(window, max(1, RX_BUFFER // frame_bytes))
+        self.frame_bytes = frame_bytes
+        self.headroom = headroom
+        self.max_errors = max_errors
+        self.period = period
+        self.reason = "start"
+        self.limits = {}
+        self.metrics = {}
+        self.changes = 0
+        self._t = None
+        self._last = None
+        self._offered = 0
+
+    def out_waiting(self):
+        try:
+            return self.ser.out_waiting
+        except Exception:
+            return 0
+
+    def update(self, stats, busy_ms=None, now=None):
+        # call once per frame offered to the sender; returns the frame rate to run at
+        now = time.perf_counter() if now is None else now
+        self._offered += 1
+        if self._t is None or stats["sent"] < self._last["sent"]:
+            # first call, or the sender was replaced and its counters restarted
+            self._t, self._last, self._offered = now, dict(stats), 0
+            return self.fps
+        if now - self._t < self.period:
+            return self.fps
+        d = {k: stats[k] - self._last[k] for k in ("sent", "nacked", "expired", "bytes_sent")}
+        offered = max(1, self._offered)
+        self._t, self._last, self._offered = now, dict(stats), 0
+        if d["sent"] > 0:
+            self.frame_bytes = d["bytes_sent"] / d["sent"]
+        baud = getattr(self.ser, "baudrate", 115200) or 115200
+        wire_ms = self.frame_bytes * 10.0 * 1000.0 / baud
+        # only the frames that got past the change gate use the wire
+        sent_share = min(1.0, d["sent"] / offered) if d["sent"] else 1.0
+        limits = {"max": self.max_fps, "wire": self.headroom * 1000.0 / (wire_ms * sent_share)}
+        rtt_ms = stats.get("rtt_ms", 0.0)
+        if rtt_ms > 0:
+            limits["rtt"] = self.window * 1000.0 / (rtt_ms * sent_share)
+        if busy_ms:
+            limits["host"] = self.headroom * 1000.0 / busy_ms
+        target = min(limits.values())
+        errors = (d["nacked"] + d["expired"]) / d["sent"] if d["sent"] else 0.0
+        queued = self.out_waiting()
+        fps = self.fps
+        if errors > self.max_errors:
+            fps, reason = fps * 0.75, "errors"
+        elif queued > self.frame_bytes:
+            fps, reason = fps * 0.75, "backlog"
+        else:
+            reason = min(limits, key=limits.get)
+            fps = min(target, fps * 1.1 + 0.5) if fps < target else target
+        fps = max(self.min_fps, min(self.max_fps, fps))
+        if abs(fps - self.fps) >= 0.5:
+            self.changes += 1
+        self.fps, self.reason, self.limits = fps, reason, limits
+        self.metrics = {"fps": fps, "reason": reason, "wire_ms": wire_ms, "rtt_ms": rtt_ms, "out_waiting": queued,
+                        "error_rate": errors, "sent_share": sent_share, "changes": self.changes,
+                        **{f"limit_{k}": v for k, v in limits.items()}}
+        return fps
+
+    def stats(self):
+        return dict(self.metrics) or {"fps": self.fps, "reason": self.reason}
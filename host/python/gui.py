@@ -47,12 +47,17 @@ except Exception:
     pystray = None
     TRAY_AVAILABLE = False
 
+from layout import Layout
+from link import negotiate, BASE_BAUD
+from color import to_float, brightness
+from audio import AudioAnalyzer, SAMPLERATE
+from protocol import FrameEncoder
+
 # configuration
-NUM_LEDS = 96
-TOP_LEDS = 31
-RIGHT_LEDS = 17
-BOTTOM_LEDS = 31
-LEFT_LEDS = 17
+LAYOUT = Layout.load()
+NUM_LEDS = LAYOUT.num_leds
+AUDIO_BLOCKSIZE = 256  # samples per callback; lower it while the status shows no xruns
+AUDIO_HOP = 256  # analysis step, the spectrum refreshes every hop
 
 class AmbiTrayApp:
     def __init__(self, root):
@@ -61,6 +66,7 @@ class AmbiTrayApp:
         self.base_color = (0,0,0)
         self.brightness = 100
         self.frame_id = 0
+        self.encoder = FrameEncoder(NUM_LEDS)
         self.ser = None
         self.running = False
         self.icon = None
@@ -149,8 +155,7 @@ class AmbiTrayApp:
 
         # audio internals
         self.audio_stream = None
-        self.audio_levels = np.zeros(NUM_LEDS, dtype=float)
-        self.audio_lock = threading.Lock()
+        self.analyzer = AudioAnalyzer(NUM_LEDS, SAMPLERATE, hop=AUDIO_HOP)
 
         # setup tray icon if available
         if TRAY_AVAILABLE and PIL_AVAILABLE:
@@ -247,9 +252,7 @@ class AmbiTrayApp:
 
     def get_scaled_color(self):
         b = self.brightness_var.get() / 100.0
-        r = int(round(self.base_color[0] * b)) & 0xFF
-        g = int(round(self.base_color[1] * b)) & 0xFF
-        bl = int(round(self.base_color[2] * b)) & 0xFF
+        r,g,bl = (int(x) for x in brightness(to_float(self.base_color), b)[0])
         return (r,g,bl)
 
     def on_brightness_change(self, _=None):
@@ -269,39 +272,11 @@ class AmbiTrayApp:
         top_edge=bottom_edge=edge_thickness
         cx0=left_edge; cy0=top_edge
         cx1=self.canvas_w-right_edge; cy1=self.canvas_h-bottom_edge
-        # top
-        top_seg_w=(cx1-cx0)/TOP_LEDS
-        for i in range(TOP_LEDS):
-            x0=int(cx0 + i*top_seg_w)+pad
-            x1=int(cx0 + (i+1)*top_seg_w)-pad
-            y0=pad; y1=top_edge-pad
-            rid=self.canvas.create_rectangle(x0,y0,x1,y1,fill="#000000",outline="")
-            self.led_rects.append(rid)
-        # right
-        right_seg_h=(cy1-cy0)/RIGHT_LEDS
-        for i in range(RIGHT_LEDS):
-            y0=int(cy0 + i*right_seg_h)+pad
-            y1=int(cy0 + (i+1)*right_seg_h)-pad
-            x0=self.canvas_w-right_edge+pad
-            x1=self.canvas_w-pad
-            rid=self.canvas.create_rectangle(x0,y0,x1,y1,fill="#000000",outline="")
-            self.led_rects.append(rid)
-        # bottom
-        bottom_seg_w=(cx1-cx0)/BOTTOM_LEDS
-        for i in range(BOTTOM_LEDS):
-            x0=int(cx1 - (i+1)*bottom_seg_w)+pad
-            x1=int(cx1 - i*bottom_seg_w)-pad
-            y0=self.canvas_h-bottom_edge+pad
-            y1=self.canvas_h-pad
-            rid=self.canvas.create_rectangle(x0,y0,x1,y1,fill="#000000",outline="")
-            self.led_rects.append(rid)
-        # left
-        left_seg_h=(cy1-cy0)/LEFT_LEDS
-        for i in range(LEFT_LEDS):
-            y0=int(cy1 - (i+1)*left_seg_h)+pad
-            y1=int(cy1 - i*left_seg_h)-pad
-            x0=pad; x1=left_edge-pad
-            rid=self.canvas.create_rectangle(x0,y0,x1,y1,fill="#000000",outline="")
+        for box in LAYOUT.led_boxes(cx0,cy0,cx1,cy1,edge_thickness):
+            if box is None:
+                continue
+            x0,y0,x1,y1=box
+            rid=self.canvas.create_rectangle(x0+pad,y0+pad,x1-pad,y1-pad,fill="#000000",outline="")
             self.led_rects.append(rid)
 
     def fill_leds(self, rgb):
@@ -321,14 +296,17 @@ class AmbiTrayApp:
             if self.send_var.get():
                 port = self.port_var.get()
                 try:
-                    self.ser = serial.Serial(port, 115200, timeout=0.1)
+                    self.ser = serial.Serial(port, BASE_BAUD, timeout=0.1)
+                    # FULL frames go to SyncLED firmware, which may still be on a fast link
+                    if self.packet_var.get() == "FULL":
+                        negotiate(self.ser)
                 except Exception as e:
                     messagebox.showerror("Serial error", f"Cannot open {port}:\n{e}")
                     self.ser = None
                     return
             self.running = True
             self.start_btn.configure(text="Stop")
-            self.status.configure(text="Running")
+            self.status.configure(text=f"Running at {self.ser.baudrate} baud" if self.ser else "Running")
         else:
             self.running = False
             self.start_btn.configure(text="Start")
@@ -349,16 +327,8 @@ class AmbiTrayApp:
                 pkt = b'S' + bytes([rgb[0]&0xFF, rgb[1]&0xFF, rgb[2]&0xFF]) + b'\n'
                 self.ser.write(pkt)
             else:
-                payload = bytearray()
-                for _ in range(NUM_LEDS):
-                    payload.extend([rgb[0]&0xFF, rgb[1]&0xFF, rgb[2]&0xFF])
-                hdr = bytearray([0xAA, 0x55, self.frame_id & 0xFF])
-                s = self.frame_id
-                for x in payload:
-                    s = (s + x) & 0xFFFFFFFF
-                chk = s & 0xFF
-                packet = hdr + payload + bytearray([chk])
-                self.ser.write(packet)
+                c = np.array([v & 0xFF for v in rgb[:3]], dtype=np.uint8)
+                self.ser.write(self.encoder.leds(self.frame_id, np.broadcast_to(c, (NUM_LEDS, 3))))
                 try:
                     _ = self.ser.read(1)
                 except Exception:
@@ -386,33 +356,24 @@ class AmbiTrayApp:
             return
         if self.audio_stream: return
         try:
-            FFT_SIZE = 2048
-            def callback(indata, frames, time_info, status):
-                if status: pass
-                data = indata.copy()
-                if data.ndim > 1:
-                    mono = data.mean(axis=1)
-                else:
-                    mono = data
-                window = np.hanning(len(mono))
-                spec = np.fft.rfft(mono * window, n=FFT_SIZE)
-                mags = np.abs(spec)
-                groups = np.array_split(mags, NUM_LEDS)
-                energies = np.array([g.mean() if g.size else 0.0 for g in groups])
-                maxv = energies.max() if energies.size else 1.0
-                if maxv < 1e-9:
-                    norm = energies * 0.0
-                else:
-                    norm = energies / maxv
-                with self.audio_lock:
-                    self.audio_levels = norm
-            self.audio_stream = sd.InputStream(callback=callback, channels=1, samplerate=44100, blocksize=1024)
+            # the callback only fills the ring; analysis runs on the analyzer's worker
+            self.analyzer.start()
+            self.audio_stream = sd.InputStream(callback=self.analyzer.callback, channels=1, samplerate=SAMPLERATE, blocksize=AUDIO_BLOCKSIZE)
             self.audio_stream.start()
+            self.root.after(1000, self.audio_tick)
             self.status.configure(text="Audio running")
         except Exception as e:
             self.audio_stream = None
+            self.analyzer.stop()
             self.status.configure(text=f"Audio error: {e}")
 
+    def audio_tick(self):
+        if not self.audio_stream:
+            return
+        st = self.analyzer.stats()
+        self.status.configure(text=f"Audio {st['latency_ms']:.1f} ms (max {st['latency_max_ms']:.1f}), {st['xruns']} xruns, {st['overruns']} overruns")
+        self.root.after(1000, self.audio_tick)
+
     def stop_audio_stream(self):
         try:
             if self.audio_stream:
@@ -421,8 +382,7 @@ class AmbiTrayApp:
         except Exception:
             pass
         self.audio_stream = None
-        with self.audio_lock:
-            self.audio_levels = np.zeros(NUM_LEDS, dtype=float)
+        self.analyzer.stop()
         self.status.configure(text="Audio stopped")
 
     # ------------------- tray integration -------------------
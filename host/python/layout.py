@@ -0,0 +1,225 @@
+"""
+LED layout descriptor shared by every Python host.
+- Edge counts, start corner, direction, sampling depth, gaps and corner skips
+- Compiled once per capture resolution into a sparse LEDs x pixels matrix
+- Compiled matrices are cached on disk keyed by layout hash and resolution;
+  only the MATRIX_KEEP most recently used stay there
+
+Layout file (JSON), every key optional:
+  {"edges": {"top": 31, "right": 17, "bottom": 31, "left": 17},
+   "start": "top-left", "direction": "cw", "depth": 0.12,
+   "gaps": {"bottom": [[13, 5]]}, "corner_skip": 0, "num_leds": 96}
+gaps: per edge, [after_n_leds, slots] pairs in strip direction; the slots take
+screen space but carry no LED (e.g. a monitor stand).
+corner_skip: dark LEDs where the strip turns each corner between edges.
+num_leds: firmware strip length; output is padded with black or truncated.
+
+Multi-monitor file: one layout per monitor, their LEDs concatenated in this
+order into one frame (load_segments(); monitor is the mss index, 1 = primary):
+  {"segments": [{"monitor": 1, "edges": {...}, "num_leds": 96},
+                {"monitor": 2, "edges": {...}, "start": "bottom-left"}]}
+
+Several controllers (cli.py with more than one --port): "devices" lists how
+many LEDs of the frame each port drives, in frame order (load_devices());
+without it a multi-monitor file has one device per segment:
+  {"devices": [60, 36, 96], "segments": [...]}
+"""
+
+import hashlib, json, os
+import numpy as np
+
+EDGES = ('top', 'right', 'bottom', 'left')
+CORNERS = ('top-left', 'top-right', 'bottom-right', 'bottom-left')
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layout.json')
+MATRIX_VERSION = 1
+CACHE_DIR = os.environ.get('SYNCLED_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'syncled'))
+MATRIX_KEEP = 16
+
+def prune_cache(prefix, suffix, keep_path=None, keep=MATRIX_KEEP):
+    # deletes all but the `keep` most recently used prefix*suffix files in
+    # CACHE_DIR (mtime marks the last use); keep_path always stays
+    paths = []
+    for name in os.listdir(CACHE_DIR):
+        p = os.path.join(CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith(suffix) and ".tmp" not in name and p != keep_path:
+            try:
+                paths.append((os.path.getmtime(p), p))
+            except OSError:
+                pass
+    paths.sort(reverse=True)
+    for _, p in paths[max(0, keep - (keep_path is not None)):]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass  # still mapped (Windows) or already gone
+
+def _read(path):
+    # only the default file may be missing; a path the user named must exist
+    path = path or os.environ.get('SYNCLED_LAYOUT')
+    if not path:
+        if not os.path.exists(DEFAULT_PATH):
+            return {}
+        path = DEFAULT_PATH
+    with open(path) as f:
+        return json.load(f)
+
+def load_segments(path=None):
+    # [(monitor, Layout)] in strip order; a plain layout file is one segment
+    # on the primary monitor
+    d = _read(path)
+    d.pop("devices", None)
+    if "segments" not in d:
+        return [(1, Layout(**d))]
+    out = []
+    for seg in d["segments"]:
+        seg = dict(seg)
+        out.append((int(seg.pop("monitor", len(out) + 1)), Layout(**seg)))
+    if not out:
+        raise ValueError("layout has no segments")
+    return out
+
+def load_devices(path=None, segments=None):
+    # LEDs per device in frame order: the "devices" list, else one device per segment
+    d = _read(path)
+    if "devices" in d:
+        counts = [int(n) for n in d["devices"]]
+        if not counts or min(counts) <= 0:
+            raise ValueError("devices must list positive LED counts")
+        return counts
+    return [lay.num_leds for _, lay in (segments or load_segments(path))]
+
+class Layout:
+    def __init__(self, edges=None, start='top-left', direction='cw', depth=0.12, gaps=None, corner_skip=0, num_leds=None):
+        edges = edges or {'top': 31, 'right': 17, 'bottom': 31, 'left': 17}
+        self.edges = {e: int(edges.get(e, 0)) for e in EDGES}
+        if start not in CORNERS:
+            raise ValueError(f"start must be one of {', '.join(CORNERS)}")
+        if direction not in ('cw', 'ccw'):
+            raise ValueError("direction must be 'cw' or 'ccw'")
+        self.start = start
+        self.direction = direction
+        self.depth = float(depth)
+        self.gaps = {e: [(int(a), int(n)) for a, n in (gaps or {}).get(e, [])] for e in EDGES}
+        self.corner_skip = int(corner_skip)
+        self.strip_len = sum(self.edges.values()) + 3 * self.corner_skip
+        self.num_leds = int(num_leds) if num_leds else self.strip_len
+        self._matrices = {}
+
+    @classmethod
+    def load(cls, path=None):
+        d = _read(path)
+        d.pop("devices", None)
+        if "segments" in d:
+            raise ValueError("layout has one segment per monitor, load it with load_segments()")
+        return cls(**d)
+
+    def to_dict(self):
+        return {"edges": self.edges, "start": self.start, "direction": self.direction, "depth": self.depth,
+                "gaps": {e: g for e, g in self.gaps.items() if g}, "corner_skip": self.corner_skip,
+                "num_leds": self.num_leds}
+
+    def key(self):
+        d = dict(self.to_dict(), version=MATRIX_VERSION)
+        return hashlib.sha1(json.dumps(d, sort_keys=True).encode()).hexdigest()[:16]
+
+    def edge_order(self):
+        # [(edge, forward)] in strip order; forward means increasing x or y
+        i = CORNERS.index(self.start)
+        if self.direction == 'cw':
+            order = [EDGES[(i + k) % 4] for k in range(4)]
+            return [(e, e in ('top', 'right')) for e in order]
+        order = [EDGES[(i - 1 - k) % 4] for k in range(4)]
+        return [(e, e in ('bottom', 'left')) for e in order]
+
+    def leds(self):
+        # strip order list of (edge, slot, slots) in forward edge coordinates, None for dark LEDs
+        out = []
+        for n, (edge, forward) in enumerate(self.edge_order()):
+            if n:
+                out += [None] * self.corner_skip
+            cnt = self.edges[edge]
+            gaps = dict()
+            for after, size in self.gaps[edge]:
+                gaps[after] = gaps.get(after, 0) + size
+            slots = cnt + sum(gaps.values())
+            k = 0
+            for i in range(cnt):
+                k += gaps.get(i, 0)
+                out.append((edge, k if forward else slots - 1 - k, slots))
+                k += 1
+        out = out[:self.num_leds]
+        return out + [None] * (self.num_leds - len(out))
+
+    def zones(self, h, w):
+        # (N,4) array of y0,y1,x0,x1 per LED; dark LEDs get an empty zone
+        d = self.depth
+        bands = {'top': (0, max(1, int(h * d))), 'bottom': (max(0, h - int(h * d)), h),
+                 'left': (0, min(int(w * d), w)), 'right': (max(0, w - int(w * d)), w)}
+        z = []
+        for led in self.leds():
+            if led is None:
+                z.append((0, 0, 0, 0))
+                continue
+            edge, f, slots = led
+            a, b = bands[edge]
+            if edge in ('top', 'bottom'):
+                sw = w / slots
+                z.append((a, b, int(f * sw), int((f + 1) * sw)))
+            else:
+                sh = h / slots
+                z.append((int(f * sh), int((f + 1) * sh), a, b))
+        return np.array(z, dtype=np.intp).reshape(-1, 4)
+
+    def compile(self, h, w):
+        # CSR rows are LEDs, columns are pixel indices y*w+x of an (h,w) frame
+        indptr = [0]
+        indices = []
+        for y0, y1, x0, x1 in self.zones(h, w):
+            if y1 > y0 and x1 > x0:
+                ys, xs = np.mgrid[y0:y1, x0:x1]
+                indices.append((ys * w + xs).ravel())
+            indptr.append(indptr[-1] + max(0, y1 - y0) * max(0, x1 - x0))
+        indices = np.concatenate(indices).astype(np.int32) if indices else np.zeros(0, dtype=np.int32)
+        weights = np.ones(len(indices), dtype=np.float32)
+        return {"indptr": np.array(indptr, dtype=np.int64), "indices": indices, "weights": weights}
+
+    def matrix(self, h, w):
+        m = self._matrices.get((h, w))
+        if m is not None:
+            return m
+        path = os.path.join(CACHE_DIR, f"layout-{self.key()}-{w}x{h}.npz")
+        try:
+            with np.load(path) as f:
+                m = {k: f[k] for k in ('indptr', 'indices', 'weights')}
+            os.utime(path)
+        except Exception:
+            m = self.compile(h, w)
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                tmp = path + f".{os.getpid()}.tmp.npz"
+                np.savez(tmp, **m)
+                os.replace(tmp, path)
+                prune_cache("layout-", ".npz", path)
+            except Exception:
+                pass
+        self._matrices[(h, w)] = m
+        return m
+
+    def led_boxes(self, cx0, cy0, cx1, cy1, edge_thickness):
+        # preview rectangles around an inner (cx0,cy0,cx1,cy1) area, strip order, None for dark LEDs
+        boxes = []
+        for led in self.leds():
+            if led is None:
+                boxes.append(None)
+                continue
+            edge, f, slots = led
+            if edge in ('top', 'bottom'):
+                seg = (cx1 - cx0) / slots
+                x0, x1 = int(cx0 + f * seg), int(cx0 + (f + 1) * seg)
+                y0, y1 = (cy0 - edge_thickness, cy0) if edge == 'top' else (cy1, cy1 + edge_thickness)
+            else:
+                seg = (cy1 - cy0) / slots
+                y0, y1 = int(cy0 + f * seg), int(cy0 + (f + 1) * seg)
+                x0, x1 = (cx1, cx1 + edge_thickness) if edge == 'right' else (cx0 - edge_thickness, cx0)
+            boxes.append((x0, y0, x1, y1))
+        return boxes
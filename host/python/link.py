@@ -0,0 +1,143 @@
+"""
+Serial link speed negotiation (0x59 rate switch and 0x5A probe packets, see
+protocol.py).
+- negotiate: find the rate the device is listening at, then move to the
+  fastest candidate rate that survives a burst of probes
+- LinkMonitor: watches the sender's NAK/expiry counts and steps the rate down
+  when errors rise
+The device drops back to BASE_BAUD on its own if a new rate is not confirmed
+by a probe within TRIAL_S, or if it hears no valid packet for IDLE_S, so a
+host restart or a failed switch always ends at a known rate.
+Only call these while no WindowedSender is reading the port.
+"""
+
+import os, time
+from protocol import encode_baud, encode_probe
+
+BASE_BAUD = 115200
+RATES = (2000000, 921600)
+TRIAL_S = 1.0
+IDLE_S = 5.0
+PROBES = 8
+PROBE_SIZE = 64
+
+def set_rate(ser, rate):
+    try:
+        ser.flush()
+    except Exception:
+        pass
+    ser.baudrate = rate
+    time.sleep(0.01)
+    ser.reset_input_buffer()
+
+def read_replies(ser, want, n, timeout):
+    # up to n reply bytes out of `want`, anything else on the line is skipped
+    out = bytearray()
+    end = time.perf_counter() + timeout
+    while len(out) < n and time.perf_counter() < end:
+        for b in ser.read(max(1, ser.in_waiting)):
+            if b in want:
+                out.append(b)
+    return bytes(out)
+
+def probe(ser, count=PROBES, size=PROBE_SIZE):
+    # fraction of a probe burst the device verified; payload avoids 0xAA so
+    # older firmware can never mistake it for a frame header
+    pkts = b"".join(encode_probe(bytes(b % 0xAA for b in os.urandom(size))) for _ in range(count))
+    ser.reset_input_buffer()
+    ser.write(pkts)
+    # 0.25 s of slack also outlasts the firmware's 200 ms byte timeout
+    wire = len(pkts) * 10.0 / ser.baudrate
+    got = read_replies(ser, b"Pp", count, 2 * wire + 0.25)
+    return got.count(b"P") / count
+
+def find_rate(ser, candidates):
+    # the rate the device currently answers probes at, or None
+    seen = []
+    for rate in candidates:
+        if rate in seen:
+            continue
+        seen.append(rate)
+        set_rate(ser, rate)
+        if probe(ser, 1, 8) == 1.0:
+            return rate
+    return None
+
+def switch(ser, rate, probes=PROBES):
+    # ask the device for `rate`, then prove it with a probe burst; None when
+    # the device refused (it stays at the old rate), False when the probes failed
+    ser.reset_input_buffer()
+    ser.write(encode_baud(rate))
+    if read_replies(ser, b"Bb", 1, 0.3) != b"B":
+        return None
+    set_rate(ser, rate)
+    return probe(ser, probes) == 1.0
+
+def settle(ser, current, rates=RATES, base=BASE_BAUD, ceiling=None, probes=PROBES):
+    # from `current`, move to the fastest of rates/base (up to ceiling) that works
+    for rate in sorted(set(rates) | {base}, reverse=True):
+        if ceiling is not None and rate > ceiling:
+            continue
+        if rate == current:
+            break
+        ok = switch(ser, rate, probes)
+        if ok:
+            return rate
+        if ok is False:
+            # the unconfirmed rate lapses on the device; meet it back at base
+            set_rate(ser, base)
+            time.sleep(TRIAL_S + 0.2)
+            current = find_rate(ser, [base]) or base
+    if ser.baudrate != current:
+        set_rate(ser, current)
+    return current
+
+def negotiate(ser, rates=RATES, base=BASE_BAUD, probes=PROBES):
+    # returns the agreed rate, or None for firmware without negotiation (the
+    # port is left at `base`)
+    timeout = ser.timeout
+    ser.timeout = 0.05
+    try:
+        current = find_rate(ser, [ser.baudrate, base] + sorted(rates, reverse=True))
+        if current is None:
+            set_rate(ser, base)
+            return None
+        return settle(ser, current, rates, base, probes=probes)
+    finally:
+        ser.timeout = timeout
+
+class LinkMonitor:
+    # call check() with sender.stats() now and then; True means the error rate
+    # over the last `min_frames` frames is too high and step_down() should run
+    # (with the sender closed, since its reader would swallow the replies)
+    def __init__(self, ser, rates=RATES, base=BASE_BAUD, max_errors=0.1, min_frames=30):
+        self.ser = ser
+        self.rates = tuple(rates)
+        self.base = base
+        self.max_errors = max_errors
+        self.min_frames = min_frames
+        self.steps = 0
+        self.reset()
+
+    def reset(self):
+        self._sent = self._bad = 0
+
+    def check(self, stats):
+        sent = stats["sent"] - self._sent
+        bad = stats["nacked"] + stats["expired"] - self._bad
+        if sent < self.min_frames:
+            return False
+        self._sent, self._bad = stats["sent"], stats["nacked"] + stats["expired"]
+        return self.ser.baudrate > self.base and bad > sent * self.max_errors
+
+    def step_down(self):
+        # next lower rate that still passes a probe burst, else base
+        self.steps += 1
+        timeout = self.ser.timeout
+        self.ser.timeout = 0.05
+        try:
+            rate = self.ser.baudrate
+            return settle(self.ser, rate, self.rates, self.base, ceiling=rate - 1)
+        finally:
+            self.ser.timeout = timeout
+            self.reset()
@@ -0,0 +1,208 @@
+"""
+Parallel capture of several monitors, each driving its own LED segment.
+- MonitorWorker: one thread per layout segment that opens its own backend
+  (backends belong to the thread that opened them), captures its monitor and
+  samples it with its own SparseSampler
+- FrameClock: the caller ticks it once per frame and every worker grabs on
+  that tick, so all monitors are captured in step; each worker writes its
+  colours into its slice of one merged (N,3) frame
+- MultiMonitorCapture.frame() ticks the clock, waits until every segment has
+  reported or the deadline passes, and returns the merged frame. A segment
+  that misses the deadline keeps its previous colours for that frame and is
+  counted late; its result lands in the next frame.
+Grab and sample times per monitor go into the StageTimer as "mon<N> grab" and
+"mon<N> sample" (N is the monitor index).
+"""
+
+import threading, time
+import numpy as np
+import cv2
+from capture import open_capture, RES
+from sampler import SparseSampler
+from backends import open_backend
+from timing import StageTimer
+
+class FrameClock:
+    def __init__(self, slices, num_leds):
+        self.slices = slices
+        self.merged = np.zeros((num_leds, 3), dtype=np.uint8)
+        self.tick = 0
+        self.done = [0] * len(slices)  # last tick each segment reported
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def advance(self):
+        with self._cond:
+            self.tick += 1
+            self._cond.notify_all()
+            return self.tick
+
+    def wait_tick(self, last, timeout):
+        # worker side: the newest tick after `last`, or None on timeout/close;
+        # a worker slower than the clock skips the ticks it missed
+        with self._cond:
+            if self.tick == last and not self.closed:
+                self._cond.wait(timeout)
+            return self.tick if self.tick != last and not self.closed else None
+
+    def report(self, i, tick, colors):
+        a, b = self.slices[i]
+        with self._cond:
+            self.merged[a:b] = colors[:b - a]
+            self.done[i] = tick
+            self._cond.notify_all()
+
+    def collect(self, tick, deadline, out):
+        # copies the merged frame into out once every segment reported `tick`
+        # or at `deadline` (perf_counter time); returns the late segments
+        with self._cond:
+            while not self.closed:
+                late = [i for i, d in enumerate(self.done) if d < tick]
+                left = deadline - time.perf_counter()
+                if not late or left <= 0:
+                    break
+                self._cond.wait(left)
+            np.copyto(out, self.merged)
+            return [i for i, d in enumerate(self.done) if d < tick]
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+class MonitorWorker(threading.Thread):
+    def __init__(self, index, monitor, layout, clock, opener, mode, res, blur, timer):
+        super().__init__(name=f"monitor{monitor}", daemon=True)
+        self.index = index
+        self.monitor = monitor
+        self.layout = layout
+        self.clock = clock
+        self.opener = opener
+        self.mode = mode
+        self.res = res
+        self.blur = blur
+        self.timer = timer
+        self.grab_name = f"mon{monitor} grab"
+        self.sample_name = f"mon{monitor} sample"
+        self.ready = threading.Event()
+        self.error = None
+        self.running = True
+        self.frames = 0
+        self.busy = 0.0
+        self.grab_s = 0.0
+
+    def _open(self):
+        self.screen = self.opener()
+        if not 0 < self.monitor < len(self.screen.monitors):
+            raise ValueError(f"monitor {self.monitor} not found, {len(self.screen.monitors) - 1} attached")
+        self.cap = open_capture(self.mode, self.screen, self.screen.monitors[self.monitor], self.layout.depth, self.res)
+        self.sampler = SparseSampler(self.layout)
+
+    def run(self):
+        self.screen = None
+        try:
+            self._open()
+        except Exception as e:
+            self.error = e
+        self.ready.set()
+        if self.error is not None:
+            if self.screen is not None:
+                self.screen.close()
+            return
+        timer = self.timer
+        blurred = None
+        last = 0
+        while self.running:
+            tick = self.clock.wait_tick(last, 0.1)
+            if tick is None:
+                continue
+            last = tick
+            t0 = time.perf_counter()
+            timer.begin()
+            try:
+                img = self.cap.grab()
+                t1 = time.perf_counter()
+                timer.lap(self.grab_name)
+                if self.blur:
+                    img = blurred = cv2.GaussianBlur(img, (3, 3), 0, dst=blurred)
+                colors = self.sampler.sample(img, bgr=True)
+                timer.lap(self.sample_name)
+            except Exception as e:
+                # a monitor that goes away stops its segment, not the others
+                self.error = e
+                break
+            self.clock.report(self.index, tick, colors)
+            self.grab_s += t1 - t0
+            self.busy += time.perf_counter() - t0
+            self.frames += 1
+        self.screen.close()
+
+class MultiMonitorCapture:
+    def __init__(self, segments, backend, mode="band", res=RES, blur=True, input=None, size=None, timer=None):
+        # segments: [(monitor, Layout)] as from layout.load_segments()
+        self.segments = segments
+        self.timer = timer or StageTimer(False)
+        slices, a = [], 0
+        for _, lay in segments:
+            slices.append((a, a + lay.num_leds))
+            a += lay.num_leds
+        self.num_leds = a
+        self.clock = FrameClock(slices, a)
+        self.out = np.zeros((a, 3), dtype=np.uint8)
+        opener = lambda: open_backend(backend, input, size)
+        self.workers = [MonitorWorker(i, m, lay, self.clock, opener, mode, res, blur, self.timer)
+                        for i, (m, lay) in enumerate(segments)]
+        self.frames = 0
+        self.late = [0] * len(segments)
+        self.t0 = None
+
+    def start(self, timeout=10.0):
+        # raises the first worker's open error, after stopping them all
+        for w in self.workers:
+            w.start()
+        for w in self.workers:
+            w.ready.wait(timeout)
+        bad = [w for w in self.workers if w.error is not None or not w.ready.is_set()]
+        if bad:
+            self.close()
+            w = bad[0]
+            raise w.error or OSError(f"monitor {w.monitor}: capture did not open")
+
+    def frame(self, wait):
+        # tick all workers and return the merged (N,3) frame, waiting at most
+        # `wait` seconds for the slowest monitor; the array is reused
+        now = time.perf_counter()
+        if self.t0 is None:
+            self.t0 = now
+        tick = self.clock.advance()
+        for i in self.clock.collect(tick, now + wait, self.out):
+            self.late[i] += 1
+        self.frames += 1
+        dead = [w for w in self.workers if w.error is not None]
+        if len(dead) == len(self.workers):
+            raise dead[0].error
+        return self.out
+
+    def stats(self):
+        el = time.perf_counter() - self.t0 if self.t0 is not None else 0.0
+        mons = []
+        for w, late in zip(self.workers, self.late):
+            mons.append({"monitor": w.monitor, "leds": w.layout.num_leds, "frames": w.frames, "late": late,
+                         "grab_ms": w.grab_s / w.frames * 1000.0 if w.frames else 0.0,
+                         "busy_ms": w.busy / w.frames * 1000.0 if w.frames else 0.0,
+                         "fps": w.frames / el if el else 0.0, "error": str(w.error) if w.error else None})
+        return {"frames": self.frames, "fps": self.frames / el if el else 0.0, "monitors": mons}
+
+    def summary(self):
+        st = self.stats()
+        mons = ", ".join(f"mon{m['monitor']} {m['grab_ms']:.1f}/{m['busy_ms']:.1f} ms {m['fps']:.0f} fps {m['late']} late"
+                         + (f" ({m['error']})" if m["error"] else "") for m in st["monitors"])
+        return f"{mons}; merged {st['fps']:.1f} fps"
+
+    def close(self):
+        for w in self.workers:
+            w.running = False
+        self.clock.close()
+        for w in self.workers:
+            if w.is_alive():
+                w.join(1.0)
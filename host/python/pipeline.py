@@ -0,0 +1,121 @@
+"""
+Concurrent capture / process / transmit stages.
+- LatestSlot: single-slot hand-off, a newer value replaces an unread one
+- Stage: worker thread pulling from one slot and pushing into the next
+- Pipeline: starts/stops the stages and reports per-stage fps and drops
+A slow stage only slows itself; stale frames are dropped, never queued.
+"""
+
+import threading, time
+
+class LatestSlot:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._value = None
+        self._fresh = False
+        self._closed = False
+        self.puts = 0
+        self.drops = 0
+
+    def put(self, value):
+        with self._cond:
+            if self._fresh:
+                self.drops += 1
+            self._value = value
+            self._fresh = True
+            self.puts += 1
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        # newest unread value, or None on timeout/close
+        with self._cond:
+            if not self._fresh and not self._closed:
+                self._cond.wait(timeout)
+            if not self._fresh:
+                return None
+            self._fresh = False
+            return self._value
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class Stage(threading.Thread):
+    def __init__(self, name, fn, inbox=None, outbox=None, interval=0.0):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self.interval = interval
+        self.running = False
+        self.frames = 0
+        self.busy = 0.0
+        self.error = None
+        self._mark = (time.perf_counter(), 0)
+
+    def run(self):
+        self.running = True
+        next_t = time.perf_counter()
+        while self.running:
+            if self.inbox is not None:
+                item = self.inbox.get(timeout=0.1)
+                if item is None:
+                    continue
+            else:
+                # source stage: paced by interval
+                now = time.perf_counter()
+                if now < next_t:
+                    time.sleep(next_t - now)
+                next_t = max(next_t + self.interval, time.perf_counter())
+                item = None
+            t0 = time.perf_counter()
+            try:
+                out = self.fn() if self.inbox is None else self.fn(item)
+            except Exception as e:
+                self.error = e
+                out = None
+            self.busy += time.perf_counter() - t0
+            self.frames += 1
+            if out is not None and self.outbox is not None:
+                self.outbox.put(out)
+
+    def stop(self):
+        self.running = False
+
+    def rate(self):
+        # frames per second since the previous call
+        now = time.perf_counter()
+        t, n = self._mark
+        self._mark = (now, self.frames)
+        return (self.frames - n) / (now - t) if now > t else 0.0
+
+class Pipeline:
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def start(self):
+        for s in self.stages:
+            s.start()
+
+    def stop(self, timeout=1.0):
+        for s in self.stages:
+            s.stop()
+            if s.inbox is not None:
+                s.inbox.close()
+        for s in self.stages:
+            if s is not threading.current_thread() and s.is_alive():
+                s.join(timeout)
+
+    def stats(self):
+        out = {}
+        for s in self.stages:
+            out[s.name] = {"fps": s.rate(), "frames": s.frames,
+                           "drops": s.outbox.drops if s.outbox is not None else 0,
+                           "busy_ms": s.busy / s.frames * 1000.0 if s.frames else 0.0}
+        return out
+
+    def summary(self):
+        st = self.stats()
+        rates = " ".join(f"{k} {v['fps']:.0f}" for k, v in st.items())
+        return f"{rates} fps, {sum(v['drops'] for v in st.values())} dropped"
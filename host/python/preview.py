@@ -0,0 +1,106 @@
+"""
+Throttled GUI preview: the captured image framed by the LED rectangles.
+- submit(img, colors) from any thread hands the newest frame over through a
+  LatestSlot; frames submitted between two draws are dropped, never queued
+- a Tk timer draws at most `fps` times a second, and skips drawing while the
+  window is iconified or withdrawn
+- the image is pasted into one persistent PhotoImage shown by one canvas item
+- only LED rectangles whose colour changed since the last draw are touched
+tk_s is the time spent drawing on the Tk main loop.
+"""
+
+import time
+import numpy as np
+import cv2
+from PIL import Image, ImageTk
+from pipeline import LatestSlot
+
+class Preview:
+    def __init__(self, root, canvas, layout, inner, edge=28, pad=2, fps=10.0, timer=None):
+        # inner: (x0, y0, x1, y1) canvas area for the image, LEDs drawn around it
+        self.root = root
+        self.canvas = canvas
+        self.interval_ms = max(1, int(round(1000.0 / fps)))
+        self.timer = timer
+        x0, y0, x1, y1 = inner
+        self.size = (max(1, int(x1 - x0)), max(1, int(y1 - y0)))
+        self.photo = ImageTk.PhotoImage("RGB", self.size)
+        self.item = canvas.create_image(x0, y0, anchor='nw', image=self.photo, tag='bg')
+        self.rects = []
+        for box in layout.led_boxes(x0, y0, x1, y1, edge):
+            if box is None:
+                self.rects.append(None)
+                continue
+            bx0, by0, bx1, by1 = box
+            self.rects.append(canvas.create_rectangle(bx0 + pad, by0 + pad, bx1 - pad, by1 - pad, fill="#000000", outline=""))
+        self.shown = np.zeros((len(self.rects), 3), dtype=np.uint8)
+        self._small = np.empty((self.size[1], self.size[0], 4), dtype=np.uint8)
+        self._rgb = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self.slot = LatestSlot()
+        self.draws = self.hidden = self.led_updates = 0
+        self.tk_s = 0.0
+        self.running = False
+
+    def submit(self, img, colors):
+        # img: BGRA capture frame the caller no longer touches
+        self.slot.put((img, colors, time.perf_counter()))
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        self.running = False
+
+    def visible(self):
+        try:
+            return self.root.state() not in ("iconic", "withdrawn")
+        except Exception:
+            return False
+
+    def _tick(self):
+        if not self.running:
+            return
+        self.root.after(self.interval_ms, self._tick)
+        frame = self.slot.get(0)
+        if frame is None:
+            return
+        if not self.visible():
+            self.hidden += 1
+            return
+        t0 = time.perf_counter()
+        self.draw(*frame)
+        self.tk_s += time.perf_counter() - t0
+
+    def draw(self, img, colors, queued=None):
+        timer = self.timer
+        if timer:
+            if queued is not None:
+                # age of the frame when it reaches the screen
+                timer.add("gui wait", time.perf_counter() - queued)
+            timer.begin()
+        cv2.resize(img, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGRA2RGB, dst=self._rgb)
+        self.photo.paste(Image.fromarray(self._rgb))
+        if timer:
+            timer.lap("preview")
+        self.draw_leds(colors)
+        if timer:
+            timer.lap("leds")
+        self.draws += 1
+
+    def draw_leds(self, colors):
+        c = np.asarray(colors, dtype=np.uint8)[:len(self.rects)]
+        for i in np.flatnonzero((c != self.shown[:len(c)]).any(axis=1)):
+            rid = self.rects[i]
+            if rid is None:
+                continue
+            r, g, b = c[i]
+            self.canvas.itemconfig(rid, fill="#%02x%02x%02x" % (r, g, b))
+            self.led_updates += 1
+        self.shown[:len(c)] = c
+
+    def stats(self):
+        return {"draws": self.draws, "dropped": self.slot.drops, "hidden": self.hidden,
+                "tk_ms": self.tk_s * 1000.0, "led_updates": self.led_updates}
@@ -0,0 +1,711 @@
+"""
+Serial wire protocol shared by the Python hosts (see firmware/SyncLED/SyncLED.ino).
+  AA 55 id rgb*N chk     LED frame, device replies 'A' or 'N'
+  AA 56 len text chk     status text (test/test.ino), device replies 's' or 'n'
+  AA 57 id rgb*N chk     LED frame, device replies AA 'A' id chk or AA 'N' id chk
+  AA 58 id base n [start_lo start_hi count rgb*count]*n chk
+                         delta frame: only the listed LED ranges change; the
+                         device applies it only if its last shown frame is
+                         `base`, and replies like 0x57
+  AA 59 rate chk         switch to `rate` baud (u32 LE), device replies 'B'
+                         at the old rate and switches, or 'b' if unsupported
+  AA 5A len data chk     link probe, device replies 'P' or 'p'
+  AA 5B / AA 5C          0x57 / 0x58 with a CRC-16 (u16 LE) in place of chk
+  AA 5D clock cpu ram gpu0 gpu1 down up chk
+                         binary telemetry (test/test.ino), replies like 0x56:
+                         u32 local time in seconds since 1970, four u8
+                         percentages (255: not available), u16 network rates
+                         in 10 kB/s, all little-endian
+  AA 5E op id chk        latch, for several devices presenting together:
+                         op 1 holds every accepted frame instead of showing
+                         it, op 0 shows the held frame if its id is `id`,
+                         op 2 shows it and ends holding; device replies
+                         AA 'L' id chk or AA 'l' id chk
+Replies that carry an id are framed (chk = kind + id), so a reader that lost
+a byte drops what does not fit and finds the next reply.
+chk is the low byte of the sum of the id (the type byte for 0x56/0x59/0x5A/0x5D/0x5E) and
+the payload (not the len byte). The CRC is CRC-16/CCITT-FALSE over the same
+bytes as the sum; a byte sum misses swapped or offsetting errors, which grow
+likelier with the frame length, so long strips should use it.
+
+FrameEncoder builds every packet type in buffers allocated once per strip
+length; the encode_* functions are one-shot wrappers returning bytes.
+StreamDecoder parses a byte stream with the firmware's state machine.
+
+WindowedSender keeps up to `window` frames, and at most `max_bytes` (the
+firmware's RX_BUFFER), in flight and matches replies on a background reader
+thread; more would overflow the device's RX ring while FastLED.show() runs. Frames are never retransmitted: a newer frame always
+supersedes a lost one, so an unanswered frame simply expires. With delta=True
+each frame goes out as 0x57 or 0x58, whichever is smaller; after any NAK or
+expiry the next frame is sent in full. latch() writes 0x5E packets and
+wait_frame() waits for one frame's ACK, for devices.DeviceGroup. When the
+reader has to drop bytes to find a reply, the next frame is sent in full,
+since an ACK or NAK may have been lost with them.
+"""
+
+import binascii, struct, threading, time
+from collections import OrderedDict
+import numpy as np
+
+SYNC = 0xAA
+FT_LEDS = 0x55
+FT_STATUS = 0x56
+FT_LEDS_ID = 0x57
+FT_DELTA = 0x58
+FT_BAUD = 0x59
+FT_PROBE = 0x5A
+FT_LEDS_CRC = 0x5B
+FT_DELTA_CRC = 0x5C
+FT_TELEMETRY = 0x5D
+FT_LATCH = 0x5E
+LATCH_SHOW, LATCH_HOLD, LATCH_RELEASE = 0, 1, 2
+CRC_TYPES = {FT_LEDS_ID: FT_LEDS_CRC, FT_DELTA: FT_DELTA_CRC}
+STATUS_MAX = 240
+TELEMETRY = struct.Struct("<IBBBBHH")
+NET_UNIT = 10000  # bytes per second per step of the 0x5D network rates
+MAX_RUN = 255
+REPLY_KINDS = b"ANLl"  # framed replies: ACK/NAK of a frame, latch done/refused
+RX_BUFFER = 2048  # Serial.setRxBufferSize() in both sketches
+
+def checksum(seed, payload):
+    a = payload if isinstance(payload, np.ndarray) else np.frombuffer(payload, dtype=np.uint8)
+    return (seed + int(a.sum(dtype=np.uint32))) & 0xFF
+
+def crc16(data, crc=0xFFFF):
+    # CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), the firmware's crc16()
+    return binascii.crc_hqx(data, crc)
+
+def as_frame(colors, num_leds):
+    # (num_leds,3) uint8, padded with black or truncated
+    c = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)[:num_leds]
+    if len(c) == num_leds:
+        return c
+    out = np.zeros((num_leds, 3), dtype=np.uint8)
+    out[:len(c)] = c
+    return out
+
+def changed_ranges(colors, prev, merge_gap=1):
+    # [(start, count)] of changed LEDs; runs separated by <= merge_gap unchanged
+    # LEDs are merged since a new range header costs as much as one LED
+    idx = np.flatnonzero(np.any(colors != prev, axis=1))
+    if not len(idx):
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > merge_gap + 1)
+    starts = np.r_[idx[0], idx[breaks + 1]]
+    ends = np.r_[idx[breaks], idx[-1]] + 1
+    ranges = []
+    for a, b in zip(starts.tolist(), ends.tolist()):
+        while a < b:
+            n = min(MAX_RUN, b - a)
+            ranges.append((a, n))
+            a += n
+    return ranges
+
+def decode_frame(pkt, shown=None, shown_id=None):
+    # reference decoder for one whole 0x55/0x57/0x58/0x5B/0x5C packet, mirrors
+    # SyncLED.ino; returns (frame_id, colors), raises ValueError where the
+    # device would NAK
+    pkt = bytes(pkt)
+    ft = pkt[1] if len(pkt) > 1 else None
+    tail = 2 if ft in (FT_LEDS_CRC, FT_DELTA_CRC) else 1
+    if len(pkt) < 3 + tail or pkt[0] != SYNC or ft not in (FT_LEDS, FT_LEDS_ID, FT_DELTA, FT_LEDS_CRC, FT_DELTA_CRC):
+        raise ValueError("not an LED frame")
+    fid, end = pkt[2], len(pkt) - tail
+    if tail == 2:
+        if crc16(pkt[2:end]) != int.from_bytes(pkt[end:], 'little'):
+            raise ValueError("CRC mismatch")
+    elif checksum(0, pkt[2:end]) != pkt[end]:
+        raise ValueError("checksum mismatch")
+    if ft not in (FT_DELTA, FT_DELTA_CRC):
+        return fid, np.frombuffer(pkt[3:end], dtype=np.uint8).reshape(-1, 3).copy()
+    if shown is None or end < 5 or pkt[3] != shown_id:
+        raise ValueError("delta base mismatch")
+    out = np.array(shown, dtype=np.uint8).reshape(-1, 3).copy()
+    p = 5
+    for _ in range(pkt[4]):
+        if p + 3 > end:
+            raise ValueError("truncated range header")
+        a, n = pkt[p] | pkt[p + 1] << 8, pkt[p + 2]
+        # like the firmware, an empty range is never bounds-checked
+        if p + 3 + 3 * n > end or (n and a + n > len(out)):
+            raise ValueError("range out of bounds")
+        out[a:a + n] = np.frombuffer(pkt[p + 3:p + 3 + 3 * n], dtype=np.uint8).reshape(-1, 3)
+        p += 3 + 3 * n
+    if p != end:
+        raise ValueError("trailing bytes")
+    return fid, out
+
+class FrameEncoder:
+    # every packet type, encoded into buffers allocated once for the strip
+    # length; each method returns a memoryview of its own buffer, valid until
+    # that method is called again. crc=True sends 0x57/0x58 as 0x5B/0x5C.
+    def __init__(self, num_leds, crc=False):
+        self.num_leds = num_leds
+        self.crc = crc
+        n3 = 3 * num_leds
+        self._full = bytearray(3 + n3 + 2)
+        self._rgb = np.frombuffer(self._full, dtype=np.uint8)[3:3 + n3].reshape(-1, 3)
+        # worst case delta: 255 range headers around every LED
+        self._delta = bytearray(5 + 3 * 255 + n3 + 2)
+        self._darr = np.frombuffer(self._delta, dtype=np.uint8)
+        self._small = bytearray(3 + 255 + 1)
+
+    def frame_type(self, ft):
+        if not self.crc:
+            return ft
+        if ft not in CRC_TYPES:
+            raise ValueError("CRC frames need frame-id replies (0x57/0x58)")
+        return CRC_TYPES[ft]
+
+    def _seal(self, buf, ft, start, end, seed=0):
+        # header plus the trailer over buf[start:end]
+        buf[0] = SYNC
+        buf[1] = ft
+        if ft in (FT_LEDS_CRC, FT_DELTA_CRC):
+            v = crc16(memoryview(buf)[start:end])
+            buf[end] = v & 0xFF
+            buf[end + 1] = v >> 8
+            return memoryview(buf)[:end + 2]
+        buf[end] = checksum(seed, memoryview(buf)[start:end])
+        return memoryview(buf)[:end + 1]
+
+    def leds(self, frame_id, colors, ft=FT_LEDS):
+        c = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)[:self.num_leds]
+        self._rgb[:len(c)] = c
+        self._rgb[len(c):] = 0
+        self._full[2] = frame_id & 0xFF
+        return self._seal(self._full, self.frame_type(ft), 2, 3 + 3 * self.num_leds)
+
+    def delta(self, frame_id, base_id, colors, prev):
+        # colors/prev are (num_leds,3) uint8; None when the change needs more
+        # ranges than the header can count
+        ranges = changed_ranges(colors, prev)
+        if len(ranges) > 255:
+            return None
+        b, arr = self._delta, self._darr
+        flat = colors.reshape(-1)
+        b[2], b[3], b[4] = frame_id & 0xFF, base_id & 0xFF, len(ranges)
+        p = 5
+        for a, n in ranges:
+            b[p], b[p + 1], b[p + 2] = a & 0xFF, a >> 8, n
+            arr[p + 3:p + 3 + 3 * n] = flat[3 * a:3 * (a + n)]
+            p += 3 + 3 * n
+        return self._seal(b, self.frame_type(FT_DELTA), 2, p)
+
+    def _sized(self, ft, data, limit):
+        data = bytes(data)[:limit]
+        b = self._small
+        b[2] = len(data)
+        b[3:3 + len(data)] = data
+        return self._seal(b, ft, 3, 3 + len(data), ft)
+
+    def status(self, text):
+        return self._sized(FT_STATUS, text.encode('utf-8') if isinstance(text, str) else text, STATUS_MAX)
+
+    def probe(self, data):
+        return self._sized(FT_PROBE, data, 255)
+
+    def baud(self, rate):
+        b = self._small
+        b[2:6] = int(rate).to_bytes(4, 'little')
+        return self._seal(b, FT_BAUD, 2, 6, FT_BAUD)
+
+    def telemetry(self, clock, cpu, ram, gpu0, gpu1, down, up):
+        # percentages 0..100 (None: not available), down/up in bytes per second
+        pct = lambda v: 255 if v is None else min(100, max(0, int(round(v))))
+        rate = lambda v: min(0xFFFF, max(0, int(round((v or 0) / NET_UNIT))))
+        b = self._small
+        TELEMETRY.pack_into(b, 2, int(clock) & 0xFFFFFFFF, pct(cpu), pct(ram), pct(gpu0), pct(gpu1), rate(down), rate(up))
+        return self._seal(b, FT_TELEMETRY, 2, 2 + TELEMETRY.size, FT_TELEMETRY)
+
+    def latch(self, op, frame_id):
+        b = self._small
+        b[2], b[3] = op, frame_id & 0xFF
+        return self._seal(b, FT_LATCH, 2, 4, FT_LATCH)
+
+def encode_leds(frame_id, colors, num_leds, ft=FT_LEDS, crc=False):
+    return bytes(FrameEncoder(num_leds, crc).leds(frame_id, colors, ft))
+
+def encode_delta(frame_id, base_id, colors, prev, crc=False):
+    c = np.asarray(colors, dtype=np.uint8).reshape(-1, 3)
+    pkt = FrameEncoder(len(c), crc).delta(frame_id, base_id, c, np.asarray(prev, dtype=np.uint8).reshape(-1, 3))
+    return None if pkt is None else bytes(pkt)
+
+def encode_status(text):
+    return bytes(FrameEncoder(0).status(text))
+
+def encode_baud(rate):
+    return bytes(FrameEncoder(0).baud(rate))
+
+def encode_probe(data):
+    return bytes(FrameEncoder(0).probe(data))
+
+def encode_telemetry(clock, cpu, ram, gpu0, gpu1, down, up):
+    return bytes(FrameEncoder(0).telemetry(clock, cpu, ram, gpu0, gpu1, down, up))
+
+def encode_latch(op, frame_id):
+    return bytes(FrameEncoder(0).latch(op, frame_id))
+
+def encode_reply(kind, frame_id):
+    # the firmware's reply(): AA kind id chk
+    kind = ord(kind) if isinstance(kind, str) else kind
+    return bytes([SYNC, kind, frame_id & 0xFF, checksum(kind, bytes([frame_id & 0xFF]))])
+
+def telemetry_fields(body):
+    clock, cpu, ram, gpu0, gpu1, down, up = TELEMETRY.unpack(bytes(body))
+    pct = lambda v: None if v == 255 else v
+    return {"clock": clock, "cpu": pct(cpu), "ram": pct(ram), "gpu0": pct(gpu0), "gpu1": pct(gpu1),
+            "down": down * NET_UNIT, "up": up * NET_UNIT}
+
+def decode_telemetry(pkt):
+    # reference decoder for one whole 0x5D packet -> dict (rates in bytes/s)
+    pkt = bytes(pkt)
+    if len(pkt) != 3 + TELEMETRY.size or pkt[0] != SYNC or pkt[1] != FT_TELEMETRY:
+        raise ValueError("not a telemetry packet")
+    if checksum(FT_TELEMETRY, pkt[2:-1]) != pkt[-1]:
+        raise ValueError("checksum mismatch")
+    return telemetry_fields(pkt[2:-1])
+
+class StreamDecoder:
+    # the firmware's parser in Python: same resync rules (a bad type byte
+    # drops back to hunting for 0xAA, without rechecking it), the same 200 ms
+    # byte timeout and the same delta base tracking. status=True also parses
+    # 0x56 and 0x5D like test.ino; rates, if given, are the baud rates 0x59 accepts.
+    # feed() returns finished packets as (type, ok, frame_id, value) tuples:
+    # value is the accepted colours for LED frames, the text for 0x56, the
+    # telemetry_fields() dict for 0x5D, the rate for 0x59, the data for 0x5A
+    # and the op for 0x5E; frame_id is None for packets other than LED frames
+    # and 0x5E. A 0x5E show fails unless its id is the last accepted frame.
+    H1, H2, BODY, CHK = range(4)
+
+    def __init__(self, num_leds, status=False, crc=True, rates=None, byte_timeout=0.2):
+        self.num_leds = num_leds
+        self.rates = None if rates is None else set(rates)
+        self.byte_timeout = byte_timeout
+        self.types = {FT_LEDS, FT_LEDS_ID, FT_DELTA, FT_BAUD, FT_PROBE, FT_LATCH}
+        if status:
+            self.types |= {FT_STATUS, FT_TELEMETRY}
+        if crc:
+            self.types |= {FT_LEDS_CRC, FT_DELTA_CRC}
+        self.shown = np.zeros((num_leds, 3), dtype=np.uint8)
+        self.have_base = False
+        self.base_id = 0
+        self.packets = self.bad = self.timeouts = self.skipped = 0
+        self.last = None
+        self.body = bytearray()
+        self.tail = bytearray()
+        self.reset()
+
+    def reset(self):
+        # back to hunting for a header, like the firmware's byte timeout
+        self.st = self.H1
+        self.ft = 0
+        self.step = None
+        self.need = 0
+
+    def feed(self, data, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.st != self.H1 and self.last is not None and now - self.last > self.byte_timeout:
+            self.timeouts += 1
+            self.reset()
+        self.last = now
+        data = bytes(data)
+        out = []
+        i, n = 0, len(data)
+        while i < n:
+            st = self.st
+            if st == self.H1:
+                j = data.find(SYNC, i)
+                if j < 0:
+                    self.skipped += n - i
+                    break
+                self.skipped += j - i
+                i = j + 1
+                self.st = self.H2
+            elif st == self.H2:
+                ft = data[i]
+                i += 1
+                if ft in self.types:
+                    self._begin(ft)
+                else:
+                    self.skipped += 2
+                    self.st = self.H1
+            elif st == self.BODY:
+                k = min(self.need, n - i)
+                self.body += data[i:i + k]
+                i += k
+                self.need -= k
+                if not self.need:
+                    self.step()
+            else:
+                k = min(self.need, n - i)
+                self.tail += data[i:i + k]
+                i += k
+                self.need -= k
+                if not self.need:
+                    out.append(self._finish())
+                    self.reset()
+        return out
+
+    def _begin(self, ft):
+        self.ft = ft
+        self.body.clear()
+        self.tail.clear()
+        self.st = self.BODY
+        if ft in (FT_LEDS, FT_LEDS_ID, FT_LEDS_CRC):
+            self.need, self.step = 1 + 3 * self.num_leds, self._check
+        elif ft in (FT_DELTA, FT_DELTA_CRC):
+            self.need, self.step = 3, self._delta_head
+        elif ft == FT_BAUD:
+            self.need, self.step = 4, self._check
+        elif ft == FT_LATCH:
+            self.need, self.step = 2, self._check
+        elif ft == FT_TELEMETRY:
+            self.need, self.step = TELEMETRY.size, self._check
+        else:
+            self.need, self.step = 1, self._length
+
+    def _check(self):
+        self.st = self.CHK
+        self.need = 2 if self.ft in (FT_LEDS_CRC, FT_DELTA_CRC) else 1
+
+    def _length(self):
+        size = self.body[0]
+        if self.ft == FT_STATUS and not 0 < size <= STATUS_MAX:
+            # test.ino drops a bad status length without a reply
+            self.reset()
+        elif size:
+            self.need, self.step = size, self._check
+        else:
+            self._check()
+
+    def _delta_head(self):
+        # fid, base, range count: the base is checked against the frame shown now
+        self.delta_ok = self.have_base and self.body[1] == self.base_id
+        self.ranges = self.body[2]
+        self.work = self.shown.copy()
+        self._next_range()
+
+    def _next_range(self):
+        if self.ranges:
+            self.ranges -= 1
+            self.need, self.step = 3, self._range_head
+        else:
+            self._check()
+
+    def _range_head(self):
+        h = self.body[-3:]
+        a, cnt = h[0] | h[1] << 8, h[2]
+        self.range = (a, cnt)
+        if cnt:
+            self.delta_ok = self.delta_ok and a + cnt <= self.num_leds
+            self.need, self.step = 3 * cnt, self._range_data
+        else:
+            self._next_range()
+
+    def _range_data(self):
+        a, cnt = self.range
+        if self.delta_ok:
+            self.work[a:a + cnt] = np.frombuffer(self.body, dtype=np.uint8)[len(self.body) - 3 * cnt:].reshape(-1, 3)
+        self._next_range()
+
+    def _finish(self):
+        ft, body, tail = self.ft, self.body, self.tail
+        self.packets += 1
+        fid = value = None
+        if ft in (FT_LEDS_CRC, FT_DELTA_CRC):
+            ok = crc16(body) == tail[0] | tail[1] << 8
+        elif ft in (FT_LEDS, FT_LEDS_ID, FT_DELTA):
+            ok = checksum(0, body) == tail[0]
+        elif ft in (FT_BAUD, FT_TELEMETRY, FT_LATCH):
+            ok = checksum(ft, body) == tail[0]
+        else:
+            ok = checksum(ft, memoryview(body)[1:]) == tail[0]
+        if ft in (FT_DELTA, FT_DELTA_CRC):
+            fid = body[0]
+            ok = ok and self.delta_ok
+            if ok:
+                self.shown = self.work
+        elif ft in (FT_LEDS, FT_LEDS_ID, FT_LEDS_CRC):
+            fid = body[0]
+            if ok:
+                self.shown = np.frombuffer(body, dtype=np.uint8, offset=1).reshape(-1, 3).copy()
+        elif ft == FT_BAUD:
+            value = int.from_bytes(body, 'little')
+            ok = ok and (self.rates is None or value in self.rates)
+        elif ft == FT_TELEMETRY:
+            value = telemetry_fields(body)
+        elif ft == FT_LATCH:
+            value, fid = body[0], body[1]
+            ok = ok and value <= LATCH_RELEASE and (value != LATCH_SHOW or (self.have_base and self.base_id == fid))
+            self.bad += not ok
+            return ft, ok, fid, value
+        else:
+            value = bytes(body[1:])
+        if fid is not None:
+            if ok:
+                self.base_id = fid
+                self.have_base = True
+                value = self.shown
+        self.bad += not ok
+        return ft, ok, fid, value
+
+    @staticmethod
+    def reply(packet):
+        # the bytes the firmware answers a decoded packet with
+        ft, ok, fid, _ = packet
+        if ft in (FT_STATUS, FT_TELEMETRY):
+            return b"s" if ok else b"n"
+        if ft == FT_BAUD:
+            return b"B" if ok else b"b"
+        if ft == FT_PROBE:
+            return b"P" if ok else b"p"
+        if ft == FT_LATCH:
+            return encode_reply("L" if ok else "l", fid)
+        if ft == FT_LEDS:
+            return b"A" if ok else b"N"
+        return encode_reply("A" if ok else "N", fid)
+
+class WindowedSender:
+    # send() is meant for one thread: packets are encoded into the sender's
+    # reused buffers and written after the lock is released
+    def __init__(self, ser, num_leds, window=4, ack_timeout=0.25, id_acks=True, delta=True, crc=False, max_bytes=RX_BUFFER):
+        if crc and not id_acks:
+            raise ValueError("CRC frames need frame-id ACKs")
+        self.ser = ser
+        self.num_leds = num_leds
+        self.window = window
+        self.max_bytes = max_bytes
+        self.ack_timeout = ack_timeout
+        # id_acks: firmware echoes the frame id (0x57 frames); otherwise replies match oldest first
+        self.id_acks = id_acks
+        self.delta = delta and id_acks
+        self.encoder = FrameEncoder(num_leds, crc)
+        # latch() has its own buffer, it may run beside send()
+        self.latches = FrameEncoder(0)
+        self.base = None
+        self.base_id = 0
+        self.frame_id = 0
+        self.inflight = OrderedDict()
+        self.sizes = [0] * 256  # bytes of each frame id's last packet
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.sent = self.acked = self.nacked = self.expired = 0
+        self.deltas = self.bytes_sent = self.bytes_full = 0
+        self.status_acked = self.status_nacked = 0
+        self.latched = self.latch_failed = self.latch_replies = 0
+        self.resyncs = 0
+        self.latch_ok = None
+        self.last_acked = None
+        self._latch_t = None
+        self.rtt = self.latch_rtt = 0.0
+        self.timing = {"wait": 0.0, "encode": 0.0, "write": 0.0}
+        self.running = True
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def send(self, colors):
+        t0 = time.perf_counter()
+        c = as_frame(colors, self.num_leds)
+        # a full frame, the most the next packet can take
+        most = 3 + 3 * self.num_leds + (2 if self.encoder.crc else 1)
+        with self.cond:
+            while self.running:
+                self._expire()
+                if len(self.inflight) < self.window and (not self.inflight or
+                        sum(self.sizes[f] for f in self.inflight) + most <= self.max_bytes):
+                    break
+                oldest = next(iter(self.inflight.values()))
+                self.cond.wait(max(0.001, oldest + self.ack_timeout - time.perf_counter()))
+            t1 = time.perf_counter()
+            fid = self.frame_id
+            pkt = self.encoder.leds(fid, c, FT_LEDS_ID if self.id_acks else FT_LEDS)
+            full = len(pkt)
+            if self.delta and self.base is not None:
+                d = self.encoder.delta(fid, self.base_id, c, self.base)
+                if d is not None and len(d) < full:
+                    pkt = d
+            self.base = c.copy()
+            self.base_id = fid
+            if self.last_acked == fid:
+                # an ACK from 256 frames ago must not count for this one
+                self.last_acked = None
+            self.inflight[fid] = time.perf_counter()
+            self.sizes[fid] = len(pkt)
+            self.frame_id = (self.frame_id + 1) & 0xFF
+        t2 = time.perf_counter()
+        ok = self.write(pkt)
+        # seconds spent in the last send(): waiting for a window slot, encoding, writing
+        self.timing = {"wait": t1 - t0, "encode": t2 - t1, "write": time.perf_counter() - t2}
+        if not ok:
+            with self.cond:
+                self.inflight.pop(fid, None)
+                self.base = None
+            return None
+        self.sent += 1
+        self.deltas += pkt[1] in (FT_DELTA, FT_DELTA_CRC)
+        self.bytes_sent += len(pkt)
+        self.bytes_full += full
+        return fid
+
+    def latch(self, op, fid):
+        # writes a 0x5E packet; returns the token wait_latch() waits past
+        with self.cond:
+            seq = self.latch_replies
+            pkt = bytes(self.latches.latch(op, fid))
+            self._latch_t = time.perf_counter()
+        return seq if self.write(pkt) else None
+
+    def wait_latch(self, seq, timeout):
+        # True/False from the first latch reply after latch() returned seq,
+        # None if none came within timeout
+        end = time.perf_counter() + timeout
+        with self.cond:
+            while self.latch_replies == seq and self.running:
+                left = end - time.perf_counter()
+                if left <= 0:
+                    return None
+                self.cond.wait(left)
+            return self.latch_ok if self.latch_replies != seq else None
+
+    def wait_frame(self, fid, deadline):
+        # True once frame fid is ACKed; False after its NAK or expiry, or at
+        # `deadline` (perf_counter time)
+        with self.cond:
+            while self.running:
+                self._expire()
+                if fid not in self.inflight:
+                    return self.last_acked == fid
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return False
+                self.cond.wait(min(left, self.ack_timeout))
+            return False
+
+    def write(self, pkt):
+        try:
+            with self.write_lock:
+                self.ser.write(pkt)
+            return True
+        except Exception:
+            return False
+
+    def _expire(self):
+        now = time.perf_counter()
+        while self.inflight:
+            fid, t = next(iter(self.inflight.items()))
+            if now - t < self.ack_timeout:
+                break
+            del self.inflight[fid]
+            self.expired += 1
+            # the device may not hold our delta base any more
+            self.base = None
+
+    def _reply(self, ok, fid=None):
+        with self.cond:
+            if fid is None:
+                if not self.inflight:
+                    return
+                fid = next(iter(self.inflight))
+            t = self.inflight.pop(fid, None)
+            if t is None:
+                return
+            if ok:
+                self.acked += 1
+                self.last_acked = fid
+                rtt = time.perf_counter() - t
+                self.rtt = rtt if not self.rtt else self.rtt * 0.9 + rtt * 0.1
+            else:
+                self.nacked += 1
+                self.base = None
+            self.cond.notify_all()
+
+    def _latch_reply(self, ok):
+        with self.cond:
+            self.latch_replies += 1
+            self.latch_ok = ok
+            if ok:
+                self.latched += 1
+            else:
+                self.latch_failed += 1
+            if self._latch_t is not None:
+                # a show replies after FastLED.show(), so this is mostly the show time
+                rtt = time.perf_counter() - self._latch_t
+                self.latch_rtt = rtt if not self.latch_rtt else self.latch_rtt * 0.9 + rtt * 0.1
+                self._latch_t = None
+            self.cond.notify_all()
+
+    def _read_loop(self):
+        buf = bytearray()
+        while self.running:
+            try:
+                data = self.ser.read(max(1, self.ser.in_waiting))
+            except Exception:
+                if not self.running:
+                    break
+                time.sleep(0.05)
+                continue
+            buf += data
+            i, dropped = 0, False
+            while i < len(buf):
+                b = buf[i]
+                if b == SYNC:
+                    if len(buf) - i < 4:
+                        break
+                    kind, fid, chk = buf[i + 1], buf[i + 2], buf[i + 3]
+                    if kind in REPLY_KINDS and chk == (kind + fid) & 0xFF:
+                        if kind in b"Ll":
+                            self._latch_reply(kind == ord('L'))
+                        else:
+                            self._reply(kind == ord('A'), fid)
+                        i += 4
+                        continue
+                    dropped = True
+                elif b in b"AN" and not self.id_acks:
+                    # 0x55 replies are a bare A/N
+                    self._reply(b == ord('A'))
+                elif b == ord('s'):
+                    self.status_acked += 1
+                elif b == ord('n'):
+                    self.status_nacked += 1
+                else:
+                    dropped = True
+                i += 1
+            del buf[:i]
+            if dropped and self.id_acks:
+                self._resync()
+
+    def _resync(self):
+        # a reply may have gone with the dropped bytes: no delta may build on
+        # a frame whose fate we missed
+        with self.cond:
+            self.resyncs += 1
+            self.base = None
+
+    def stats(self):
+        with self.cond:
+            self._expire()
+            return {"sent": self.sent, "acked": self.acked, "nacked": self.nacked, "expired": self.expired,
+                    "inflight": len(self.inflight), "rtt_ms": self.rtt * 1000.0,
+                    "deltas": self.deltas, "bytes_sent": self.bytes_sent, "bytes_full": self.bytes_full,
+                    "latched": self.latched, "latch_failed": self.latch_failed, "latch_ms": self.latch_rtt * 1000.0,
+                    "resyncs": self.resyncs}
+
+    def close(self):
+        # True once the reader has left ser.read(): only then may link.py
+        # probe the port, or the reader would take the replies
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.reader is threading.current_thread():
+            return False
+        cancel = getattr(self.ser, 'cancel_read', None)
+        end = time.perf_counter() + (getattr(self.ser, 'timeout', None) or 0.0) + 0.5
+        while self.reader.is_alive() and time.perf_counter() < end:
+            try:
+                if cancel:
+                    cancel()
+            except Exception:
+                pass
+            self.reader.join(0.05)
+        return not self.reader.is_alive()
@@ -0,0 +1,197 @@
+"""
+Captured-frame recordings for deterministic replays.
+- FrameRecorder: appends each grabbed RES frame with its timestamp to a
+  memory-mapped file
+- Recording: read-only memory-mapped view of such a file
+- ReplayCapture: a capture source (grab() like FullFrameCapture) that plays a
+  recording back at its original pace, scaled by `speed`, or as fast as it is
+  grabbed (speed 0); no mss or display needed
+File layout, little-endian: a 64-byte header, the pixel mask (packbits) for
+band recordings, then fixed-size records of an f64 timestamp (seconds since
+the first frame) and the BGR pixels, alpha dropped. Band recordings keep only
+the pixels inside the bands, about half of a 128x128 frame at the default
+depth. The file grows in chunks and the frame count in the header is updated
+only after each record is complete, so a recording cut short by a crash still
+opens with every finished frame.
+"""
+
+import mmap, struct, time
+import numpy as np
+
+MAGIC = b"SLRF"
+VERSION = 1
+HEADER = struct.Struct("<4sHBBHHIQHHd")  # magic, version, channels, flags, w, h, pixels, count, monitor w, h, created
+HEADER_SIZE = 64
+COUNT_OFFSET = 16
+FLAG_MASK = 1
+
+def record_dtype(pixels):
+    # timestamp then pixels, padded to 8 bytes so every timestamp is aligned
+    return np.dtype({"names": ["t", "px"], "formats": ["<f8", ("u1", (pixels, 3))], "offsets": [0, 8],
+                     "itemsize": 8 + (pixels * 3 + 7) // 8 * 8})
+
+def _data_offset(w, h, masked):
+    return HEADER_SIZE + ((w * h + 7) // 8 + 7) // 8 * 8 if masked else HEADER_SIZE
+
+class FrameRecorder:
+    def __init__(self, path, res, mask=None, monitor=None, chunk=256):
+        w, h = res
+        self.res = res
+        self.mask = None if mask is None else np.asarray(mask, dtype=bool).reshape(h, w)
+        self.index = None if self.mask is None else np.flatnonzero(self.mask)
+        pixels = w * h if self.index is None else len(self.index)
+        self.dtype = record_dtype(pixels)
+        self.offset = _data_offset(w, h, self.mask is not None)
+        self.chunk = chunk
+        self.count = 0
+        self.t0 = None
+        self.path = path
+        self.f = open(path, "w+b")
+        mw, mh = (monitor["width"], monitor["height"]) if monitor else (w, h)
+        self.f.write(HEADER.pack(MAGIC, VERSION, 3, FLAG_MASK if self.mask is not None else 0, w, h, pixels, 0,
+                                 mw, mh, time.time()).ljust(HEADER_SIZE, b"\0"))
+        if self.mask is not None:
+            self.f.write(np.packbits(self.mask.reshape(-1)).tobytes())
+        self.capacity = 0
+        self.mm = self.records = None
+        self._grow()
+
+    def _grow(self):
+        # views into the old map must go before it can be closed
+        self.records = None
+        if self.mm is not None:
+            self.mm.close()
+        self.capacity += self.chunk
+        self.f.truncate(self.offset + self.capacity * self.dtype.itemsize)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        self.records = np.ndarray((self.capacity,), self.dtype, self.mm, self.offset)
+
+    def append(self, frame, now=None):
+        # frame: (h,w,3|4) BGR(A) as returned by a capture's grab()
+        now = time.perf_counter() if now is None else now
+        if self.t0 is None:
+            self.t0 = now
+        if self.count == self.capacity:
+            self._grow()
+        r = self.records[self.count]
+        r["t"] = now - self.t0
+        flat = frame.reshape(-1, frame.shape[2])
+        if self.index is None:
+            r["px"] = flat[:, :3]
+        else:
+            np.take(flat[:, :3], self.index, axis=0, out=r["px"])
+        self.count += 1
+        # published after the pixels, so readers never see a half-written frame
+        struct.pack_into("<Q", self.mm, COUNT_OFFSET, self.count)
+
+    def bytes_per_frame(self):
+        return self.dtype.itemsize
+
+    def close(self):
+        if self.f is None:
+            return
+        self.records = None
+        self.mm.flush()
+        self.mm.close()
+        self.f.truncate(self.offset + self.count * self.dtype.itemsize)
+        self.f.close()
+        self.f = None
+
+class Recording:
+    def __init__(self, path):
+        self.path = path
+        self.map = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(self.map) < HEADER_SIZE:
+            raise ValueError(f"{path}: not a frame recording")
+        (magic, version, channels, flags, w, h, pixels, count, mw, mh,
+         self.created) = HEADER.unpack_from(self.map[:HEADER_SIZE].tobytes())
+        if magic != MAGIC or version != VERSION or channels != 3:
+            raise ValueError(f"{path}: not a version {VERSION} frame recording")
+        self.res = (w, h)
+        self.monitor = {"left": 0, "top": 0, "width": mw, "height": mh}
+        self.dtype = record_dtype(pixels)
+        off = _data_offset(w, h, flags & FLAG_MASK)
+        self.mask = None
+        self.index = None
+        if flags & FLAG_MASK:
+            bits = np.unpackbits(self.map[HEADER_SIZE:HEADER_SIZE + (w * h + 7) // 8])[:w * h]
+            self.mask = bits.astype(bool).reshape(h, w)
+            self.index = np.flatnonzero(self.mask)
+        # a file still being written (or cut short) holds fewer records than it has room for
+        count = min(count, (len(self.map) - off) // self.dtype.itemsize)
+        self.records = self.map[off:off + count * self.dtype.itemsize].view(self.dtype)
+        self.times = self.records["t"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def duration(self):
+        return float(self.times[-1]) if len(self) else 0.0
+
+    def frame(self, i, out=None):
+        # frame i as (h,w,4) BGRA, pixels outside a band mask black
+        w, h = self.res
+        if out is None:
+            out = np.zeros((h, w, 4), dtype=np.uint8)
+            out[:, :, 3] = 255
+        flat = out.reshape(-1, 4)
+        if self.index is None:
+            flat[:, :3] = self.records[i]["px"]
+        else:
+            flat[self.index, :3] = self.records[i]["px"]
+        return out
+
+    def close(self):
+        self.records = self.times = None
+        self.map = None
+
+class ReplayCapture:
+    # drop-in for FullFrameCapture/BandCapture; grab() raises EOFError after the
+    # last frame unless loop is set
+    def __init__(self, path, speed=1.0, loop=False):
+        self.recording = Recording(path)
+        if not len(self.recording):
+            raise ValueError(f"{path}: no frames recorded")
+        self.res = self.recording.res
+        self.mask = self.recording.mask
+        self.speed = speed
+        self.loop = loop
+        self.bytes_grabbed = self.recording.dtype.itemsize
+        self.frames = 0
+        self.behind = 0.0
+        self.frame = self.recording.frame(0)
+        t = self.recording.times
+        # a looped replay restarts one typical frame gap after the last frame
+        self.period = float(t[-1]) + (float(np.median(np.diff(t))) if len(t) > 1 else 0.0)
+        self._i = 0
+        self._t0 = None
+        self._base = 0.0
+
+    def grab(self):
+        rec = self.recording
+        if self._i == len(rec):
+            if not self.loop:
+                raise EOFError("end of recording")
+            self._i = 0
+            self._base += self.period
+        now = time.perf_counter()
+        if self._t0 is None:
+            self._t0 = now
+        if self.speed > 0:
+            due = self._t0 + (self._base + float(rec.times[self._i])) / self.speed
+            if now < due:
+                time.sleep(due - now)
+            else:
+                self.behind = max(self.behind, now - due)
+        rec.frame(self._i, self.frame)
+        self._i += 1
+        self.frames += 1
+        return self.frame
+
+    def stats(self):
+        el = time.perf_counter() - self._t0 if self._t0 is not None else 0.0
+        return {"frames": self.frames, "seconds": el, "fps": self.frames / el if el else 0.0,
+                "behind_ms": self.behind * 1000.0, "recorded": len(self.recording)}
+
+    def close(self):
+        self.recording.close()
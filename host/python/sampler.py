@@ -0,0 +1,140 @@
+"""
+Perimeter sampler shared by the Python hosts.
+- Zone boundaries are computed once per (resolution, layout) and cached
+- Each edge band is collapsed to a 1D prefix sum per frame (a summed-area
+  table along the edge), then one gather gives every LED's zone sum
+- Returns an (N,3) uint8 array, same values as the old per-LED loop
+SparseSampler handles any layout.py geometry as one CSR mat-vec.
+Frames may be RGB or BGR(A); with bgr=True the channel swap is done on the
+(N,3) result instead of on the frame.
+"""
+
+import numpy as np
+
+DEPTH = 0.12
+
+class PerimeterSampler:
+    def __init__(self, top, right, bottom, left, num_leds=None, depth=DEPTH):
+        self.counts = (top, right, bottom, left)
+        self.num_leds = num_leds if num_leds is not None else top + right + bottom + left
+        self.depth = depth
+        self._shape = None
+
+    def zones(self, h, w):
+        # (N,4) array of y0,y1,x0,x1 in strip order: top L->R, right T->B, bottom R->L, left B->T
+        top, right, bottom, left = self.counts
+        d = self.depth
+        z = []
+        sw = w / top if top else 0
+        y1 = max(1, int(h * d))
+        for i in range(top):
+            z.append((0, y1, int(i * sw), int((i + 1) * sw)))
+        sh = h / right if right else 0
+        x0 = max(0, w - int(w * d))
+        for i in range(right):
+            z.append((int(i * sh), int((i + 1) * sh), x0, w))
+        sw = w / bottom if bottom else 0
+        y0 = max(0, h - int(h * d))
+        btm = [(y0, h, int(i * sw), int((i + 1) * sw)) for i in range(bottom)]
+        z += btm[::-1]
+        sh = h / left if left else 0
+        x1 = min(int(w * d), w)
+        lft = [(int(i * sh), int((i + 1) * sh), 0, x1) for i in range(left)]
+        z += lft[::-1]
+        z = z[:self.num_leds]
+        z += [(0, 0, 0, 0)] * (self.num_leds - len(z))
+        return np.array(z, dtype=np.intp).reshape(-1, 4)
+
+    def _prepare(self, h, w, c):
+        d = self.depth
+        # one prefix table per edge band, laid out back to back: top, right, bottom, left
+        self._bands = (
+            (np.s_[0:max(1, int(h * d)), :], 0, w),
+            (np.s_[:, max(0, w - int(w * d)):w], 1, h),
+            (np.s_[max(0, h - int(h * d)):h, :], 0, w),
+            (np.s_[:, 0:min(int(w * d), w)], 1, h),
+        )
+        offs = np.cumsum([0, w + 1, h + 1, w + 1])
+        self._prefix = np.zeros((2 * (w + h) + 4, c), dtype=np.int64)
+        lo = []
+        hi = []
+        area = []
+        n = 0
+        z = self.zones(h, w)
+        for edge, cnt in enumerate(self.counts):
+            for y0, y1, x0, x1 in z[n:n + cnt]:
+                a, b = (x0, x1) if self._bands[edge][1] == 0 else (y0, y1)
+                lo.append(offs[edge] + a)
+                hi.append(offs[edge] + b)
+                area.append((y1 - y0) * (x1 - x0))
+            n += cnt
+        lo = lo[:self.num_leds]
+        hi = hi[:self.num_leds]
+        area = area[:self.num_leds]
+        pad = self.num_leds - len(lo)
+        self._lo = np.array(lo + [0] * pad, dtype=np.intp)
+        self._hi = np.array(hi + [0] * pad, dtype=np.intp)
+        # empty zones divide by 1 and come out as 0 like the old [0,0,0] fallback
+        self._area = np.maximum(np.array(area + [0] * pad), 1).astype(np.float64)[:, None]
+        self._offs = offs
+        self._shape = (h, w, c)
+
+    def sample(self, img, bgr=False):
+        h, w, c = img.shape
+        if self._shape != (h, w, c):
+            self._prepare(h, w, c)
+        p = self._prefix
+        for (sl, axis, length), o in zip(self._bands, self._offs):
+            seg = p[o + 1:o + 1 + length]
+            np.sum(img[sl], axis=axis, dtype=np.int64, out=seg)
+            np.cumsum(seg, axis=0, out=seg)
+        s = p[self._hi] - p[self._lo]
+        s = s[:, 2::-1] if bgr else s[:, :3]
+        return (s / self._area).astype(np.uint8)
+
+class SparseSampler:
+    def __init__(self, layout):
+        self.layout = layout
+        self.num_leds = layout.num_leds
+        self._shape = None
+
+    def _prepare(self, h, w, c):
+        m = self.layout.matrix(h, w)
+        indptr = m["indptr"]
+        self._indices = m["indices"].astype(np.intp)
+        self._weights = m["weights"]
+        self._unit = bool(np.all(self._weights == 1))
+        # reduceat only sees non-empty rows; empty rows stay 0
+        rows = np.diff(indptr) > 0
+        self._rows = np.flatnonzero(rows)
+        self._dense = len(self._rows) == self.num_leds
+        self._starts = indptr[:-1][rows]
+        norm = np.add.reduceat(self._weights.astype(np.float64), self._starts) if len(self._starts) else np.zeros(0)
+        self._norm = norm[:, None]
+        # per-frame work runs entirely in these buffers
+        acc = np.int64 if self._unit else np.float64
+        self._vals = np.empty((len(self._indices), c), dtype=np.uint8)
+        self._wide = np.empty((len(self._indices), c), dtype=acc)
+        self._sums = np.empty((len(self._starts), c), dtype=acc)
+        self._mean = np.empty((len(self._starts), 3), dtype=np.float64)
+        self._out = np.zeros((self.num_leds, 3), dtype=np.uint8)
+        self._shape = (h, w, c)
+
+    def sample(self, img, bgr=False):
+        h, w, c = img.shape
+        if self._shape != (h, w, c):
+            self._prepare(h, w, c)
+        if not len(self._rows):
+            return self._out.copy()
+        np.take(img.reshape(-1, c), self._indices, axis=0, out=self._vals, mode='clip')
+        if self._unit:
+            np.copyto(self._wide, self._vals)
+        else:
+            np.multiply(self._vals, self._weights[:, None], out=self._wide)
+        np.add.reduceat(self._wide, self._starts, axis=0, out=self._sums)
+        np.divide(self._sums[:, 2::-1] if bgr else self._sums[:, :3], self._norm, out=self._mean)
+        if self._dense:
+            np.copyto(self._out, self._mean, casting='unsafe')
+        else:
+            self._out[self._rows] = self._mean
+        return self._out.copy()
@@ -0,0 +1,153 @@
+"""
+System telemetry for the status overlay and the 0x5D status packet.
+TelemetrySampler reads CPU, RAM, GPU and network rates on its own thread every
+`period` seconds, so psutil and NVML calls never stall the Tk main loop. Each
+sample lands in a fixed float32 ring of length + 1 rows; the sample count is
+bumped only after the row is written, and readers (latest(), history()) see
+the newest `length` rows, never the spare one being written, so they need no
+lock. Missing sources read as NaN: GPUs without NVML, and everything when
+psutil is not installed. mb_per_s() converts a network rate to RATE_UNIT for
+everything that shows or sends one as text.
+"""
+
+import threading, time
+import numpy as np
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except Exception:
+    PSUTIL_AVAILABLE = False
+
+FIELDS = ("cpu", "ram", "gpu0", "gpu1", "down", "up")  # percentages, then network bytes per second
+# network rates are shown and sent in decimal megabytes (10^6 bytes), like the 0x5D steps of 10 kB/s;
+# the firmware multiplies by 8 for Mb/s
+RATE_UNIT = "MB/s"
+
+def mb_per_s(v):
+    # bytes per second (None: unknown) -> RATE_UNIT
+    return (v or 0) / 1e6
+
+def local_clock(t=None):
+    # wall-clock seconds with the local UTC offset folded in, so the device
+    # shows local time with a plain gmtime()
+    t = time.time() if t is None else t
+    return int(t + time.localtime(t).tm_gmtoff)
+
+class SystemSource:
+    # reads one row of FIELDS; NVML is opened by the thread that samples
+    def __init__(self):
+        self.gpus = None
+        self.net = None
+
+    def _open_gpus(self):
+        self.gpus = []
+        try:
+            import pynvml
+            pynvml.nvmlInit()
+            self.nvml = pynvml
+            self.gpus = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(min(2, pynvml.nvmlDeviceGetCount()))]
+        except Exception:
+            pass
+
+    def __call__(self, out):
+        if self.gpus is None:
+            self._open_gpus()
+        out[:] = np.nan
+        for i, h in enumerate(self.gpus):
+            try:
+                out[2 + i] = self.nvml.nvmlDeviceGetUtilizationRates(h).gpu
+            except Exception:
+                pass
+        if not PSUTIL_AVAILABLE:
+            return
+        out[0] = psutil.cpu_percent(interval=None)
+        out[1] = psutil.virtual_memory().percent
+        net = psutil.net_io_counters()
+        now = time.perf_counter()
+        if self.net is not None:
+            recv, sent, t = self.net
+            dt = max(now - t, 1e-3)
+            out[4] = (net.bytes_recv - recv) / dt
+            out[5] = (net.bytes_sent - sent) / dt
+        else:
+            out[4:6] = 0.0
+        self.net = (net.bytes_recv, net.bytes_sent, now)
+
+class TelemetrySampler:
+    def __init__(self, period=1.0, length=60, source=None):
+        # source(out) fills a (len(FIELDS),) float32 row; defaults to the system
+        self.period = period
+        self.length = length
+        self.source = source or SystemSource()
+        self.data = np.full((length + 1, len(FIELDS)), np.nan, dtype=np.float32)
+        self.times = np.zeros(length + 1, dtype=np.float64)
+        self.samples = 0
+        self.cost_s = 0.0
+        self.cost_max = 0.0
+        self._row = np.empty(len(FIELDS), dtype=np.float32)
+        self._stop = threading.Event()
+        self.worker = None
+
+    def start(self):
+        if self.worker is None:
+            self._stop.clear()
+            self.worker = threading.Thread(target=self._run, name="telemetry", daemon=True)
+            self.worker.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.worker is not None and self.worker is not threading.current_thread():
+            self.worker.join(1.0)
+        self.worker = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            self.sample()
+            self._stop.wait(max(0.0, self.period - (time.perf_counter() - t0)))
+
+    def sample(self):
+        t0 = time.perf_counter()
+        try:
+            self.source(self._row)
+        except Exception:
+            self._row[:] = np.nan
+        i = self.samples % len(self.data)
+        self.data[i] = self._row
+        self.times[i] = time.time()
+        # published after the row, like FrameRecorder's frame count
+        self.samples += 1
+        dt = time.perf_counter() - t0
+        self.cost_s += dt
+        self.cost_max = max(self.cost_max, dt)
+
+    def latest(self):
+        # newest sample as a dict (None for missing values, "time" in seconds
+        # since 1970), or None before the first one
+        n = self.samples
+        if not n:
+            return None
+        i = (n - 1) % len(self.data)
+        row = self.data[i]
+        out = {k: (None if np.isnan(v) else float(v)) for k, v in zip(FIELDS, row)}
+        out["time"] = float(self.times[i])
+        return out
+
+    def history(self, name, out=None):
+        # the field's retained samples, oldest first (NaN where missing)
+        n = self.samples
+        k = min(n, self.length)
+        col = self.data[:, FIELDS.index(name)]
+        if out is None:
+            out = np.empty(k, dtype=np.float32)
+        out = out[:k]
+        start = (n - k) % len(col)
+        head = min(k, len(col) - start)
+        out[:head] = col[start:start + head]
+        out[head:] = col[:k - head]
+        return out
+
+    def stats(self):
+        return {"samples": self.samples, "cost_ms": self.cost_s / self.samples * 1000.0 if self.samples else 0.0,
+                "cost_max_ms": self.cost_max * 1000.0}
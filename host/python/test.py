@@ -1,22 +1,24 @@
 import serial
+import math
 import time
 import threading
 import numpy as np
-import cv2
-from mss import mss
-from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import ttk
 from serial.tools import list_ports
-import colorsys
-import psutil
-
-try:
-    import pynvml
-    pynvml.nvmlInit()
-    GPU_AVAILABLE = True
-except Exception:
-    GPU_AVAILABLE = False
+from layout import Layout
+from sampler import SparseSampler
+from capture import open_capture, IdleThrottle
+from backends import BACKENDS, open_backend, select_backend
+from pipeline import LatestSlot, Stage, Pipeline
+from preview import Preview
+from protocol import WindowedSender, encode_status, encode_telemetry
+from audio import AudioAnalyzer, SAMPLERATE
+from color import to_float, to_uint8, audio_boost, EnhanceLUT, ENHANCE, TemporalFilter, ChangeGate
+from link import negotiate, LinkMonitor, BASE_BAUD
+from governor import FrameRateGovernor
+from timing import StageTimer, MIN_S, BINS_PER_DECADE
+from telemetry import TelemetrySampler, local_clock, mb_per_s, RATE_UNIT
 
 try:
     import sounddevice as sd
@@ -24,19 +26,31 @@ try:
 except Exception:
     AUDIO_AVAILABLE = False
 
-NUM_LEDS = 96
-TOP_LEDS = 31
-RIGHT_LEDS = 17
-BOTTOM_LEDS = 31
-LEFT_LEDS = 17
+LAYOUT = Layout.load()
+NUM_LEDS = LAYOUT.num_leds
 RES = (128, 128)
-FPS = 15
+CAPTURE_MODE = "full"  # "band" grabs only the edge strips, but the preview then shows just the border
+CAPTURE_BACKEND = "auto"  # default of the Capture box: auto times the live backends at start and keeps the fastest
+CAPTURE_MONITOR = 1  # default of the Monitor box, the mss index (1 = primary)
+PREVIEW_FPS = 10  # preview redraws per second, whatever the capture rate; frames in between are dropped
+FPS = 15  # starting rate; the governor moves it between MIN_FPS and MAX_FPS
+MIN_FPS = 5
+MAX_FPS = 60
 BYTE_TIMEOUT = 0.5
 ACK_TIMEOUT = 0.25
-MAX_RETRIES = 2
-
-_prev_net = None
-_net_lock = threading.Lock()
+WINDOW = 4  # LED frames allowed in flight before the transmit stage waits
+CRC_FRAMES = False  # CRC-16 frames (0x5B/0x5C), worth it on long strips; needs firmware that knows them
+SEND_THRESHOLD = 2.0  # skip frames whose largest LED change is below this (about one 8-bit level)
+KEEPALIVE = 1.0  # but resend at least this often
+IDLE_FPS = 2  # capture rate once the screen has been still for IDLE_AFTER frames
+IDLE_AFTER = 30
+AUDIO_BLOCKSIZE = 256  # samples per callback; lower it while the status shows no xruns
+AUDIO_HOP = 256  # analysis step, the spectrum refreshes every hop
+TIMING = True  # per-stage timing histograms in the overlay; False removes the instrumentation cost
+TIMING_ROWS = ("grab", "sample", "enhance", "gui wait", "preview", "leds", "ack wait", "encode", "write")
+STATS_PERIOD = 1.0  # seconds between telemetry samples, overlay redraws and status packets
+HISTORY = 60  # telemetry samples kept for the overlay's sparklines
+BINARY_STATUS = True  # fixed 0x5D telemetry packets; False sends the 0x56 CSV text older test.ino builds expect
 
 class Ambilight:
     def __init__(self, root):
@@ -44,27 +58,42 @@ class Ambilight:
         self.running = False
         self.ser = None
         self.sct = None
-        self.frame_id = 0
-        self.photo = None
-        self.led_rects = []
-        self.audio_levels = np.zeros(NUM_LEDS, dtype=float)
-        self.audio_lock = threading.Lock()
+        self.cap = None
+        self.backend = ""
+        self.capture_backend = CAPTURE_BACKEND
+        self.capture_monitor = CAPTURE_MONITOR
+        self.pipeline = None
+        self.sender = None
+        self.link = None
+        self.governor = None
+        self.preview = None
+        self.sampler = SparseSampler(LAYOUT)
+        self.lut = EnhanceLUT()
+        self.smooth = TemporalFilter()
+        self.gate = ChangeGate(SEND_THRESHOLD, KEEPALIVE)
+        self.idle = IdleThrottle(FPS, IDLE_FPS, IDLE_AFTER)
+        self.analyzer = AudioAnalyzer(NUM_LEDS, SAMPLERATE, hop=AUDIO_HOP)
+        self.timer = StageTimer(TIMING)
         self.audio_stream = None
         self.canvas_w = 640
         self.canvas_h = 460
         self.stats_height = 100  # Height reserved for stats at top
-        self.last_stats_time = 0.0
-        self.stats = {"time": "", "cpu": 0, "ram": 0, "gpu0": 0, "gpu1": 0, "dl": 0, "ul": 0, "cpu_ghz": 0.0}
-        # History for graphs (last 60 samples)
-        self.history_len = 60
-        self.cpu_history = [0] * self.history_len
-        self.ram_history = [0] * self.history_len
-        self.gpu0_history = [0] * self.history_len
-        self.gpu1_history = [0] * self.history_len
+        # psutil/NVML are read on the sampler's thread; the Tk side only reads its ring
+        self.telemetry = TelemetrySampler(STATS_PERIOD, HISTORY)
+        self.telemetry.start()
+        self._spark = np.empty(HISTORY, dtype=np.float32)
         self.setup_ui()
         if AUDIO_AVAILABLE:
             threading.Thread(target=self.start_audio_stream, daemon=True).start()
-        self.root.after(1000, self.stats_tick)
+        self.root.after(int(STATS_PERIOD * 1000), self.stats_tick)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        if self.running:
+            self.toggle()
+        # the enhance table is only written to the cache here and when capture starts
+        self.lut.save()
+        self.root.destroy()
 
     def list_ports(self):
         ports = list_ports.comports()
@@ -87,12 +116,34 @@ class Ambilight:
         tk.Button(f, text="Refresh", command=self.refresh_ports).grid(row=0, column=2, padx=4)
         self.btn = tk.Button(f, text="Start", command=self.toggle, width=8)
         self.btn.grid(row=0, column=3, padx=8)
-        self.status = tk.Label(f, text="Stopped", width=28, anchor='w')
+        self.status = tk.Label(f, text="Stopped", width=60, anchor='w')
         self.status.grid(row=0, column=4, padx=4)
         self.sens_var = tk.DoubleVar(value=1.0)
         tk.Label(f, text="Sens:").grid(row=0, column=5, padx=(10,0))
         tk.Scale(f, from_=0.0, to=5.0, resolution=0.1, orient='horizontal', variable=self.sens_var, length=120).grid(row=0, column=6, padx=4)
-        self.create_led_rects()
+        # enhancement sliders only mark the LUT stale; it reloads off the frame path
+        self.enhance_vars = {}
+        for col, (key, label, lo, hi, res) in enumerate((("sat_boost", "Sat:", 0.5, 2.0, 0.05), ("contrast", "Contrast:", 0.5, 2.0, 0.02),
+                                                          ("gamma", "Gamma:", 0.5, 2.5, 0.02))):
+            var = tk.DoubleVar(value=ENHANCE[key])
+            tk.Label(f, text=label).grid(row=1, column=2 * col, padx=(4,0))
+            tk.Scale(f, from_=lo, to=hi, resolution=res, orient='horizontal', variable=var, length=120,
+                     command=self.on_enhance_change).grid(row=1, column=2 * col + 1, padx=4)
+            self.enhance_vars[key] = var
+        self.audio_status = tk.Label(f, text="", anchor='w')
+        self.audio_status.grid(row=1, column=6, columnspan=3, sticky='w', padx=4)
+        # read when Start is pressed; the capture thread opens the backend
+        tk.Label(f, text="Capture:").grid(row=2, column=0, padx=(4,0))
+        self.backend_var = tk.StringVar(value=CAPTURE_BACKEND)
+        ttk.Combobox(f, textvariable=self.backend_var, values=["auto"] + list(BACKENDS), width=10, state='readonly').grid(row=2, column=1)
+        tk.Label(f, text="Monitor:").grid(row=2, column=2, padx=(4,0))
+        self.monitor_var = tk.IntVar(value=CAPTURE_MONITOR)
+        tk.Spinbox(f, from_=1, to=16, textvariable=self.monitor_var, width=4).grid(row=2, column=3, sticky='w')
+        edge = 28
+        inner = (edge, self.stats_height + edge, self.canvas_w - edge, self.canvas_h - edge)
+        self.preview = Preview(self.root, self.canvas, LAYOUT, inner, edge, fps=PREVIEW_FPS, timer=self.timer)
+        self.preview.start()
+        self.build_status_overlay()
 
     def refresh_ports(self):
         ports = self.list_ports()
@@ -106,26 +157,23 @@ class Ambilight:
         if self.audio_stream:
             return
         try:
-            FFT_SIZE = 2048
-            def callback(indata, frames, time_info, status):
-                data = indata.copy()
-                if data.ndim > 1:
-                    mono = data.mean(axis=1)
-                else:
-                    mono = data
-                window = np.hanning(len(mono))
-                spec = np.fft.rfft(mono * window, n=FFT_SIZE)
-                mags = np.abs(spec)
-                groups = np.array_split(mags, NUM_LEDS)
-                energies = np.array([g.mean() if g.size else 0.0 for g in groups])
-                maxv = energies.max() if energies.size else 1.0
-                norm = energies / maxv if maxv >= 1e-9 else energies * 0.0
-                with self.audio_lock:
-                    self.audio_levels = norm
-            self.audio_stream = sd.InputStream(callback=callback, channels=1, samplerate=44100, blocksize=1024)
+            # the callback only fills the ring; analysis runs on the analyzer's worker
+            self.analyzer.start()
+            self.audio_stream = sd.InputStream(callback=self.analyzer.callback, channels=1, samplerate=SAMPLERATE, blocksize=AUDIO_BLOCKSIZE)
             self.audio_stream.start()
+            self.root.after(1000, self.audio_tick)
         except Exception:
             self.audio_stream = None
+            self.analyzer.stop()
+
+    def audio_tick(self):
+        # audio health goes on the second row, next to the enhancement sliders
+        if not self.audio_stream:
+            self.audio_status.configure(text="")
+            return
+        st = self.analyzer.stats()
+        self.audio_status.configure(text=f"audio {st['latency_ms']:.1f} ms, {st['xruns']} xruns, {st['overruns']} overruns")
+        self.root.after(1000, self.audio_tick)
 
     def stop_audio_stream(self):
         try:
@@ -135,14 +183,15 @@ class Ambilight:
         except Exception:
             pass
         self.audio_stream = None
-        with self.audio_lock:
-            self.audio_levels = np.zeros(NUM_LEDS, dtype=float)
+        self.analyzer.stop()
 
     def toggle(self):
         if not self.running:
             port = self.port_var.get()
             try:
-                self.ser = serial.Serial(port, 115200, timeout=BYTE_TIMEOUT)
+                self.capture_backend = self.backend_var.get()
+                self.capture_monitor = int(self.monitor_var.get())
+                self.ser = serial.Serial(port, BASE_BAUD, timeout=BYTE_TIMEOUT)
                 self.running = True
                 self.btn.configure(text="Stop")
                 self.status.configure(text=f"Running on {port}")
@@ -156,6 +205,9 @@ class Ambilight:
             self.running = False
             self.btn.configure(text="Start")
             self.status.configure(text="Stopped")
+            if self.sender:
+                self.sender.close()
+                self.sender = None
             if self.ser:
                 try:
                     self.ser.close()
@@ -164,356 +216,250 @@ class Ambilight:
                 self.ser = None
 
     def loop(self):
-        dt = 1.0 / FPS
+        self.lut.save()
+        # agree on the fastest link rate before the sender's reader owns the port
+        try:
+            rate = negotiate(self.ser)
+        except Exception as e:
+            self.running = False
+            self.root.after(0, self.status.configure, {"text": f"Link error: {e!r}"})
+            return
+        if not self.running:
+            return
+        self.link = LinkMonitor(self.ser)
+        self.sender = WindowedSender(self.ser, NUM_LEDS, WINDOW, ACK_TIMEOUT, crc=CRC_FRAMES)
+        self.gate.reset()
+        self.governor = FrameRateGovernor(self.ser, FPS, MIN_FPS, MAX_FPS, WINDOW, NUM_LEDS * 3 + 4)
+        self.root.after(0, self.status.configure, {"text": f"Running at {rate or BASE_BAUD} baud"})
+        # capture -> process -> transmit, each on its own thread; a slow ACK only stalls transmit
+        frames = LatestSlot()
+        colors = LatestSlot()
+        self.pipeline = Pipeline(
+            Stage("cap", self.capture_frame, outbox=frames, interval=1.0 / FPS),
+            Stage("proc", self.process_frame, inbox=frames, outbox=colors),
+            Stage("tx", self.send, inbox=colors),
+        )
+        self.pipeline.start()
         try:
-            self.sct = mss()
-            monitor = self.sct.monitors[1]
             while self.running:
-                t0 = time.time()
-                img = self.capture_with_sct(self.sct, monitor)
-                if img is not None:
-                    colors = self.sample(img)
-                    colors = self.apply_audio_to_colors(colors)
-                    self.root.after(0, self.update_gui, img, colors)
-                    self.send(colors)
-                d = dt - (time.time() - t0)
-                if d > 0:
-                    time.sleep(d)
-        except Exception:
-            pass
+                if self.cap is None and self.pipeline.stages[0].error is not None:
+                    break
+                time.sleep(0.1)
         finally:
+            self.pipeline.stop()
+            # a capture that never opened (no backend, no such monitor) says why
+            err = self.pipeline.stages[0].error if self.cap is None else None
             if self.sct:
                 try:
                     self.sct.close()
                 except Exception:
                     pass
+            self.sct = None
+            self.cap = None
             self.running = False
-            self.root.after(0, self.status.configure, {"text": "Stopped"})
+            self.root.after(0, self.status.configure, {"text": f"Capture error: {err}" if err else "Stopped"})
 
-    def capture_with_sct(self, sct, monitor):
-        try:
-            s = sct.grab(monitor)
-            img = np.array(s)[:, :, :3]
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            small = cv2.resize(img, RES, interpolation=cv2.INTER_AREA)
-            return small
-        except Exception:
+    def capture_frame(self):
+        # capture backends are per-thread, so open them on the capture thread
+        if self.cap is None:
+            m = self.capture_monitor
+            if self.capture_backend == "auto":
+                self.backend, self.sct, _ = select_backend(CAPTURE_MODE, LAYOUT.depth, RES, monitor=m)
+            else:
+                self.backend, self.sct = self.capture_backend, open_backend(self.capture_backend)
+            if not 0 < m < len(self.sct.monitors):
+                raise ValueError(f"monitor {m} not found, {len(self.sct.monitors) - 1} attached")
+            self.cap = open_capture(CAPTURE_MODE, self.sct, self.sct.monitors[m], LAYOUT.depth, RES)
+        self.timer.begin()
+        img = self.capture_with_sct(self.cap)
+        self.timer.lap("grab")
+        if img is None:
             return None
+        # audio can change the LEDs on a still screen, so only idle without it
+        self.idle.enabled = self.audio_stream is None or float(self.sens_var.get()) == 0.0
+        self.pipeline.stages[0].interval = self.idle.update(img)
+        self.timer.lap("idle")
+        # the capture frame is reused on the next grab
+        return img.copy()
 
-    def show(self, img):
-        edge_thickness = 28
-        left_edge = right_edge = top_edge = bottom_edge = edge_thickness
-        # Offset for stats area at top
-        stats_offset = self.stats_height
-        cx0 = left_edge
-        cy0 = stats_offset + top_edge
-        cx1 = self.canvas_w - right_edge
-        cy1 = self.canvas_h - bottom_edge
-        cw = max(1, int(cx1 - cx0))
-        ch = max(1, int(cy1 - cy0))
-        d = cv2.resize(img, (cw, ch), interpolation=cv2.INTER_AREA)
-        pil = Image.fromarray(d)
-        self.photo = ImageTk.PhotoImage(image=pil)
-        self.canvas.delete('bg')
-        self.canvas.create_image(cx0, cy0, anchor='nw', image=self.photo, tag='bg')
-        self.canvas.image = self.photo
-
-    def create_led_rects(self):
-        pad = 2
-        edge_thickness = 28
-        left_edge = right_edge = top_edge = bottom_edge = edge_thickness
-        # Offset for stats area at top
-        stats_offset = self.stats_height
-        cx0 = left_edge
-        cy0 = stats_offset + top_edge
-        cx1 = self.canvas_w - right_edge
-        cy1 = self.canvas_h - bottom_edge
-        top_seg_w = (cx1 - cx0) / TOP_LEDS
-        for i in range(TOP_LEDS):
-            x0 = int(cx0 + i * top_seg_w) + pad
-            x1 = int(cx0 + (i + 1) * top_seg_w) - pad
-            y0 = stats_offset + pad
-            y1 = stats_offset + top_edge - pad
-            rid = self.canvas.create_rectangle(x0, y0, x1, y1, fill="#000000", outline="")
-            self.led_rects.append(rid)
-        right_seg_h = (cy1 - cy0) / RIGHT_LEDS
-        for i in range(RIGHT_LEDS):
-            y0 = int(cy0 + i * right_seg_h) + pad
-            y1 = int(cy0 + (i + 1) * right_seg_h) - pad
-            x0 = self.canvas_w - right_edge + pad
-            x1 = self.canvas_w - pad
-            rid = self.canvas.create_rectangle(x0, y0, x1, y1, fill="#000000", outline="")
-            self.led_rects.append(rid)
-        bottom_seg_w = (cx1 - cx0) / BOTTOM_LEDS
-        for i in range(BOTTOM_LEDS):
-            x0 = int(cx1 - (i + 1) * bottom_seg_w) + pad
-            x1 = int(cx1 - i * bottom_seg_w) - pad
-            y0 = self.canvas_h - bottom_edge + pad
-            y1 = self.canvas_h - pad
-            rid = self.canvas.create_rectangle(x0, y0, x1, y1, fill="#000000", outline="")
-            self.led_rects.append(rid)
-        left_seg_h = (cy1 - cy0) / LEFT_LEDS
-        for i in range(LEFT_LEDS):
-            y0 = int(cy1 - (i + 1) * left_seg_h) + pad
-            y1 = int(cy1 - i * left_seg_h) - pad
-            x0 = pad
-            x1 = left_edge - pad
-            rid = self.canvas.create_rectangle(x0, y0, x1, y1, fill="#000000", outline="")
-            self.led_rects.append(rid)
-
-    def update_led_rects(self, colors):
-        for i, col in enumerate(colors[:NUM_LEDS]):
-            r, g, b = col
-            hexc = "#%02x%02x%02x" % (r, g, b)
-            try:
-                self.canvas.itemconfig(self.led_rects[i], fill=hexc)
-            except Exception:
-                pass
+    def process_frame(self, img):
+        self.timer.begin()
+        colors = self.sample(img)
+        self.timer.lap("sample")
+        colors = self.apply_audio_to_colors(colors)
+        self.timer.lap("enhance")
+        self.preview.submit(img, colors)
+        return colors
 
-    def update_gui(self, img, colors):
-        self.show(img)
-        self.update_led_rects(colors)
+    def capture_with_sct(self, cap):
+        try:
+            return cap.grab()
+        except Exception:
+            return None
 
     def sample(self, img):
-        h, w, _ = img.shape
-        c = []
-        sw = w / TOP_LEDS
-        for i in range(TOP_LEDS):
-            x0 = int(i * sw)
-            x1 = int((i + 1) * sw)
-            y1 = max(1, int(h * 0.12))
-            b = img[0:y1, x0:x1]
-            a = b.reshape(-1, 3).mean(0) if b.size else [0, 0, 0]
-            c.append(tuple(int(x) for x in a))
-        sh = h / RIGHT_LEDS
-        for i in range(RIGHT_LEDS):
-            y0 = int(i * sh)
-            y1 = int((i + 1) * sh)
-            x0 = max(0, w - int(w * 0.12))
-            b = img[y0:y1, x0:w]
-            a = b.reshape(-1, 3).mean(0) if b.size else [0, 0, 0]
-            c.append(tuple(int(x) for x in a))
-        sw = w / BOTTOM_LEDS
-        btm = []
-        for i in range(BOTTOM_LEDS):
-            x0 = int(i * sw)
-            x1 = int((i + 1) * sw)
-            y0 = max(0, h - int(h * 0.12))
-            b = img[y0:h, x0:x1]
-            a = b.reshape(-1, 3).mean(0) if b.size else [0, 0, 0]
-            btm.append(tuple(int(x) for x in a))
-        btm.reverse()
-        c += btm
-        sh = h / LEFT_LEDS
-        lft = []
-        for i in range(LEFT_LEDS):
-            y0 = int(i * sh)
-            y1 = int((i + 1) * sh)
-            x1 = min(int(w * 0.12), w)
-            b = img[y0:y1, 0:x1]
-            a = b.reshape(-1, 3).mean(0) if b.size else [0, 0, 0]
-            lft.append(tuple(int(x) for x in a))
-        lft.reverse()
-        c += lft
-        if len(c) < NUM_LEDS:
-            c += [(0, 0, 0)] * (NUM_LEDS - len(c))
-        return c[:NUM_LEDS]
+        return self.sampler.sample(img, bgr=True)
 
-    def collect_stats(self):
-        now = time.strftime("%Y-%m-%d %H:%M:%S")
-        cpu = int(psutil.cpu_percent(interval=None))
-        ram = int(psutil.virtual_memory().percent)
-        gpu0 = gpu1 = 0
-        if GPU_AVAILABLE:
-            try:
-                device_count = pynvml.nvmlDeviceGetCount()
-                if device_count >= 1:
-                    handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-                    util = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                    gpu0 = int(util.gpu)
-                if device_count >= 2:
-                    handle = pynvml.nvmlDeviceGetHandleByIndex(1)
-                    util = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                    gpu1 = int(util.gpu)
-            except Exception:
-                gpu0 = gpu1 = 0
-        net = psutil.net_io_counters()
-        with _net_lock:
-            global _prev_net
-            if _prev_net is None:
-                dl = ul = 0
-                _prev_net = (net.bytes_recv, net.bytes_sent, time.time())
-            else:
-                prev_recv, prev_sent, prev_t = _prev_net
-                now_t = time.time()
-                dt = now_t - prev_t if now_t - prev_t > 0 else 1.0
-                dl = int((net.bytes_recv - prev_recv) / 1024.0 / dt + 0.5)
-                ul = int((net.bytes_sent - prev_sent) / 1024.0 / dt + 0.5)
-                _prev_net = (net.bytes_recv, net.bytes_sent, now_t)
-        # Update history
-        self.cpu_history.pop(0)
-        self.cpu_history.append(cpu)
-        self.ram_history.pop(0)
-        self.ram_history.append(ram)
-        self.gpu0_history.pop(0)
-        self.gpu0_history.append(gpu0)
-        self.gpu1_history.pop(0)
-        self.gpu1_history.append(gpu1)
-        return {"time": now, "cpu": cpu, "ram": ram, "gpu0": gpu0, "gpu1": gpu1, "dl": dl/1024, "ul": ul/1024}
-
-    def render_status_overlay(self, stats):
-        x = 6
-        y = 4
-        lh = 18
-        bar_w = 150
-        bar_h = 12
-        self.canvas.delete("status")
-        self.canvas.delete("status_bg")
-        # Stats background fills the stats_height area at top
-        self.canvas.create_rectangle(0, 0, self.canvas_w, self.stats_height, fill="black", outline="", tag="status_bg")
-        # CPU
-        cpu_label = f"CPU {stats['cpu']}%"
-        self.canvas.create_text(x, y, anchor="nw", fill="white", font=("Consolas", 9), text=cpu_label, tag="status")
-        self.draw_bar(x + 80, y, bar_w, bar_h, stats['cpu'], "#00ff00")
+    def build_status_overlay(self):
+        # every overlay item is made once here; render_status_overlay() only
+        # changes their text and coordinates
+        c = self.canvas
+        x, y, lh = 6, 4, 18
+        font = ("Consolas", 9)
+        c.create_rectangle(0, 0, self.canvas_w, self.stats_height, fill="black", outline="", tag="status_bg")
+        text = lambda tx, ty, **kw: c.create_text(tx, ty, anchor="nw", fill=kw.pop("fill", "white"), font=kw.pop("font", font), tag="status", **kw)
+        self.ov = {}
+        self.ov["cpu"] = (text(x, y), self.create_bar(x + 80, y, 150, "#00ff00"), self.create_spark(x + 240, y, "#00ff00"))
         y += lh
-        # RAM
-        ram_label = f"RAM {stats['ram']}%"
-        self.canvas.create_text(x, y, anchor="nw", fill="white", font=("Consolas", 9), text=ram_label, tag="status")
-        self.draw_bar(x + 80, y, bar_w, bar_h, stats['ram'], "#00aaff")
+        self.ov["ram"] = (text(x, y), self.create_bar(x + 80, y, 150, "#00aaff"), self.create_spark(x + 240, y, "#00aaff"))
         y += lh
-        # GPU0 and GPU1
-        gpu_label = f"G0 {stats['gpu0']}%"
-        self.canvas.create_text(x, y, anchor="nw", fill="white", font=("Consolas", 9), text=gpu_label, tag="status")
-        self.draw_bar(x + 70, y, 100, bar_h, stats['gpu0'], "#ff6600")
-        gpu1_label = f"G1 {stats['gpu1']}%"
-        self.canvas.create_text(x + 200, y, anchor="nw", fill="white", font=("Consolas", 9), text=gpu1_label, tag="status")
-        self.draw_bar(x + 270, y, 100, bar_h, stats['gpu1'], "#ff00ff")
+        self.ov["gpu0"] = (text(x, y), self.create_bar(x + 70, y, 100, "#ff6600"))
+        self.ov["gpu1"] = (text(x + 200, y), self.create_bar(x + 270, y, 100, "#ff00ff"))
         y += lh
-        # Network
-        self.canvas.create_text(x, y, anchor="nw", fill="white", font=("Consolas", 10), text=f"D {stats['dl']}MB/s  U {stats['ul']}MB/s", tag="status")
+        self.ov["net"] = text(x, y, font=("Consolas", 10))
         y += lh
-        # Date/Time (last row)
-        self.canvas.create_text(x, y, anchor="nw", fill="#888888", font=("Consolas", 9), text=stats["time"], tag="status")
-        self.canvas.tag_raise("status")
+        self.ov["time"] = text(x, y, fill="#888888")
+        if self.timer.enabled:
+            tx, ty = 392, 4
+            self.ov["budget"] = c.create_line(0, 0, 0, 0, fill="#aa3333", tag="status")
+            self.ov["timing"] = []
+            for i, name in enumerate(TIMING_ROWS):
+                text(tx, ty + 10 * i, fill="#aaaaaa", font=("Consolas", 7), text=name)
+                self.ov["timing"].append((c.create_line(0, 0, 0, 0, fill="#00ff88", tag="status", state="hidden"),
+                                          text(tx + 176, ty + 10 * i, font=("Consolas", 7))))
+        c.tag_raise("status")
 
-    def draw_bar(self, x, y, w, h, pct, color):
-        """Draw a filled bar showing percentage"""
+    def create_bar(self, x, y, w, color, h=12):
         self.canvas.create_rectangle(x, y, x + w, y + h, outline="#444444", tag="status")
-        fw = int((w - 2) * max(0, min(100, pct)) / 100)
-        if fw > 0:
-            self.canvas.create_rectangle(x + 1, y + 1, x + 1 + fw, y + h - 1, fill=color, outline="", tag="status")
+        return self.canvas.create_rectangle(x + 1, y + 1, x + 1, y + h - 1, fill=color, outline="", tag="status", state="hidden"), (x, y, w, h)
+
+    def set_bar(self, bar, pct):
+        item, (x, y, w, h) = bar
+        fw = int((w - 2) * max(0, min(100, pct or 0)) / 100)
+        self.canvas.coords(item, x + 1, y + 1, x + 1 + fw, y + h - 1)
+        self.canvas.itemconfig(item, state="normal" if fw > 0 else "hidden")
+
+    def create_spark(self, x, y, color, w=140, h=12):
+        return self.canvas.create_line(0, 0, 0, 0, fill=color, tag="status", state="hidden"), (x, y, w, h)
+
+    def set_spark(self, spark, values):
+        # percentage history, oldest at the left edge, one point per sample
+        item, (x, y, w, h) = spark
+        v = values[~np.isnan(values)]
+        if len(v) < 2:
+            self.canvas.itemconfig(item, state="hidden")
+            return
+        pts = np.empty((len(v), 2), dtype=np.float32)
+        pts[:, 0] = x + w - (len(v) - 1 - np.arange(len(v))) * w / (HISTORY - 1)
+        pts[:, 1] = y + h - h * np.clip(v, 0, 100) / 100
+        self.canvas.coords(item, *pts.ravel().tolist())
+        self.canvas.itemconfig(item, state="normal")
+
+    def render_status_overlay(self, t):
+        pct = lambda v: "--" if v is None else f"{v:.0f}"
+        c = self.canvas
+        for key, label in (("cpu", "CPU"), ("ram", "RAM")):
+            txt, bar, spark = self.ov[key]
+            c.itemconfig(txt, text=f"{label} {pct(t[key])}%")
+            self.set_bar(bar, t[key])
+            self.set_spark(spark, self.telemetry.history(key, self._spark))
+        for key, label in (("gpu0", "G0"), ("gpu1", "G1")):
+            txt, bar = self.ov[key]
+            c.itemconfig(txt, text=f"{label} {pct(t[key])}%")
+            self.set_bar(bar, t[key])
+        c.itemconfig(self.ov["net"], text=f"D {mb_per_s(t['down']):.2f}{RATE_UNIT}  U {mb_per_s(t['up']):.2f}{RATE_UNIT}")
+        c.itemconfig(self.ov["time"], text=time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t["time"])))
+        if self.timer.enabled:
+            self.draw_timing(392, 4)
+
+    def draw_timing(self, x, y):
+        # one row per stage: its histogram on a log axis from 10 us to 1 s,
+        # the red line is the frame budget, then p50/p99 in ms
+        lh = 10
+        hx, hw = x + 52, 120
+        nb = 5 * BINS_PER_DECADE
+        st = self.timer.summary()
+        budget = 1.0 / (self.governor.fps if self.governor else FPS)
+        bx = hx + hw * math.log10(budget / MIN_S) / 5
+        self.canvas.coords(self.ov["budget"], bx, y, bx, y + lh * len(TIMING_ROWS))
+        for name, (line, label) in zip(TIMING_ROWS, self.ov["timing"]):
+            counts = self.timer.histogram(name)[0][1:nb + 1]
+            peak = max(counts)
+            if peak:
+                pts = []
+                for i, c in enumerate(counts):
+                    top = y + lh - 1 - (lh - 2) * c / peak
+                    pts += [hx + hw * i / nb, top, hx + hw * (i + 1) / nb, top]
+                self.canvas.coords(line, *pts)
+                self.canvas.itemconfig(line, state="normal")
+                s = st[name]
+                self.canvas.itemconfig(label, text=f"{s['p50_ms']:.2f}/{s['p99_ms']:.2f}")
+            else:
+                self.canvas.itemconfig(line, state="hidden")
+                self.canvas.itemconfig(label, text="")
+            y += lh
+
+    def status_packet(self, t):
+        if BINARY_STATUS:
+            return encode_telemetry(local_clock(t["time"]), t["cpu"], t["ram"], t["gpu0"], t["gpu1"], t["down"], t["up"])
+        n = lambda v: 0 if v is None else int(round(v))
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t["time"]))
+        return encode_status(f"{stamp},{n(t['cpu'])},{n(t['ram'])},{n(t['gpu0'])},{n(t['gpu1'])},"
+                             f"{mb_per_s(t['down']):.2f},{mb_per_s(t['up']):.2f}")
 
     def stats_tick(self):
-        self.stats = self.collect_stats()
-        self.root.after(0, self.render_status_overlay, self.stats)
-        # send status packet if serial open (rate: 1s)
-        if self.ser and getattr(self.ser, "is_open", False):
-            try:
-                csv = f"{self.stats['time']},{self.stats['cpu']},{self.stats['ram']},{self.stats['gpu0']},{self.stats['gpu1']},{self.stats['dl']},{self.stats['ul']}"
-                data = csv.encode('utf-8')[:240]
-                L = len(data) & 0xFF
-                s2 = 0x56
-                for b in data:
-                    s2 = (s2 + int(b)) & 0xFFFF
-                chk2 = s2 & 0xFF
-                pkt2 = bytearray([0xAA, 0x56, L]) + data + bytearray([chk2])
-                self.ser.write(pkt2)
-            except Exception:
-                pass
-        self.last_stats_time = time.time()
-        self.root.after(1000, self.stats_tick)
+        t = self.telemetry.latest()
+        if t:
+            self.render_status_overlay(t)
+        if self.running and self.pipeline:
+            idle = " idle," if self.idle.idle else ""
+            gov = f" max {self.governor.fps:.0f} ({self.governor.reason})," if self.governor else ""
+            self.status.configure(text=f"{self.backend} {self.pipeline.summary()},{gov}{idle} {self.gate.suppressed_fraction() * 100:.0f}% held")
+        sender = self.sender
+        if t and sender and self.ser and getattr(self.ser, "is_open", False):
+            # goes through the sender's write lock so it never splits an LED frame
+            sender.write(self.status_packet(t))
+        self.root.after(int(STATS_PERIOD * 1000), self.stats_tick)
 
-    def enhance_colors(self, colors):
-        out = []
-        sat_boost = 1.35
-        contrast = 1.12
-        highlight_thresh = 200.0
-        highlight_reduce_strength = 0.75
-        gamma = 1.06
-        for r, g, b in colors[:NUM_LEDS]:
-            rf, gf, bf = r / 255.0, g / 255.0, b / 255.0
-            lum = 0.2126 * rf + 0.7152 * gf + 0.0722 * bf
-            if lum > (highlight_thresh / 255.0):
-                excess = (lum - (highlight_thresh / 255.0)) / (1.0 - (highlight_thresh / 255.0))
-                factor = 1.0 - excess * highlight_reduce_strength
-                factor = max(0.25, factor)
-                rf *= factor
-                gf *= factor
-                bf *= factor
-            h, s, v = colorsys.rgb_to_hsv(rf, gf, bf)
-            s = min(1.0, s * sat_boost)
-            v = 0.5 + contrast * (v - 0.5)
-            v = max(0.0, min(1.0, v * 0.98))
-            rr, gg, bb = colorsys.hsv_to_rgb(h, s, v)
-            rr = pow(max(0.0, min(1.0, rr)), gamma)
-            gg = pow(max(0.0, min(1.0, gg)), gamma)
-            bb = pow(max(0.0, min(1.0, bb)), gamma)
-            out.append((int(rr * 255), int(gg * 255), int(bb * 255)))
-        if len(out) < NUM_LEDS:
-            out += [(0, 0, 0)] * (NUM_LEDS - len(out))
-        return out[:NUM_LEDS]
+    def on_enhance_change(self, _=None):
+        self.lut.update(**{k: v.get() for k, v in self.enhance_vars.items()})
 
     def apply_audio_to_colors(self, colors):
-        colors2 = colors
+        c = to_float(colors)
         if AUDIO_AVAILABLE:
             sens = float(self.sens_var.get())
-            with self.audio_lock:
-                levels = self.audio_levels.copy() if hasattr(self, 'audio_levels') else np.zeros(NUM_LEDS, dtype=float)
-            out = []
-            for i, (r, g, b) in enumerate(colors[:NUM_LEDS]):
-                lvl = float(levels[i]) if i < len(levels) else 0.0
-                scale = 1.0 + sens * lvl
-                rr = min(255, int(r * scale))
-                gg = min(255, int(g * scale))
-                bb = min(255, int(b * scale))
-                out.append((rr, gg, bb))
-            colors2 = out[:NUM_LEDS]
-        colors2 = self.enhance_colors(colors2)
-        return colors2[:NUM_LEDS]
+            levels = self.analyzer.latest()
+            c = audio_boost(c, levels, sens)
+        return to_uint8(self.smooth(self.lut(c)))
 
     def send(self, c):
-        if self.ser is None or not getattr(self.ser, "is_open", False):
+        sender = self.sender
+        if sender is None or self.ser is None or not getattr(self.ser, "is_open", False):
             return
-        payload = bytearray()
-        for i in range(NUM_LEDS):
-            r, g, b = c[i] if i < len(c) else (0, 0, 0)
-            payload.extend([r & 0xFF, g & 0xFF, b & 0xFF])
-        if len(payload) < NUM_LEDS * 3:
-            payload.extend([0] * (NUM_LEDS * 3 - len(payload)))
-        hdr = bytearray([0xAA, 0x55, self.frame_id & 0xFF])
-        s = self.frame_id
-        for x in payload:
-            s = (s + int(x)) & 0xFFFF
-        chk = s & 0xFF
-        pkt = hdr + payload + bytearray([chk])
-        try:
-            self.ser.timeout = BYTE_TIMEOUT
-            self.ser.write(pkt)
-        except Exception:
-            return
-        got_ack = False
-        for _ in range(MAX_RETRIES + 1):
-            start = time.time()
-            ack = b''
-            while time.time() - start < ACK_TIMEOUT:
-                try:
-                    a = self.ser.read(1)
-                    if a:
-                        ack = a
-                        break
-                except Exception:
-                    break
-            if ack == b'A':
-                got_ack = True
-                break
-            else:
-                try:
-                    self.ser.write(pkt)
-                except Exception:
-                    break
-        if not got_ack:
-            return
-        self.frame_id = (self.frame_id + 1) & 0xFF
+        self.timer.begin()
+        if self.gate.send(c):
+            sender.send(c)
+            if self.timer.enabled:
+                # where send() went: waiting for an ACK slot, encoding, writing
+                for k, v in sender.timing.items():
+                    self.timer.add("ack wait" if k == "wait" else k, v)
+        if self.governor:
+            # capture and processing cost; transmit time is the governor's own business
+            busy = max((s.busy / s.frames for s in self.pipeline.stages[:2] if s.frames), default=0.0)
+            self.idle.interval = 1.0 / self.governor.update(sender.stats(), busy * 1000.0)
+        if self.link and self.link.check(sender.stats()):
+            # too many NAKs/timeouts: drop to a slower rate, then resume
+            self.sender = None
+            try:
+                # probing while the reader is still in ser.read() would lose the replies
+                if sender.close():
+                    self.link.step_down()
+            except Exception:
+                pass
+            if self.running and self.ser:
+                self.sender = WindowedSender(self.ser, NUM_LEDS, WINDOW, ACK_TIMEOUT, crc=CRC_FRAMES)
+                self.gate.reset()
+        self.timer.lap("tx")
 
 root = tk.Tk()
 app = Ambilight(root)
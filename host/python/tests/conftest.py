@@ -0,0 +1,7 @@
+# the host modules are flat files next to this directory; the layout matrix
+# and LUT caches go to a throwaway directory, not ~/.cache/syncled
+import os, sys, tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+os.environ['SYNCLED_CACHE'] = tempfile.mkdtemp(prefix='syncled-test-')
@@ -0,0 +1,58 @@
+"""
+The on-disk caches under CACHE_DIR stay bounded: only the most recently
+used compiled layout matrices are kept, and enhance tables built while a
+slider moves are only written when save() is called.
+"""
+
+import os
+import time
+
+import color, layout
+from color import EnhanceLUT
+from layout import Layout
+
+def cached(path, prefix):
+    return sorted(n for n in os.listdir(path) if n.startswith(prefix))
+
+def test_layout_matrices_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(layout, "CACHE_DIR", str(tmp_path))
+    sizes = [(64 + i, 64) for i in range(layout.MATRIX_KEEP + 8)]
+    for h, w in sizes:
+        # a fresh Layout each time, so every matrix goes through the disk cache
+        Layout.load(None).matrix(h, w)
+    names = cached(tmp_path, "layout-")
+    assert len(names) == layout.MATRIX_KEEP
+    # the newest resolutions survive
+    assert all(f"-{w}x{h}.npz" in " ".join(names) for h, w in sizes[-layout.MATRIX_KEEP:])
+
+def test_cache_hit_counts_as_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(layout, "CACHE_DIR", str(tmp_path))
+    Layout.load(None).matrix(32, 32)
+    first = os.path.join(tmp_path, cached(tmp_path, "layout-")[0])
+    for i in range(layout.MATRIX_KEEP - 1):
+        Layout.load(None).matrix(40 + i, 32)
+    os.utime(first, (1, 1))
+    # a hit on the oldest file makes it the newest, so the next prune spares it
+    Layout.load(None).matrix(32, 32)
+    Layout.load(None).matrix(100, 32)
+    assert os.path.exists(first)
+    assert len(cached(tmp_path, "layout-")) == layout.MATRIX_KEEP
+
+def test_background_tables_wait_for_save(tmp_path, monkeypatch):
+    monkeypatch.setattr(layout, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(color, "CACHE_DIR", str(tmp_path))
+    lut = EnhanceLUT(8)
+    for v in (1.0, 1.1, 1.2, 1.3):
+        lut.update(sat_boost=v)
+        lut(color.to_float([[10, 20, 30]]))
+        end = time.perf_counter() + 5.0
+        while not lut.ready() and time.perf_counter() < end:
+            time.sleep(0.01)
+        assert lut.ready()
+    assert not cached(tmp_path, "lut-")
+    assert lut.save()
+    assert cached(tmp_path, "lut-") == [f"lut-{lut.key()}.npy"]
+    assert not lut.save()
+    # a table loaded on request goes straight to the cache
+    lut.load(dict(lut.params, sat_boost=2.0))
+    assert len(cached(tmp_path, "lut-")) == 2
@@ -0,0 +1,111 @@
+"""
+DeviceGroup against emulated controllers on ptys: every device shows its own
+slice of the frame it was sent, held devices show a frame on all of them or
+on none, send() never waits for the slowest link, and a fleet with firmware
+that has no latch falls back to no sync.
+"""
+
+import time
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+serial = pytest.importorskip("serial")
+
+from bench import run_group, synthetic_led_frames
+from devices import DeviceLink, DeviceGroup
+from emulator import Device
+from protocol import WindowedSender, as_frame, LATCH_HOLD, LATCH_SHOW
+
+def group_args(leds, rates, fps=30.0, seconds=1.5, deadline=100.0, window=4):
+    return SimpleNamespace(leds=leds, rates=rates, fps=fps, seconds=seconds, deadline=deadline, window=window)
+
+def run(args, sync, latch):
+    frames = [as_frame(c, sum(args.leds)) for c in synthetic_led_frames(60, sum(args.leds))]
+    return run_group(args, sync, latch, frames)
+
+def check_slices(args, shows, sent):
+    a = 0
+    for i, k in enumerate(args.leds):
+        assert shows[i], f"device {i} showed nothing"
+        for tick, _, c in shows[i]:
+            assert tick in sent and np.array_equal(c, sent[tick][a:a + k]), f"device {i}, frame {tick}"
+        a += k
+
+def shown_ticks(shows, which):
+    return [{tick for tick, _, _ in shows[i]} for i in which]
+
+@pytest.mark.parametrize("sync", [True, False])
+def test_each_device_shows_its_slice(sync):
+    args = group_args([96, 60, 36], [115200, 2000000, 2000000])
+    st, shows, sent, unsynced = run(args, sync, [True] * 3)
+    check_slices(args, shows, sent)
+    if sync:
+        assert not unsynced
+        assert st["shown"] > 0
+        held = shown_ticks(shows, range(3))
+        assert held[0] == held[1] == held[2]
+    else:
+        assert st["shown"] == 0
+
+def test_slow_link_never_tears_held_devices():
+    # one link far too slow for the deadline: frames are dropped on every device, never shown on some
+    args = group_args([300, 60], [115200, 2000000], fps=60.0, seconds=2.0, deadline=10.0)
+    st, shows, sent, unsynced = run(args, True, [True, True])
+    assert not unsynced
+    check_slices(args, shows, sent)
+    slow, fast = shown_ticks(shows, range(2))
+    assert slow == fast
+    assert st["shown"] == len(fast) and st["partial"] > 0
+    assert all(d["skipped"] == st["partial"] for d in st["devices"])
+
+def test_send_returns_without_waiting_for_acks():
+    devs, links, a = [], [], 0
+    try:
+        for n in (300, 60):
+            dev = Device(n)
+            devs.append(dev)
+            links.append(DeviceLink(serial.Serial(dev.port, 115200, timeout=0.05), a, a + n))
+            a += n
+        group = DeviceGroup(links, True, 0.5)
+        assert not group.start()
+        c = np.zeros((a, 3), dtype=np.uint8)
+        worst = 0.0
+        for i in range(20):
+            c[:] = i
+            t = time.perf_counter()
+            group.send(c)
+            worst = max(worst, time.perf_counter() - t)
+            time.sleep(0.02)
+        # a 300-LED frame takes about 80 ms on the wire at 115200 baud
+        assert worst < 0.02
+        group.close()
+    finally:
+        for l in links:
+            l.ser.close()
+        for dev in devs:
+            dev.close()
+
+def test_legacy_device_never_answers_the_latch():
+    dev = Device(36, latch=False)
+    ser = serial.Serial(dev.port, 115200, timeout=0.05)
+    sender = WindowedSender(ser, 36)
+    try:
+        fid = sender.send(np.zeros((36, 3), dtype=np.uint8))
+        for op, i in ((LATCH_HOLD, 0), (LATCH_SHOW, fid)):
+            assert sender.wait_latch(sender.latch(op, i), 0.3) is None
+        assert sender.wait_frame(fid, time.perf_counter() + 0.5)
+        assert dev.stats()["latches"] == 0 and not dev.stats()["hold"]
+    finally:
+        sender.close()
+        ser.close()
+        dev.close()
+
+def test_mixed_fleet_falls_back_to_no_sync():
+    args = group_args([96, 60, 36], [115200, 2000000, 2000000])
+    st, shows, sent, unsynced = run(args, True, [True, True, False])
+    assert [l.port for l in unsynced] == [st["devices"][2]["port"]]
+    assert not any(d["synced"] for d in st["devices"])
+    assert st["shown"] == 0 and st["partial"] == 0
+    # the released devices show frames as they arrive, like the legacy one
+    check_slices(args, shows, sent)
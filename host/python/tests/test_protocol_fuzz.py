@@ -0,0 +1,216 @@
+"""
+Codec fuzzing: every packet type round-trips through the stream decoder at
+any read size, the decoder agrees with the reference decode_frame() on
+damaged frames, garbage never wedges it, and the sender's reply parser never
+pairs a reply with the wrong frame id when bytes go missing.
+"""
+
+import time
+import numpy as np
+import pytest
+
+from bench import loop_encode, random_telemetry
+from protocol import (WindowedSender, FrameEncoder, StreamDecoder, decode_frame, encode_leds, encode_delta,
+                      encode_status, encode_baud, encode_probe, encode_telemetry, encode_latch, encode_reply,
+                      FT_LEDS, FT_LEDS_ID, FT_DELTA, LATCH_SHOW, LATCH_HOLD, LATCH_RELEASE)
+
+N = 96
+ITERATIONS = 2000
+
+def random_packet(rng, n, shown, shown_id, crc):
+    # one packet of a random type: (bytes, expected colours or None)
+    kind = rng.integers(0, 8)
+    fid = int(rng.integers(0, 256))
+    c = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+    if kind == 0:
+        return encode_leds(fid, c, n, FT_LEDS_ID, crc), c
+    if kind == 1 and shown is not None:
+        c = shown.copy()
+        k = rng.integers(0, n, rng.integers(1, max(2, n // 4)))
+        c[k] = rng.integers(0, 256, (len(k), 3))
+        d = encode_delta(fid, shown_id, c, shown, crc)
+        if d is not None:
+            return d, c
+    if kind == 2:
+        return encode_status("".join(chr(v) for v in rng.integers(32, 127, rng.integers(1, 60)))), None
+    if kind == 3:
+        return encode_baud(int(rng.choice([115200, 921600, 2000000, 1234]))), None
+    if kind == 4:
+        return encode_probe(bytes(rng.integers(0, 0xAA, rng.integers(0, 64)).astype(np.uint8))), None
+    if kind == 5:
+        return encode_telemetry(*random_telemetry(rng)), None
+    if kind == 6:
+        # a show is only valid for the frame the decoder holds
+        if shown is None:
+            return encode_latch(int(rng.choice([LATCH_HOLD, LATCH_RELEASE])), fid), None
+        return encode_latch(int(rng.choice([LATCH_SHOW, LATCH_HOLD, LATCH_RELEASE])), shown_id), None
+    return encode_leds(fid, c, n, FT_LEDS_ID if crc else FT_LEDS, crc), c
+
+def corrupt(rng, pkt, how):
+    b = bytearray(pkt)
+    if how == 'swap':
+        i = int(rng.integers(3, len(b) - 2))
+        b[i], b[i + 1] = b[i + 1], b[i]
+    else:
+        # two bytes changed by opposite amounts: a byte sum cannot see it
+        i, j = rng.choice(np.arange(3, len(b) - 2), 2, replace=False)
+        d = int(rng.integers(1, 256))
+        b[i], b[j] = (b[i] + d) & 0xFF, (b[j] - d) & 0xFF
+    return bytes(b)
+
+@pytest.mark.parametrize("n", [1, 96, 300])
+def test_encoder_matches_reference_loop(n):
+    rng = np.random.default_rng(n)
+    enc = FrameEncoder(n)
+    for i in range(20):
+        c = rng.integers(0, 256, (n, 3), dtype=np.uint8)
+        ref = loop_encode(i, [tuple(int(v) for v in px) for px in c])
+        assert encode_leds(i, c, n) == ref
+        assert bytes(enc.leds(i, c)) == ref
+
+@pytest.mark.parametrize("crc", [False, True])
+def test_round_trip_any_read_size(crc):
+    rng = np.random.default_rng(0)
+    whole, split = StreamDecoder(N, status=True), StreamDecoder(N, status=True)
+    shown = sid = None
+    stream, want = bytearray(), []
+    for _ in range(ITERATIONS):
+        pkt, c = random_packet(rng, N, shown, sid, crc)
+        stream += pkt
+        want.append(c)
+        if c is not None:
+            shown, sid = c, pkt[2]
+    a = whole.feed(stream, now=0.0)
+    b, p = [], 0
+    while p < len(stream):
+        k = int(rng.integers(1, 400))
+        b += split.feed(stream[p:p + k], now=0.0)
+        p += k
+    assert len(a) == len(b) == len(want)
+    for (ft, ok, fid, v), (ft2, ok2, fid2, v2), c in zip(a, b, want):
+        assert ok and (ft, ok, fid) == (ft2, ok2, fid2), f"0x{ft:02X}"
+        if c is None:
+            assert v == v2
+        else:
+            assert np.array_equal(v, v2) and np.array_equal(v, c)
+
+@pytest.mark.parametrize("crc", [False, True])
+@pytest.mark.parametrize("how", ['swap', 'offset'])
+def test_damaged_frames_agree_with_reference(crc, how):
+    rng = np.random.default_rng(1)
+    missed = tried = 0
+    for _ in range(ITERATIONS // 2):
+        dec = StreamDecoder(N)
+        base = rng.integers(0, 256, (N, 3), dtype=np.uint8)
+        dec.feed(encode_leds(7, base, N, FT_LEDS_ID, crc), now=0.0)
+        pkt, c = random_packet(rng, N, base, 7, crc)
+        if c is None:
+            continue
+        bad = corrupt(rng, pkt, how)
+        if bad == pkt:
+            continue
+        ev = dec.feed(bad, now=0.0)
+        if len(ev) != 1 or dec.st != dec.H1 or dec.skipped:
+            continue  # framing changed: the packet never finished or ran long
+        tried += 1
+        try:
+            ref_ok, ref = True, decode_frame(bad, base, 7)[1]
+        except ValueError:
+            ref_ok, ref = False, None
+        assert ev[0][1] == ref_ok
+        if ref_ok:
+            assert np.array_equal(ev[0][3], ref)
+            missed += not np.array_equal(ref, c)
+    assert tried
+    if crc:
+        # what the byte sum lets through, the CRC must not
+        assert missed == 0
+
+def test_garbage_then_frame_after_byte_timeout():
+    rng = np.random.default_rng(2)
+    dec = StreamDecoder(N, status=True)
+    for i in range(ITERATIONS // 2):
+        g = rng.integers(0, 256, rng.integers(1, 600)).astype(np.uint8)
+        # bias towards header bytes so the parser gets deep into packets
+        g[rng.random(len(g)) < 0.05] = 0xAA
+        g[rng.random(len(g)) < 0.05] = rng.choice([0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x5B, 0x5C, 0x5D, 0x5E])
+        dec.feed(g.tobytes(), now=2.0 * i)
+        c = rng.integers(0, 256, (N, 3), dtype=np.uint8)
+        ev = dec.feed(encode_leds(i, c, N, FT_LEDS_ID), now=2.0 * i + 1.0)
+        assert ev and ev[-1][1] and np.array_equal(ev[-1][3], c)
+
+class ReplyPort:
+    # a serial port whose reads return queued device replies
+    def __init__(self):
+        self.chunks = []
+        self.written = []
+        self.timeout = 0.01
+        self.in_waiting = 0
+
+    def write(self, pkt):
+        self.written.append(bytes(pkt))
+        return len(pkt)
+
+    def read(self, n):
+        if self.chunks:
+            return self.chunks.pop(0)
+        time.sleep(0.002)
+        return b""
+
+def settle(port):
+    end = time.perf_counter() + 2.0
+    while port.chunks and time.perf_counter() < end:
+        time.sleep(0.005)
+    time.sleep(0.02)
+
+def test_reply_parser_never_misattributes_ids():
+    rng = np.random.default_rng(3)
+    port = ReplyPort()
+    s = WindowedSender(port, 4, window=256, ack_timeout=60.0, max_bytes=1 << 20)
+    try:
+        for i in range(200):
+            s.send(np.full((4, 3), i, dtype=np.uint8))
+        # ACK even ids, NAK odd ones; ids that look like reply letters or the sync byte on purpose
+        stream = bytearray()
+        for fid in range(200):
+            stream += encode_reply("A" if fid % 2 == 0 else "N", fid)
+        stream = np.frombuffer(bytes(stream), dtype=np.uint8)
+        keep = rng.random(len(stream)) >= 0.03
+        # noise bytes sprinkled in, bare letters included
+        noisy = bytearray()
+        for b, k in zip(stream.tolist(), keep.tolist()):
+            if rng.random() < 0.02:
+                noisy.append(int(rng.choice([0x41, 0x4E, 0x4C, 0xAA, 0x00])))
+            if k:
+                noisy.append(b)
+        got = []
+        reply = s._reply
+        s._reply = lambda ok, fid=None: (got.append((ok, fid)), reply(ok, fid))
+        port.chunks = [bytes(noisy[p:p + 7]) for p in range(0, len(noisy), 7)]
+        settle(port)
+        assert got, "no reply survived"
+        assert all(ok == (fid % 2 == 0) for ok, fid in got)
+        assert s.stats()["resyncs"] > 0
+    finally:
+        s.close()
+
+def test_resync_sends_a_keyframe():
+    port = ReplyPort()
+    s = WindowedSender(port, 8, window=8, ack_timeout=60.0)
+    try:
+        c = np.zeros((8, 3), dtype=np.uint8)
+        s.send(c)
+        port.chunks = [encode_reply("A", 0)]
+        settle(port)
+        c[0] = 255
+        s.send(c)
+        assert port.written[-1][1] == FT_DELTA
+        # a reply with its kind byte lost: the parser has to drop bytes
+        port.chunks = [encode_reply("A", 1)[:1] + encode_reply("A", 1)[2:] + encode_reply("A", 9)]
+        settle(port)
+        c[1] = 255
+        s.send(c)
+        assert s.stats()["resyncs"] == 1
+        assert port.written[-1][1] == FT_LEDS_ID
+    finally:
+        s.close()
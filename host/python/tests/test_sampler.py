@@ -0,0 +1,49 @@
+"""
+Sampling gives the colours of the per-LED reference loop, whichever sampler
+and whichever ingestion path: RGB frames, BGRA views sampled with bgr=True,
+or a FullFrameCapture of a BGRA screen against the old copy/convert/resize.
+"""
+
+import cv2
+import numpy as np
+import pytest
+
+from bench import loop_sample, legacy_grab, split_counts
+from backends import SyntheticScreen
+from capture import FullFrameCapture
+from layout import Layout
+from sampler import PerimeterSampler, SparseSampler
+
+def samplers(counts):
+    return [PerimeterSampler(*counts), SparseSampler(Layout(edges=dict(zip(('top', 'right', 'bottom', 'left'), counts))))]
+
+@pytest.mark.parametrize("n", [4, 96, 300, 1000])
+@pytest.mark.parametrize("res", [(128, 128), (160, 90), (37, 53)])
+def test_samplers_match_reference_loop(n, res):
+    w, h = res
+    img = np.random.default_rng(n).integers(0, 256, (h, w, 3), dtype=np.uint8)
+    counts = split_counts(n)
+    ref = np.array(loop_sample(img, *counts, n), dtype=np.uint8)
+    for s in samplers(counts):
+        assert np.array_equal(s.sample(img), ref), type(s).__name__
+
+@pytest.mark.parametrize("n", [96, 300])
+def test_bgra_view_matches_rgb(n):
+    rng = np.random.default_rng(1)
+    bgra = rng.integers(0, 256, (128, 128, 4), dtype=np.uint8)
+    rgb = cv2.cvtColor(bgra, cv2.COLOR_BGRA2RGB)
+    for s in samplers(split_counts(n)):
+        assert np.array_equal(s.sample(bgra, bgr=True), s.sample(rgb)), type(s).__name__
+
+@pytest.mark.parametrize("size", [(1920, 1080), (1366, 768), (640, 480)])
+def test_full_frame_capture_matches_legacy_path(size):
+    sct = SyntheticScreen(*size)
+    sct.img = np.random.default_rng(2).integers(0, 256, sct.img.shape, dtype=np.uint8)
+    monitor = sct.monitors[1]
+    layout = Layout.load(None)
+    ref = SparseSampler(layout).sample(legacy_grab(sct, monitor))
+    cap = FullFrameCapture(sct, monitor)
+    sampler = SparseSampler(layout)
+    for _ in range(2):
+        # the second grab reuses every buffer, the colours must not change
+        assert np.array_equal(sampler.sample(cap.grab(), bgr=True), ref)
@@ -0,0 +1,117 @@
+"""
+Rolling per-stage timing histograms for the hosts' hot paths.
+- StageTimer.begin() / lap(name): time since the previous lap on this thread,
+  so each pipeline thread times its own stages
+- StageTimer.add(name, seconds): a duration measured elsewhere
+- summary() / format(): p50/p95/p99/max per stage; histogram(): bin counts
+Durations land in log-spaced bins (10 per decade, 10 us to 10 s). Each stage
+keeps two histograms and swaps them every `window` seconds, so reports cover
+the last one to two windows. A disabled timer binds no-op lambdas in place of
+begin/lap/add, so instrumented code pays one call per stage and nothing else.
+"""
+
+import math, threading, time
+
+BINS_PER_DECADE = 10
+MIN_S = 1e-5
+DECADES = 6
+NBINS = BINS_PER_DECADE * DECADES + 2  # plus under- and overflow
+
+def bin_index(s):
+    if s < MIN_S:
+        return 0
+    return min(NBINS - 1, 1 + int(math.log10(s / MIN_S) * BINS_PER_DECADE))
+
+def bin_value(i):
+    # geometric middle of bin i, seconds
+    return MIN_S * 10.0 ** ((i - 0.5) / BINS_PER_DECADE) if i else MIN_S
+
+class StageHistogram:
+    def __init__(self, window):
+        self.window = window
+        self.cur = [0] * NBINS
+        self.prev = [0] * NBINS
+        self.cur_sum = self.prev_sum = 0.0
+        self.cur_max = self.prev_max = 0.0
+        self.swap_at = time.perf_counter() + window
+
+    def add(self, s, now):
+        if now >= self.swap_at:
+            self.prev, self.cur = self.cur, [0] * NBINS
+            self.prev_sum, self.cur_sum = self.cur_sum, 0.0
+            self.prev_max, self.cur_max = self.cur_max, 0.0
+            self.swap_at = now + self.window
+        self.cur[bin_index(s)] += 1
+        self.cur_sum += s
+        if s > self.cur_max:
+            self.cur_max = s
+
+    def counts(self):
+        return [a + b for a, b in zip(self.cur, self.prev)]
+
+    def percentile(self, q, counts=None):
+        counts = counts or self.counts()
+        n = sum(counts)
+        if not n:
+            return 0.0
+        k = q / 100.0 * n
+        acc = 0
+        for i, c in enumerate(counts):
+            acc += c
+            if acc >= k:
+                return bin_value(i)
+        return bin_value(NBINS - 1)
+
+    def summary(self):
+        counts = self.counts()
+        n = sum(counts)
+        return {"n": n, "mean_ms": (self.cur_sum + self.prev_sum) / n * 1000.0 if n else 0.0,
+                "p50_ms": self.percentile(50, counts) * 1000.0, "p95_ms": self.percentile(95, counts) * 1000.0,
+                "p99_ms": self.percentile(99, counts) * 1000.0, "max_ms": max(self.cur_max, self.prev_max) * 1000.0}
+
+def _noop(*a):
+    return None
+
+class StageTimer:
+    def __init__(self, enabled=True, window=5.0):
+        self.enabled = enabled
+        self.window = window
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if not enabled:
+            self.begin = self.lap = self.add = _noop
+
+    def begin(self):
+        self._local.t = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        t = getattr(self._local, "t", now)
+        self._local.t = now
+        self._hist(name).add(now - t, now)
+
+    def add(self, name, seconds):
+        self._hist(name).add(seconds, time.perf_counter())
+
+    def _hist(self, name):
+        h = self.stages.get(name)
+        if h is None:
+            with self._lock:
+                h = self.stages.setdefault(name, StageHistogram(self.window))
+        return h
+
+    def summary(self):
+        return {name: h.summary() for name, h in list(self.stages.items())}
+
+    def histogram(self, name):
+        # (bin counts, bin lower edges in seconds) over the last one to two windows
+        h = self.stages.get(name)
+        counts = h.counts() if h else [0] * NBINS
+        return counts, [0.0] + [MIN_S * 10.0 ** (i / BINS_PER_DECADE) for i in range(NBINS - 1)]
+
+    def format(self, names=None):
+        # one line, "stage p50/p99 ms" per stage
+        st = self.summary()
+        names = names or list(st)
+        return "  ".join(f"{k} {st[k]['p50_ms']:.2f}/{st[k]['p99_ms']:.2f}" for k in names if k in st and st[k]["n"])
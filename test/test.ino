@@ -2,25 +2,57 @@
 #include <Wire.h>
 #include <Adafruit_GFX.h>
 #include <Adafruit_SSD1306.h>
+#include <time.h>
 
 #define NUM_LEDS 96
 #define DATA_PIN 5
 #define LED_BRIGHTNESS 255
+#define DEFAULT_BAUD 115200
+#define RX_BUFFER 2048  // room for the host's frames in flight while FastLED.show() runs
 
 CRGB leds[NUM_LEDS];
 uint8_t payload[NUM_LEDS * 3];
+uint8_t shown[NUM_LEDS * 3];  // last applied frame, the base for 0x58 deltas
 
-enum State { H1, H2, FRAME, PAYLOAD, CHKS };
-enum FrameType { FT_NONE, FT_LEDS, FT_STATUS };
+enum State { H1, H2, FRAME, PAYLOAD, CHKS, CHK2, DBASE, DCOUNT, DRANGE, DDATA, BAUD, PDATA, TELEM, LATCH };
+enum FrameType { FT_NONE, FT_LEDS, FT_STATUS, FT_DELTA, FT_BAUD, FT_PROBE, FT_TELEMETRY, FT_LATCH };
 
 State st = H1;
 FrameType curFrameType = FT_NONE;
 
 uint8_t frame_id = 0;
 uint8_t rx_frame_id = 0;
+bool ack_with_id = false;  // 0x57/0x58 frames: framed 'A'/'N' reply with the frame id
+bool crc_mode = false;     // 0x5B/0x5C: 0x57/0x58 with a CRC-16 trailer instead of the byte sum
+uint16_t crc = 0;
+uint8_t crc_lo = 0;
 int payload_index = 0;
 
+bool have_base = false;
+uint8_t base_id = 0;
+// 0x5E latch: while holding, accepted frames wait in `shown` for a show
+const uint8_t LATCH_SHOW = 0, LATCH_HOLD = 1, LATCH_RELEASE = 2;
+bool hold = false;
+bool staged = false;  // accepted but not shown yet
+bool delta_ok = false;
+uint8_t dsum = 0;
+uint8_t ranges_left = 0;
+uint8_t range_hdr[3];
+int range_hdr_idx = 0;
+int range_bytes_left = 0;
+
+// link speed: 0x59 switches rate, 0x5A probes verify it
+const uint32_t BAUD_RATES[] = {115200, 230400, 460800, 921600, 1000000, 1500000, 2000000};
+const unsigned long LINK_TRIAL_MS = 1000;  // revert unless a probe arrives at the new rate
+const unsigned long LINK_IDLE_MS = 5000;   // revert after this long without a valid packet
+uint32_t link_baud = DEFAULT_BAUD;
+bool link_trial = false;
+unsigned long link_changed = 0;
+unsigned long last_valid = 0;
+uint8_t probe_len = 0;
+
 char statusBuf[241];
+const int TELEMETRY_LEN = 12;  // 0x5D: time u32, cpu, ram, gpu0, gpu1 (255: n/a), down, up u16 in 10 kB/s
 int rx_status_len = 0;
 
 unsigned long last_byte_time = 0;
@@ -42,62 +74,46 @@ void drawBar(int x, int y, int w, int h, uint8_t pct) {
   if (fw > 0) display.fillRect(x + 1, y + 1, fw, h - 2, SSD1306_WHITE);
 }
 
-void updateOLEDFromCSV(const char *s) {
+void printPct(int pct) {
+  if (pct < 0) display.print("--");
+  else display.print(pct);
+  display.print("%");
+}
+
+// gpu0/gpu1 < 0: not available; network rates in Mb/s
+void drawStatus(const char *dt, int cpu, int ram, int gpu0, int gpu1, float dl_mbps, float ul_mbps) {
   if (!oled_ok) return;
-  char buf[241];
-  strncpy(buf, s, 240);
-  buf[240] = 0;
-  char *save;
-  char *t = strtok_r(buf, ",", &save);
-  const char *dt = t ? t : "";
-  t = strtok_r(NULL, ",", &save);
-  int cpu = t ? atoi(t) : 0;
-  t = strtok_r(NULL, ",", &save);
-  int ram = t ? atoi(t) : 0;
-  t = strtok_r(NULL, ",", &save);
-  int gpu0 = t ? atoi(t) : 0;
-  t = strtok_r(NULL, ",", &save);
-  int gpu1 = t ? atoi(t) : 0;
-  t = strtok_r(NULL, ",", &save);
-  int dl = t ? atoi(t) : 0;
-  t = strtok_r(NULL, ",", &save);
-  int ul = t ? atoi(t) : 0;
-  
   display.clearDisplay();
   
   // Row 0: CPU with bar
   display.setCursor(0, 0);
   display.print("CPU ");
-  display.print(cpu);
-  display.print("%");
+  printPct(cpu);
   drawBar(50, 0, 78, 10, (uint8_t)constrain(cpu, 0, 100));
   
   // Row 1: RAM with bar  
   display.setCursor(0, 12);
   display.print("RAM ");
-  display.print(ram);
-  display.print("%");
+  printPct(ram);
   drawBar(50, 12, 78, 10, (uint8_t)constrain(ram, 0, 100));
   
   // Row 2: GPU0 and GPU1 with bars
   display.setCursor(0, 24);
   display.print("G0 ");
-  display.print(gpu0);
-  display.print("%");
+  printPct(gpu0);
   drawBar(30, 24, 30, 10, (uint8_t)constrain(gpu0, 0, 100));
   
   display.setCursor(64, 24);
   display.print("G1 ");
-  display.print(gpu1);
-  display.print("%");
+  printPct(gpu1);
   drawBar(94, 24, 34, 10, (uint8_t)constrain(gpu1, 0, 100));
   
   // Row 3: Network
   display.setCursor(0, 36);
   display.print("D ");
-  display.print(dl*8);
+  display.print(dl_mbps, 1);
   display.print("Mb/s U ");
-  display.print(ul*8);
+  display.print(ul_mbps, 1);
   display.print("Mb/s");
   
   // Row 4 (Last): Date/time
@@ -107,8 +123,47 @@ void updateOLEDFromCSV(const char *s) {
   display.display();
 }
 
+void updateOLEDFromCSV(const char *s) {
+  if (!oled_ok) return;
+  char buf[241];
+  strncpy(buf, s, 240);
+  buf[240] = 0;
+  char *save;
+  char *t = strtok_r(buf, ",", &save);
+  const char *dt = t ? t : "";
+  t = strtok_r(NULL, ",", &save);
+  int cpu = t ? atoi(t) : 0;
+  t = strtok_r(NULL, ",", &save);
+  int ram = t ? atoi(t) : 0;
+  t = strtok_r(NULL, ",", &save);
+  int gpu0 = t ? atoi(t) : 0;
+  t = strtok_r(NULL, ",", &save);
+  int gpu1 = t ? atoi(t) : 0;
+  t = strtok_r(NULL, ",", &save);
+  float dl = t ? atof(t) : 0;
+  t = strtok_r(NULL, ",", &save);
+  float ul = t ? atof(t) : 0;
+  drawStatus(dt, cpu, ram, gpu0, gpu1, dl * 8, ul * 8);
+}
+
+// 0x5D: fixed little-endian fields, no text parsing
+void updateOLEDFromTelemetry(const uint8_t *p) {
+  if (!oled_ok) return;
+  time_t clock = (time_t)((uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24));
+  struct tm tm;
+  char dt[20];
+  gmtime_r(&clock, &tm);  // the host folds its UTC offset into the clock
+  strftime(dt, sizeof(dt), "%Y-%m-%d %H:%M:%S", &tm);
+  int pct[4];
+  for (int i = 0; i < 4; ++i) pct[i] = p[4 + i] == 255 ? -1 : p[4 + i];
+  uint16_t dl = p[8] | (p[9] << 8), ul = p[10] | (p[11] << 8);
+  // 10 kB/s units -> Mb/s
+  drawStatus(dt, pct[0], pct[1], pct[2], pct[3], dl * 0.08f, ul * 0.08f);
+}
+
 void setup() {
-  Serial.begin(115200);
+  Serial.setRxBufferSize(RX_BUFFER);  // before begin(); the default 256 bytes overflow during a show
+  Serial.begin(DEFAULT_BAUD);
   FastLED.addLeds<WS2812B, DATA_PIN, GRB>(leds, NUM_LEDS);
   FastLED.setBrightness(LED_BRIGHTNESS);
   FastLED.show();
@@ -123,6 +178,68 @@ void setup() {
   display.display();
 }
 
+// CRC-16/CCITT-FALSE, one byte at a time
+uint16_t crc16(uint16_t c, uint8_t b) {
+  c ^= (uint16_t)b << 8;
+  for (int i = 0; i < 8; ++i) c = (c & 0x8000) ? (c << 1) ^ 0x1021 : c << 1;
+  return c;
+}
+
+void setBaud(uint32_t rate) {
+  Serial.flush();
+  Serial.updateBaudRate(rate);
+  link_baud = rate;
+  link_changed = millis();
+  last_valid = link_changed;
+}
+
+bool baudSupported(uint32_t rate) {
+  for (unsigned i = 0; i < sizeof(BAUD_RATES) / sizeof(BAUD_RATES[0]); ++i)
+    if (BAUD_RATES[i] == rate) return true;
+  return false;
+}
+
+// replies that carry an id go out framed as AA kind id chk (chk = kind + id),
+// so a host that lost a byte finds the next reply instead of misreading ids
+void reply(uint8_t kind, uint8_t id) {
+  uint8_t r[4] = {0xAA, kind, id, (uint8_t)(kind + id)};
+  Serial.write(r, 4);
+}
+
+void showFrame() {
+  for (int i = 0; i < NUM_LEDS; ++i) {
+    int j = i * 3;
+    leds[i] = CRGB(shown[j], shown[j + 1], shown[j + 2]);
+  }
+  staged = false;
+  FastLED.show();
+}
+
+void applyPayload() {
+  memcpy(shown, payload, sizeof(shown));
+  base_id = rx_frame_id;
+  have_base = true;
+  staged = true;
+  if (!hold) showFrame();
+}
+
+bool applyLatch(uint8_t op, uint8_t id) {
+  // a show needs the frame it names to be the last accepted one
+  if (op > LATCH_RELEASE || (op == LATCH_SHOW && !(have_base && base_id == id))) return false;
+  if (op == LATCH_HOLD) {
+    hold = true;
+  } else {
+    if (op == LATCH_RELEASE) hold = false;
+    if (staged || op == LATCH_SHOW) showFrame();
+  }
+  return true;
+}
+
+void nextRange() {
+  if (--ranges_left == 0) st = CHKS;
+  else { range_hdr_idx = 0; st = DRANGE; }
+}
+
 void loop() {
   while (Serial.available()) {
     int b = Serial.read();
@@ -132,53 +249,159 @@ void loop() {
     if (st == H1) {
       if (ub == 0xAA) st = H2;
     } else if (st == H2) {
-      if (ub == 0x55) { curFrameType = FT_LEDS; st = FRAME; }
+      crc_mode = (ub == 0x5B || ub == 0x5C);
+      if (ub == 0x55 || ub == 0x57 || ub == 0x5B) { curFrameType = FT_LEDS; ack_with_id = (ub != 0x55); st = FRAME; }
+      else if (ub == 0x58 || ub == 0x5C) { curFrameType = FT_DELTA; ack_with_id = true; st = FRAME; }
       else if (ub == 0x56) { curFrameType = FT_STATUS; st = FRAME; }
+      else if (ub == 0x59) { curFrameType = FT_BAUD; dsum = ub; payload_index = 0; st = BAUD; }
+      else if (ub == 0x5A) { curFrameType = FT_PROBE; dsum = ub; st = FRAME; }
+      else if (ub == 0x5D) { curFrameType = FT_TELEMETRY; dsum = ub; payload_index = 0; st = TELEM; }
+      else if (ub == 0x5E) { curFrameType = FT_LATCH; dsum = ub; payload_index = 0; st = LATCH; }
       else { st = H1; curFrameType = FT_NONE; }
     } else if (st == FRAME) {
+      if (crc_mode) crc = crc16(0xFFFF, ub);
       if (curFrameType == FT_LEDS) {
         rx_frame_id = ub;
         payload_index = 0;
         st = PAYLOAD;
+      } else if (curFrameType == FT_DELTA) {
+        rx_frame_id = ub;
+        dsum = ub;
+        st = DBASE;
       } else if (curFrameType == FT_STATUS) {
         rx_status_len = ub;
         if (rx_status_len <= 0 || rx_status_len > 240) { st = H1; curFrameType = FT_NONE; }
         else { payload_index = 0; st = PAYLOAD; }
+      } else if (curFrameType == FT_PROBE) {
+        probe_len = ub;
+        payload_index = 0;
+        st = probe_len ? PDATA : CHKS;
       } else {
         st = H1;
       }
     } else if (st == PAYLOAD) {
       if (curFrameType == FT_LEDS) {
+        if (crc_mode) crc = crc16(crc, ub);
         payload[payload_index++] = ub;
         if (payload_index >= NUM_LEDS * 3) st = CHKS;
       } else if (curFrameType == FT_STATUS) {
         statusBuf[payload_index++] = (char)ub;
         if (payload_index >= rx_status_len) { statusBuf[payload_index] = 0; st = CHKS; }
       } else st = H1;
-    } else if (st == CHKS) {
+    } else if (st == DBASE) {
+      // a delta only applies on top of the frame it was encoded against
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      delta_ok = have_base && ub == base_id;
+      memcpy(payload, shown, sizeof(payload));
+      st = DCOUNT;
+    } else if (st == DCOUNT) {
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      ranges_left = ub;
+      range_hdr_idx = 0;
+      st = ranges_left ? DRANGE : CHKS;
+    } else if (st == DRANGE) {
+      // range header: start (u16 little-endian), LED count
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      range_hdr[range_hdr_idx++] = ub;
+      if (range_hdr_idx == 3) {
+        payload_index = (range_hdr[0] | (range_hdr[1] << 8)) * 3;
+        range_bytes_left = range_hdr[2] * 3;
+        if (range_bytes_left) st = DDATA;
+        else nextRange();
+      }
+    } else if (st == DDATA) {
+      dsum += ub;
+      if (crc_mode) crc = crc16(crc, ub);
+      if (payload_index < NUM_LEDS * 3) payload[payload_index] = ub;
+      else delta_ok = false;
+      payload_index++;
+      if (--range_bytes_left == 0) nextRange();
+    } else if (st == BAUD) {
+      // requested rate, u32 little-endian
+      dsum += ub;
+      payload[payload_index++] = ub;
+      if (payload_index == 4) st = CHKS;
+    } else if (st == TELEM) {
+      dsum += ub;
+      payload[payload_index++] = ub;
+      if (payload_index == TELEMETRY_LEN) st = CHKS;
+    } else if (st == LATCH) {
+      // op, frame id
+      dsum += ub;
+      payload[payload_index++] = ub;
+      if (payload_index == 2) st = CHKS;
+    } else if (st == PDATA) {
+      dsum += ub;
+      if (++payload_index >= probe_len) st = CHKS;
+    } else if (st == CHKS && crc_mode) {
+      // CRC-16 trailer, low byte first
+      crc_lo = ub;
+      st = CHK2;
+    } else if (st == CHKS || st == CHK2) {
       uint8_t chk = ub;
-      if (curFrameType == FT_LEDS) {
-        uint16_t s = rx_frame_id;
-        for (int i = 0; i < NUM_LEDS * 3; ++i) s += payload[i];
-        if (((uint8_t)s) == chk) {
-          for (int i = 0; i < NUM_LEDS; ++i) {
-            int j = i * 3;
-            leds[i] = CRGB(payload[j], payload[j + 1], payload[j + 2]);
-          }
-          FastLED.show();
-          Serial.write('A');
+      if (curFrameType == FT_LEDS || curFrameType == FT_DELTA) {
+        bool ok;
+        if (crc_mode) {
+          ok = crc == (uint16_t)(crc_lo | (chk << 8));
+          if (curFrameType == FT_DELTA) ok = ok && delta_ok;
+        } else if (curFrameType == FT_DELTA) {
+          ok = delta_ok && dsum == chk;
         } else {
-          Serial.write('N');
+          uint16_t s = rx_frame_id;
+          for (int i = 0; i < NUM_LEDS * 3; ++i) s += payload[i];
+          ok = ((uint8_t)s) == chk;
+        }
+        if (ok) {
+          applyPayload();
+          last_valid = millis();
         }
+        if (ack_with_id) reply(ok ? 'A' : 'N', rx_frame_id);
+        else Serial.write(ok ? 'A' : 'N');
       } else if (curFrameType == FT_STATUS) {
         uint16_t s = 0x56;
         for (int i = 0; i < rx_status_len; ++i) s += (uint8_t)statusBuf[i];
         if (((uint8_t)s) == chk) {
           updateOLEDFromCSV(statusBuf);
+          last_valid = millis();
+          Serial.write('s');
+        } else {
+          Serial.write('n');
+        }
+      } else if (curFrameType == FT_TELEMETRY) {
+        if (dsum == chk) {
+          updateOLEDFromTelemetry(payload);
+          last_valid = millis();
           Serial.write('s');
         } else {
           Serial.write('n');
         }
+      } else if (curFrameType == FT_BAUD) {
+        uint32_t rate = payload[0] | ((uint32_t)payload[1] << 8) | ((uint32_t)payload[2] << 16) | ((uint32_t)payload[3] << 24);
+        if (dsum == chk && baudSupported(rate)) {
+          Serial.write('B');
+          setBaud(rate);
+          link_trial = rate != DEFAULT_BAUD;
+        } else {
+          Serial.write('b');
+        }
+      } else if (curFrameType == FT_LATCH) {
+        if (dsum == chk && applyLatch(payload[0], payload[1])) {
+          last_valid = millis();
+          reply('L', payload[1]);
+        } else {
+          reply('l', payload[1]);
+        }
+      } else if (curFrameType == FT_PROBE) {
+        if (dsum == chk) {
+          link_trial = false;
+          last_valid = millis();
+          Serial.write('P');
+        } else {
+          Serial.write('p');
+        }
       }
       st = H1;
       curFrameType = FT_NONE;
@@ -188,4 +411,17 @@ void loop() {
     st = H1;
     curFrameType = FT_NONE;
   }
+  // a host that went away must not leave the strip frozen
+  if (hold && millis() - last_valid > LINK_IDLE_MS) {
+    hold = false;
+    if (staged) showFrame();
+  }
+  // an unconfirmed or silent fast link drops back to the default rate
+  if (link_baud != DEFAULT_BAUD) {
+    unsigned long now = millis();
+    if ((link_trial && now - link_changed > LINK_TRIAL_MS) || now - last_valid > LINK_IDLE_MS) {
+      setBaud(DEFAULT_BAUD);
+      link_trial = false;
+    }
+  }
 }